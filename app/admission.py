@@ -0,0 +1,334 @@
+"""
+Admission control dla endpointów, które wołają LLM.
+
+1. Kubełek tokenów per uczeń (klucz = `id` z JWT) – za szybko → 429.
+2. Globalny limit równoległych wywołań upstream z krótką kolejką
+   oczekujących – pełna kolejka albo za długie czekanie → 429.
+
+Domyślnie stan jest w pamięci procesu. Po ustawieniu RATE_LIMIT_DB_PATH
+kubełki i sloty trzymamy w pliku SQLite, więc kilka workerów widzi te
+same limity.
+"""
+import asyncio
+import math
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Awaitable, Callable, Dict, Optional, Tuple, TypeVar
+
+import jwt
+from fastapi import Depends, HTTPException, Request
+from fastapi.concurrency import run_in_threadpool
+
+from app.auth import ALGORITHM, get_current_user
+from app.config import (
+    SECRET_KEY,
+    RATE_LIMIT_PER_MINUTE,
+    RATE_LIMIT_BURST,
+    LLM_MAX_CONCURRENCY,
+    LLM_QUEUE_SIZE,
+    LLM_QUEUE_TIMEOUT,
+    LLM_READ_TIMEOUT,
+    RATE_LIMIT_DB_PATH,
+)
+from app.principals import Principal
+
+T = TypeVar("T")
+
+SLOT_POLL_INTERVAL = 0.05
+# Slot osieroconego workera (crash) wygasa sam po tym czasie. Między
+# kolejnymi chunkami streamu mija najwyżej LLM_READ_TIMEOUT, a stream
+# odnawia dzierżawę co SLOT_RENEW_SECONDS – żywy slot nie wygaśnie.
+SLOT_LEASE_SECONDS = LLM_READ_TIMEOUT + 30
+SLOT_RENEW_SECONDS = 15
+# Co tyle sekund usuwamy kubełki, które zdążyły się w pełni napełnić
+# (pełny kubełek = brak wpisu), żeby nie rosły z liczbą uczniów i IP
+BUCKET_SWEEP_SECONDS = 60
+
+
+def too_many_requests(detail: str, retry_after: float) -> HTTPException:
+    return HTTPException(
+        status_code=429,
+        detail=detail,
+        headers={"Retry-After": str(max(1, math.ceil(retry_after)))},
+    )
+
+
+# ---------------------------------------------------------
+# 🔹 Backend w pamięci procesu
+# ---------------------------------------------------------
+class MemoryBackend:
+    shared = False
+
+    def __init__(self):
+        self._buckets: Dict[str, Tuple[float, float]] = {}
+        self._lock = threading.Lock()
+        self._slots = 0
+        self._swept = time.monotonic()
+
+    def _sweep(self, now: float, capacity: float, rate: float) -> None:
+        # wołane pod self._lock; po capacity / rate sekundach bezczynności kubełek jest pełny
+        self._swept = now
+        idle_before = now - capacity / rate
+        for key in [k for k, (_, updated) in self._buckets.items() if updated < idle_before]:
+            del self._buckets[key]
+
+    def take(self, key: str, capacity: float, rate: float) -> float:
+        """Zabiera 1 token; zwraca 0 albo liczbę sekund do następnego tokenu."""
+        now = time.monotonic()
+        with self._lock:
+            if now - self._swept >= BUCKET_SWEEP_SECONDS:
+                self._sweep(now, capacity, rate)
+            tokens, updated = self._buckets.get(key, (capacity, now))
+            tokens = min(capacity, tokens + (now - updated) * rate)
+            if tokens >= 1:
+                self._buckets[key] = (tokens - 1, now)
+                return 0.0
+            self._buckets[key] = (tokens, now)
+            return (1 - tokens) / rate
+
+    def try_acquire_slot(self, limit: int) -> Optional[str]:
+        with self._lock:
+            if self._slots >= limit:
+                return None
+            self._slots += 1
+            return "local"
+
+    def renew_slot(self, slot: str) -> None:
+        pass   # sloty w pamięci nie wygasają
+
+    def release_slot(self, slot: str) -> None:
+        with self._lock:
+            self._slots -= 1
+
+    def in_flight(self) -> int:
+        return self._slots
+
+
+# ---------------------------------------------------------
+# 🔹 Backend SQLite (wspólny dla wielu workerów)
+# ---------------------------------------------------------
+class SQLiteBackend:
+    shared = True
+
+    def __init__(self, path: str):
+        self._conn = sqlite3.connect(
+            path, timeout=5, isolation_level=None, check_same_thread=False
+        )
+        self._lock = threading.Lock()
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS rate_buckets ("
+            " key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS ix_rate_buckets_updated ON rate_buckets (updated)"
+        )
+        self._swept = time.time()
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS llm_slots ("
+            " id TEXT PRIMARY KEY, expires REAL NOT NULL)"
+        )
+
+    def _immediate(self, fn):
+        # BEGIN IMMEDIATE = blokada zapisu od razu, więc odczyt+zapis jest atomowy
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                result = fn(self._conn)
+                self._conn.execute("COMMIT")
+                return result
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def take(self, key: str, capacity: float, rate: float) -> float:
+        def _take(conn):
+            now = time.time()
+            row = conn.execute(
+                "SELECT tokens, updated FROM rate_buckets WHERE key = ?", (key,)
+            ).fetchone()
+            tokens, updated = row if row else (capacity, now)
+            tokens = min(capacity, tokens + (now - updated) * rate)
+            wait = 0.0
+            if tokens >= 1:
+                tokens -= 1
+            else:
+                wait = (1 - tokens) / rate
+            conn.execute(
+                "INSERT OR REPLACE INTO rate_buckets (key, tokens, updated) VALUES (?, ?, ?)",
+                (key, tokens, now),
+            )
+            if now - self._swept >= BUCKET_SWEEP_SECONDS:
+                # każdy worker co BUCKET_SWEEP_SECONDS, w tej samej transakcji
+                self._swept = now
+                conn.execute("DELETE FROM rate_buckets WHERE updated < ?", (now - capacity / rate,))
+            return wait
+
+        return self._immediate(_take)
+
+    def try_acquire_slot(self, limit: int) -> Optional[str]:
+        def _acquire(conn):
+            now = time.time()
+            conn.execute("DELETE FROM llm_slots WHERE expires < ?", (now,))
+            (used,) = conn.execute("SELECT COUNT(*) FROM llm_slots").fetchone()
+            if used >= limit:
+                return None
+            slot = uuid.uuid4().hex
+            conn.execute(
+                "INSERT INTO llm_slots (id, expires) VALUES (?, ?)",
+                (slot, now + SLOT_LEASE_SECONDS),
+            )
+            return slot
+
+        return self._immediate(_acquire)
+
+    def renew_slot(self, slot: str) -> None:
+        self._immediate(lambda conn: conn.execute(
+            "UPDATE llm_slots SET expires = ? WHERE id = ?", (time.time() + SLOT_LEASE_SECONDS, slot)
+        ))
+
+    def release_slot(self, slot: str) -> None:
+        self._immediate(lambda conn: conn.execute("DELETE FROM llm_slots WHERE id = ?", (slot,)))
+
+    def in_flight(self) -> int:
+        with self._lock:
+            (used,) = self._conn.execute(
+                "SELECT COUNT(*) FROM llm_slots WHERE expires >= ?", (time.time(),)
+            ).fetchone()
+        return used
+
+
+# ---------------------------------------------------------
+# 🔹 Kontroler
+# ---------------------------------------------------------
+class AdmissionController:
+    def __init__(self, backend, capacity: float, per_minute: float,
+                 max_concurrency: int, queue_size: int, queue_timeout: float):
+        self.backend = backend
+        self.capacity = capacity
+        self.rate = per_minute / 60.0
+        self.max_concurrency = max_concurrency
+        self.queue_size = queue_size
+        self.queue_timeout = queue_timeout
+
+        self._waiting = 0
+        self._released: Optional[asyncio.Event] = None
+
+        self.admitted = 0
+        self.rate_limited = 0
+        self.queue_rejected = 0
+
+    async def _backend_call(self, fn, *args):
+        # SQLite blokuje – nie na event loopie
+        if self.backend.shared:
+            return await run_in_threadpool(fn, *args)
+        return fn(*args)
+
+    async def check_rate(self, key: str) -> None:
+        wait = await self._backend_call(self.backend.take, key, self.capacity, self.rate)
+        if wait > 0:
+            self.rate_limited += 1
+            raise too_many_requests("Za dużo pytań naraz – zwolnij trochę 🙂", wait)
+
+    async def acquire_slot(self) -> str:
+        slot = await self._backend_call(self.backend.try_acquire_slot, self.max_concurrency)
+        if slot is not None:
+            self.admitted += 1
+            return slot
+
+        if self._waiting >= self.queue_size:
+            self.queue_rejected += 1
+            raise too_many_requests("Serwer jest przeciążony, spróbuj za chwilę.", 1)
+
+        if self._released is None:
+            self._released = asyncio.Event()
+
+        self._waiting += 1
+        deadline = time.monotonic() + self.queue_timeout
+        try:
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self.queue_rejected += 1
+                    raise too_many_requests("Serwer jest przeciążony, spróbuj za chwilę.", 1)
+
+                # Lokalne zwolnienie budzi od razu; sloty innych workerów – polling
+                self._released.clear()
+                try:
+                    await asyncio.wait_for(
+                        self._released.wait(), min(remaining, SLOT_POLL_INTERVAL)
+                    )
+                except asyncio.TimeoutError:
+                    pass
+
+                slot = await self._backend_call(self.backend.try_acquire_slot, self.max_concurrency)
+                if slot is not None:
+                    self.admitted += 1
+                    return slot
+        finally:
+            self._waiting -= 1
+
+    async def renew_slot(self, slot: str) -> None:
+        """Przedłuża dzierżawę slotu trzymanego dłużej niż jedno wywołanie (stream)."""
+        await self._backend_call(self.backend.renew_slot, slot)
+
+    async def release_slot(self, slot: str) -> None:
+        await self._backend_call(self.backend.release_slot, slot)
+        if self._released is not None:
+            self._released.set()
+
+    async def call(self, fn: Callable[[], Awaitable[T]]) -> T:
+        """Wykonuje wywołanie upstream w ramach globalnego limitu równoległości."""
+        slot = await self.acquire_slot()
+        try:
+            return await fn()
+        finally:
+            await self.release_slot(slot)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "in_flight": self.backend.in_flight(),
+            "waiting": self._waiting,
+            "admitted": self.admitted,
+            "rate_limited": self.rate_limited,
+            "queue_rejected": self.queue_rejected,
+            "shared_state": self.backend.shared,
+        }
+
+
+admission = AdmissionController(
+    backend=SQLiteBackend(RATE_LIMIT_DB_PATH) if RATE_LIMIT_DB_PATH else MemoryBackend(),
+    capacity=RATE_LIMIT_BURST,
+    per_minute=RATE_LIMIT_PER_MINUTE,
+    max_concurrency=LLM_MAX_CONCURRENCY,
+    queue_size=LLM_QUEUE_SIZE,
+    queue_timeout=LLM_QUEUE_TIMEOUT,
+)
+
+
+# ---------------------------------------------------------
+# 🔹 Zależności FastAPI
+# ---------------------------------------------------------
+async def rate_limited_user(user: Principal = Depends(get_current_user)) -> Principal:
+    """get_current_user + kubełek tokenów ucznia."""
+    await admission.check_rate(f"student:{user.id}")
+    return user
+
+
+async def rate_limited_client(request: Request) -> None:
+    """Dla endpointów bez logowania: klucz z JWT, jeśli jest, inaczej IP."""
+    key = f"ip:{request.client.host if request.client else 'unknown'}"
+
+    authorization = request.headers.get("authorization")
+    if authorization:
+        try:
+            scheme, token = authorization.split()
+            if scheme.lower() == "bearer":
+                payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+                key = f"student:{payload['id']}"
+        except Exception:
+            pass
+
+    await admission.check_rate(key)
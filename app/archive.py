@@ -0,0 +1,207 @@
+"""
+Archiwizacja starych wiadomości czatu.
+
+`chat()` czyta tylko niestreszczony ogon rozmowy, więc wiadomości ujęte już
+w `Conversation.summary` i starsze niż ARCHIVE_AFTER_DAYS nie są potrzebne
+na gorącej ścieżce. Job pakuje je per rozmowa w skompresowane bloby
+(`ChatArchive`), usuwa z `chat_messages`, a historia ucznia (app/history.py)
+dokleja je z powrotem.
+
+    python -m app.archive --days 90
+"""
+import argparse
+import asyncio
+import json
+import time
+import zlib
+from datetime import datetime, timedelta
+from typing import List, NamedTuple, Optional, Tuple
+
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import delete, func, select, text
+from sqlalchemy.orm import Session
+
+from app.config import ARCHIVE_AFTER_DAYS, ARCHIVE_BATCH_SIZE
+from app.db import IS_SQLITE, SessionLocal
+from app.models import ChatArchive, ChatMessage, Conversation
+
+CODEC = "zlib"
+COMPRESSION_LEVEL = 9
+
+
+class ArchiveReport(NamedTuple):
+    conversations: int
+    messages: int
+    raw_bytes: int          # treść przeniesiona z chat_messages (JSON przed kompresją)
+    compressed_bytes: int   # to samo w blobach
+    reclaimed_bytes: int    # raw - compressed
+    free_pages_bytes: Optional[int]   # SQLite: strony do ponownego użycia (bez VACUUM)
+    hot_rows: int
+    hot_bytes: Optional[int]
+    seconds: float
+
+
+last_report: Optional[ArchiveReport] = None
+
+
+# ---------------------------------------------------------
+# 🔹 Format bloba
+# ---------------------------------------------------------
+def _pack(messages: List[ChatMessage]) -> Tuple[bytes, int]:
+    raw = json.dumps(
+        [
+            {
+                "id": m.id,
+                "role": m.role,
+                "content": m.content,
+                "created_at": m.created_at.isoformat() if m.created_at else None,
+            }
+            for m in messages
+        ],
+        ensure_ascii=False,
+        separators=(",", ":"),
+    ).encode("utf-8")
+    return zlib.compress(raw, COMPRESSION_LEVEL), len(raw)
+
+
+def unpack(archive: ChatArchive) -> List[dict]:
+    if archive.codec != CODEC:
+        raise ValueError(f"Nieznany kodek archiwum: {archive.codec}")
+    messages = json.loads(zlib.decompress(archive.payload))
+    for m in messages:
+        m["created_at"] = datetime.fromisoformat(m["created_at"]) if m["created_at"] else None
+    return messages
+
+
+# ---------------------------------------------------------
+# 🔹 Job
+# ---------------------------------------------------------
+def _archive_batch(db: Session, conversation_id: int, student_id: int, upto_id: int,
+                   cutoff: datetime, batch_size: int) -> Tuple[int, int, int]:
+    rows = db.execute(
+        select(ChatMessage)
+        .where(
+            ChatMessage.student_id == student_id,
+            ChatMessage.id <= upto_id,
+            ChatMessage.created_at < cutoff,
+        )
+        .order_by(ChatMessage.created_at.asc(), ChatMessage.id.asc())
+        .limit(batch_size)
+    ).scalars().all()
+    if not rows:
+        return 0, 0, 0
+
+    payload, raw_bytes = _pack(rows)
+    db.add(ChatArchive(
+        student_id=student_id,
+        conversation_id=conversation_id,
+        first_message_id=min(m.id for m in rows),
+        last_message_id=max(m.id for m in rows),
+        first_created_at=rows[0].created_at,
+        last_created_at=rows[-1].created_at,
+        message_count=len(rows),
+        codec=CODEC,
+        raw_bytes=raw_bytes,
+        payload=payload,
+    ))
+    db.execute(delete(ChatMessage).where(ChatMessage.id.in_([m.id for m in rows])))
+    db.commit()
+    return len(rows), raw_bytes, len(payload)
+
+
+def _hot_table_size(db: Session) -> Tuple[int, Optional[int]]:
+    rows = db.execute(select(func.count(ChatMessage.id))).scalar_one()
+    try:
+        if IS_SQLITE:
+            # dbstat = faktyczne strony tabeli i jej indeksów (jeśli SQLite ma go wkompilowanego)
+            size = db.execute(text(
+                "SELECT SUM(pgsize) FROM dbstat "
+                "WHERE name = 'chat_messages' OR name LIKE 'ix_chat_messages%'"
+            )).scalar()
+        else:
+            size = db.execute(text("SELECT pg_total_relation_size('chat_messages')")).scalar()
+    except Exception:
+        db.rollback()
+        size = db.execute(select(func.sum(func.length(ChatMessage.content)))).scalar()
+    return rows, int(size or 0)
+
+
+def _free_pages_bytes(db: Session) -> Optional[int]:
+    if not IS_SQLITE:
+        return None
+    free = db.execute(text("PRAGMA freelist_count")).scalar()
+    page = db.execute(text("PRAGMA page_size")).scalar()
+    return free * page
+
+
+def archive_old_messages(days: int = ARCHIVE_AFTER_DAYS,
+                         batch_size: int = ARCHIVE_BATCH_SIZE) -> ArchiveReport:
+    """
+    Przenosi do archiwum wiadomości starsze niż `days` dni, które są już
+    w streszczeniu rozmowy. Każdy batch to osobna, krótka transakcja, żeby
+    nie blokować pisarza write-behind.
+    """
+    global last_report
+    started = time.perf_counter()
+    cutoff = datetime.utcnow() - timedelta(days=days)
+
+    with SessionLocal() as db:
+        conversations = db.execute(
+            select(Conversation.id, Conversation.student_id, Conversation.summary_upto_id)
+            .where(Conversation.summary_upto_id.isnot(None))
+        ).all()
+
+    touched = moved = raw_total = compressed_total = 0
+    for conversation_id, student_id, upto_id in conversations:
+        archived_any = False
+        while True:
+            with SessionLocal() as db:
+                count, raw_bytes, compressed = _archive_batch(
+                    db, conversation_id, student_id, upto_id, cutoff, batch_size
+                )
+            moved += count
+            raw_total += raw_bytes
+            compressed_total += compressed
+            archived_any = archived_any or count > 0
+            if count < batch_size:
+                break
+        touched += archived_any
+
+    with SessionLocal() as db:
+        hot_rows, hot_bytes = _hot_table_size(db)
+        free_bytes = _free_pages_bytes(db)
+
+    last_report = ArchiveReport(
+        conversations=touched,
+        messages=moved,
+        raw_bytes=raw_total,
+        compressed_bytes=compressed_total,
+        reclaimed_bytes=raw_total - compressed_total,
+        free_pages_bytes=free_bytes,
+        hot_rows=hot_rows,
+        hot_bytes=hot_bytes,
+        seconds=round(time.perf_counter() - started, 3),
+    )
+    print("[Archive]", last_report._asdict())
+    return last_report
+
+
+async def archive_periodically(interval_hours: float) -> None:
+    while True:
+        await asyncio.sleep(interval_hours * 3600)
+        try:
+            await run_in_threadpool(archive_old_messages)
+        except Exception as e:
+            print("[Archive] Błąd archiwizacji:", e)
+
+
+def stats() -> Optional[dict]:
+    return last_report._asdict() if last_report else None
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--days", type=int, default=ARCHIVE_AFTER_DAYS)
+    parser.add_argument("--batch-size", type=int, default=ARCHIVE_BATCH_SIZE)
+    args = parser.parse_args()
+    archive_old_messages(args.days, args.batch_size)
@@ -1,15 +1,15 @@
 from fastapi import APIRouter, HTTPException, Depends, Header
 from pydantic import BaseModel
-from sqlalchemy.orm import Session
-from datetime import datetime, timedelta
+from sqlalchemy import select, update
+from datetime import date, datetime, timedelta
 import jwt
 
-from app.db import SessionLocal
+from app.db import AsyncSessionLocal, AsyncReadSessionLocal
 from app.models import Student
 from app.config import SECRET_KEY
-from passlib.context import CryptContext
-
-pwd_context = CryptContext(schemes=["argon2"], deprecated="auto")
+from app.principals import Principal, principal_cache
+from app.ranking import ranking
+from app.passwords import pwd_context, hasher
 
 router = APIRouter()
 
@@ -46,17 +46,14 @@ def verify_password(plain: str, hashed: str) -> bool:
     return pwd_context.verify(plain, hashed)
 
 
-# Register
-@router.post("/auth/register")
-def register(data: RegisterIn):
-    db: Session = SessionLocal()
-
-    existing = db.query(Student).filter(Student.email == data.email).first()
-    if existing:
-        raise HTTPException(status_code=400, detail="Email already registered")
+# Krótkie sesje – nie trzymamy połączenia w trakcie liczenia argon2
+async def _find_by_email(email: str):
+    async with AsyncReadSessionLocal() as db:
+        result = await db.execute(select(Student).where(Student.email == email))
+        return result.scalars().first()
 
-    hashed = get_password_hash(data.password)
 
+async def _create_student(data: RegisterIn, hashed: str) -> None:
     student = Student(
         email=data.email,
         hashed_password=hashed,
@@ -68,27 +65,61 @@ def register(data: RegisterIn):
         subscription_expires=None,
     )
 
-    db.add(student)
-    db.commit()
-    db.refresh(student)
-    db.close()
+    async with AsyncSessionLocal() as db:
+        db.add(student)
+        await db.commit()
+
+    ranking.update(student.id, 0, 1, student.name)
+
+
+async def _update_hash(student_id: int, hashed: str) -> None:
+    async with AsyncSessionLocal() as db:
+        await db.execute(
+            update(Student)
+            .where(Student.id == student_id)
+            .values(hashed_password=hashed)
+        )
+        await db.commit()
+
+
+# Register
+@router.post("/auth/register")
+async def register(data: RegisterIn):
+    existing = await _find_by_email(data.email)
+    if existing:
+        raise HTTPException(status_code=400, detail="Email already registered")
+
+    # argon2 w puli procesów – nie blokuje threadpoola /chat
+    hashed = await hasher.hash(data.password)
+
+    await _create_student(data, hashed)
 
     return {"message": "Account created!"}
 
 
 # Login
 @router.post("/auth/login")
-def login(data: LoginIn):
-    db: Session = SessionLocal()
-
-    student = db.query(Student).filter(Student.email == data.email).first()
+async def login(data: LoginIn):
+    student = await _find_by_email(data.email)
     if not student:
         raise HTTPException(status_code=401, detail="Invalid credentials")
 
-    if not verify_password(data.password, student.hashed_password):
+    ok, new_hash = await hasher.verify_and_update(data.password, student.hashed_password)
+    if not ok:
         raise HTTPException(status_code=401, detail="Invalid credentials")
 
-    token = create_access_token({"id": student.id, "email": student.email})
+    # Parametry argon2 się zmieniły → zapisujemy hash z nowymi
+    if new_hash:
+        await _update_hash(student.id, new_hash)
+
+    token = create_access_token({
+        "id": student.id,
+        "email": student.email,
+        "ver": student.token_version or 0,
+    })
+
+    # rozgrzewamy cache – pierwszy request z nowym tokenem już bez bazy
+    principal_cache.put(Principal.from_student(student))
 
     return {
         "token": token,
@@ -98,7 +129,25 @@ def login(data: LoginIn):
 
 
 # --- 🔥 AUTH MIDDLEWARE (KLUCZOWE) ---
-def get_current_user(authorization: str = Header(None)):
+async def _load_principal(student_id: int) -> Principal:
+    async with AsyncReadSessionLocal() as db:
+        user = await db.get(Student, student_id)
+
+    if not user:
+        raise HTTPException(status_code=401, detail="User not found")
+
+    principal = Principal.from_student(user)
+    principal_cache.put(principal)
+    return principal
+
+
+async def get_current_user(authorization: str = Header(None)) -> Principal:
+    """
+    Ufa podpisanym claimom JWT; dane konta bierze z cache principali,
+    więc przy trafieniu nie ma żadnego zapytania do bazy. Zmiany konta
+    w bazie (token_version, is_active, subscription_expires) działają
+    najpóźniej po AUTH_CACHE_TTL_SECONDS.
+    """
     if not authorization:
         raise HTTPException(status_code=401, detail="Missing Authorization header")
 
@@ -113,11 +162,18 @@ def get_current_user(authorization: str = Header(None)):
     except Exception:
         raise HTTPException(status_code=401, detail="Invalid token")
 
-    db = SessionLocal()
-    user = db.query(Student).filter(Student.id == payload["id"]).first()
-    db.close()
+    principal = principal_cache.get(payload["id"]) or await _load_principal(payload["id"])
 
-    if not user:
-        raise HTTPException(status_code=401, detail="User not found")
+    # token sprzed podbicia token_version = unieważniony
+    if payload.get("ver", 0) != principal.token_version:
+        raise HTTPException(status_code=401, detail="Token revoked")
+
+    if not principal.is_active:
+        raise HTTPException(status_code=403, detail="Account deactivated")
+
+    # wpis w cache i tak wygasa z końcem dnia subskrypcji (principals.py)
+    if principal.subscription_expires and principal.subscription_expires < date.today():
+        raise HTTPException(status_code=403, detail="Subscription expired")
+
+    return principal
 
-    return user
@@ -9,3 +9,108 @@ OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 
 # 🔑 SECRET_KEY – albo z ENV, albo stały fallback
 SECRET_KEY = os.getenv("SECRET_KEY") or "korepetytorai_dev_secret_weronika_2025"
+
+# ⚙️ Współdzielony klient OpenAI (pula połączeń keep-alive)
+LLM_CONNECT_TIMEOUT = float(os.getenv("LLM_CONNECT_TIMEOUT", "5"))
+LLM_READ_TIMEOUT = float(os.getenv("LLM_READ_TIMEOUT", "120"))
+LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", "500"))
+LLM_MAX_KEEPALIVE = int(os.getenv("LLM_MAX_KEEPALIVE", "100"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "2"))
+
+# 💬 Kontekst czatu: budżet tokenów historii + streszczenia
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "3000"))
+CONTEXT_RECENT_TOKENS = int(os.getenv("CONTEXT_RECENT_TOKENS", "1500"))
+CONTEXT_SCAN_LIMIT = int(os.getenv("CONTEXT_SCAN_LIMIT", "200"))
+
+# 🧠 Semantyczny cache odpowiedzi czatu (pytania bez kontekstu)
+CACHE_DIR = Path(os.getenv("CACHE_DIR", str(BASE_DIR / "cache")))
+SEMANTIC_CACHE_ENABLED = os.getenv("SEMANTIC_CACHE_ENABLED", "1") == "1"
+SEMANTIC_CACHE_PATH = Path(os.getenv("SEMANTIC_CACHE_PATH", str(CACHE_DIR / "semantic_cache.sqlite3")))
+SEMANTIC_CACHE_MODEL = os.getenv("SEMANTIC_CACHE_MODEL", "text-embedding-3-small")
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.93"))
+SEMANTIC_CACHE_MAX_ENTRIES = int(os.getenv("SEMANTIC_CACHE_MAX_ENTRIES", "5000"))
+SEMANTIC_CACHE_TTL_SECONDS = int(os.getenv("SEMANTIC_CACHE_TTL_SECONDS", str(7 * 24 * 3600)))
+
+# 🚦 Admission control dla endpointów LLM
+RATE_LIMIT_PER_MINUTE = float(os.getenv("RATE_LIMIT_PER_MINUTE", "20"))   # tempo uzupełniania kubełka ucznia
+RATE_LIMIT_BURST = float(os.getenv("RATE_LIMIT_BURST", "10"))             # pojemność kubełka
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "64"))         # równoległe wywołania upstream
+LLM_QUEUE_SIZE = int(os.getenv("LLM_QUEUE_SIZE", "128"))                  # ilu może czekać na slot
+LLM_QUEUE_TIMEOUT = float(os.getenv("LLM_QUEUE_TIMEOUT", "2"))            # ile max czekamy na slot (s)
+# Opcjonalnie: wspólny stan limitów dla wielu workerów (plik SQLite)
+RATE_LIMIT_DB_PATH = os.getenv("RATE_LIMIT_DB_PATH")
+
+# ✍️ Write-behind (group commit) dla wiadomości, XP i streaków
+WRITE_BEHIND_FLUSH_MS = int(os.getenv("WRITE_BEHIND_FLUSH_MS", "25"))      # max. czas zbierania batcha
+WRITE_BEHIND_MAX_BATCH = int(os.getenv("WRITE_BEHIND_MAX_BATCH", "200"))   # max. operacji w transakcji
+# "commit"   – odpowiedź dopiero po commicie batcha (trwałe, nadal group commit)
+# "buffered" – odpowiedź od razu po zakolejkowaniu (crash może zgubić ostatnie ms)
+WRITE_BEHIND_DURABILITY = os.getenv("WRITE_BEHIND_DURABILITY", "commit")
+
+# 🔐 Cache principali (auth bez zapytania do bazy)
+AUTH_CACHE_SIZE = int(os.getenv("AUTH_CACHE_SIZE", "10000"))
+AUTH_CACHE_TTL_SECONDS = int(os.getenv("AUTH_CACHE_TTL_SECONDS", "300"))
+
+# 🔑 Hashowanie haseł (argon2) w osobnej puli procesów
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", "2"))
+PASSWORD_HASH_QUEUE = int(os.getenv("PASSWORD_HASH_QUEUE", "32"))   # ile może czekać, potem 503
+# domyślnie parametry passlib, którymi policzono istniejące hashe (bez masowego rehashu)
+ARGON2_TIME_COST = int(os.getenv("ARGON2_TIME_COST", "2"))
+ARGON2_MEMORY_COST = int(os.getenv("ARGON2_MEMORY_COST", "102400"))   # KiB
+ARGON2_PARALLELISM = int(os.getenv("ARGON2_PARALLELISM", "8"))
+
+# 🗄️ Baza danych (README: DATABASE_URL nadpisuje domyślny plik SQLite)
+DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./korepetyorai.db")
+DB_READ_POOL_SIZE = int(os.getenv("DB_READ_POOL_SIZE", "10"))
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+SQLITE_MMAP_SIZE = int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024)))   # bajty
+SQLITE_CACHE_SIZE_KIB = int(os.getenv("SQLITE_CACHE_SIZE_KIB", str(64 * 1024)))  # per połączenie
+
+# 🧊 Archiwizacja starych wiadomości czatu (app/archive.py)
+ARCHIVE_AFTER_DAYS = int(os.getenv("ARCHIVE_AFTER_DAYS", "90"))            # starsze idą do archiwum
+ARCHIVE_BATCH_SIZE = int(os.getenv("ARCHIVE_BATCH_SIZE", "2000"))          # wiadomości na jeden blob/transakcję
+ARCHIVE_INTERVAL_HOURS = float(os.getenv("ARCHIVE_INTERVAL_HOURS", "0"))   # 0 = tylko ręcznie (python -m app.archive)
+
+# 🏆 Ranking w pamięci (app/ranking.py)
+LEADERBOARD_RECONCILE_SECONDS = float(os.getenv("LEADERBOARD_RECONCILE_SECONDS", "300"))
+LEADERBOARD_MAX_LIMIT = int(os.getenv("LEADERBOARD_MAX_LIMIT", "100"))   # max. wierszy na stronę
+
+# 🗂️ Cache odpowiedzi HTTP (ETag / 304) dla leaderboardu i stanu ucznia
+HTTP_CACHE_MAX_ENTRIES = int(os.getenv("HTTP_CACHE_MAX_ENTRIES", "1024"))
+HTTP_CACHE_MAX_AGE = int(os.getenv("HTTP_CACHE_MAX_AGE", "0"))   # s; 0 = zawsze rewalidacja ETagiem
+
+# 🔥 Streaki: "dzień" liczymy w strefie szkoły, nie w UTC
+STREAK_TIMEZONE = os.getenv("STREAK_TIMEZONE", "Europe/Warsaw")
+
+# 📜 Historia czatu (stronicowanie kursorem)
+HISTORY_PAGE_SIZE = int(os.getenv("HISTORY_PAGE_SIZE", "50"))
+HISTORY_MAX_LIMIT = int(os.getenv("HISTORY_MAX_LIMIT", "200"))
+
+# 👩‍🏫 Stan wielu uczniów naraz (POST /state/batch)
+STATE_BATCH_MAX_IDS = int(os.getenv("STATE_BATCH_MAX_IDS", "200"))
+
+# 🎯 Hurtowe przyznawanie XP (POST /add_xp/bulk)
+XP_BULK_MAX_ENTRIES = int(os.getenv("XP_BULK_MAX_ENTRIES", "1000"))
+
+# 🧮 Trwały cache embeddingów RAG (rag/embedding_cache.py), obok vectorstore/
+EMBED_CACHE_PATH = Path(os.getenv("EMBED_CACHE_PATH", str(BASE_DIR / "embedding_cache.sqlite3")))
+EMBED_CACHE_MAX_BYTES = int(os.getenv("EMBED_CACHE_MAX_BYTES", str(512 * 1024 * 1024)))
+EMBED_CACHE_DTYPE = os.getenv("EMBED_CACHE_DTYPE", "float32")   # float32 | float16 (połowa miejsca)
+
+# 🚚 Budowa indeksu RAG: batche, współbieżność i limity API embeddingów
+EMBED_BATCH_MAX_TOKENS = int(os.getenv("EMBED_BATCH_MAX_TOKENS", "50000"))   # tokenów na zapytanie
+EMBED_BATCH_MAX_INPUTS = int(os.getenv("EMBED_BATCH_MAX_INPUTS", "256"))     # chunków na zapytanie
+EMBED_CONCURRENCY = int(os.getenv("EMBED_CONCURRENCY", "4"))                 # batchy w locie naraz
+EMBED_RPM = int(os.getenv("EMBED_RPM", "3000"))                              # zapytań / minutę
+EMBED_TPM = int(os.getenv("EMBED_TPM", "1000000"))                           # tokenów / minutę
+EMBED_MAX_RETRIES = int(os.getenv("EMBED_MAX_RETRIES", "6"))                 # prób po 429
+
+# 🌡️ Rozgrzewka RAG przy starcie; /ready = 503 do jej końca
+# (domyślnie wyłączona – obraz nie ma chromadb/langchain, routery RAG nie są podpięte)
+RAG_WARMUP_ENABLED = os.getenv("RAG_WARMUP_ENABLED", "0") == "1"
+RAG_WARMUP_RETRY_SECONDS = float(os.getenv("RAG_WARMUP_RETRY_SECONDS", "10"))
+
+# 🧭 Backend zapytań RAG: "chroma" (HNSW) albo "numpy" (dokładne top-k na pliku mmap)
+RAG_VECTOR_BACKEND = os.getenv("RAG_VECTOR_BACKEND", "chroma")
+RAG_NUMPY_INDEX_DIR = Path(os.getenv("RAG_NUMPY_INDEX_DIR", str(BASE_DIR / "vectorstore_numpy")))
+RAG_NUMPY_DTYPE = os.getenv("RAG_NUMPY_DTYPE", "float32")   # float32 | float16 (połowa pamięci)
@@ -0,0 +1,233 @@
+"""
+Składanie kontekstu czatu w budżecie tokenów.
+
+Najnowsze wiadomości idą do modelu dosłownie, a starsze są zastępowane
+streszczeniem trzymanym w `Conversation.summary`. Streszczenie jest
+aktualizowane w tle (po odpowiedzi), nigdy na ścieżce requestu.
+"""
+from datetime import datetime
+from typing import List, NamedTuple, Optional, Set
+
+from sqlalchemy import select
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config import CONTEXT_TOKEN_BUDGET, CONTEXT_RECENT_TOKENS, CONTEXT_SCAN_LIMIT
+from app.db import AsyncSessionLocal, AsyncReadSessionLocal
+from app.llm_client import get_llm_client
+from app.models import ChatMessage, Conversation
+
+try:
+    import tiktoken
+    _encoding = tiktoken.get_encoding("o200k_base")
+except Exception:  # tiktoken jest opcjonalny – wtedy liczymy z przybliżenia
+    _encoding = None
+
+SUMMARY_MODEL = "gpt-4o-mini"
+SUMMARY_BATCH = 100          # max. wiadomości zwijanych w jednym przebiegu
+MESSAGE_OVERHEAD_TOKENS = 4  # rola + separatory w formacie wiadomości
+
+SUMMARY_PROMPT = (
+    "Streszczasz rozmowę ucznia z korepetytorką chemii. "
+    "Zachowaj: tematy, które uczeń przerabiał, jego błędy i trudności, "
+    "ustalone fakty/dane z zadań oraz to, co obiecano wyjaśnić później. "
+    "Pisz po polsku, zwięźle, w punktach, maksymalnie ok. 250 słów."
+)
+
+
+class ChatContext(NamedTuple):
+    messages: List[dict]
+    tokens: int
+    conversation_id: int
+    needs_summary: bool
+
+
+def count_tokens(text: str) -> int:
+    if not text:
+        return 0
+    if _encoding is not None:
+        return len(_encoding.encode(text))
+    return len(text) // 4 + 1
+
+
+def _message_tokens(content: str) -> int:
+    return count_tokens(content) + MESSAGE_OVERHEAD_TOKENS
+
+
+def _summary_message(summary: str) -> dict:
+    return {
+        "role": "system",
+        "content": f"Streszczenie wcześniejszej rozmowy z uczniem:\n{summary}",
+    }
+
+
+async def _find_conversation(db: AsyncSession, student_id: int) -> Optional[Conversation]:
+    result = await db.execute(
+        select(Conversation).where(Conversation.student_id == student_id)
+    )
+    return result.scalars().first()
+
+
+async def get_or_create_conversation(db: AsyncSession, student_id: int) -> Conversation:
+    """
+    `db` może być sesją tylko do odczytu – brakującą rozmowę tworzy sesja zapisu.
+    Dwa równoległe pierwsze requesty ucznia: unikalny indeks na student_id
+    + ON CONFLICT DO NOTHING, a potem obaj czytają ten sam wiersz.
+    """
+    conversation = await _find_conversation(db, student_id)
+    if not conversation:
+        async with AsyncSessionLocal() as write_db:
+            dialect = write_db.bind.dialect.name
+            insert = (postgresql if dialect == "postgresql" else sqlite).insert
+            await write_db.execute(
+                insert(Conversation)
+                .values(student_id=student_id, created_at=datetime.utcnow())
+                .on_conflict_do_nothing(index_elements=["student_id"])
+            )
+            await write_db.commit()
+            conversation = await _find_conversation(write_db, student_id)
+    return conversation
+
+
+def _unsummarized(student_id: int, conversation: Conversation):
+    query = select(ChatMessage).where(ChatMessage.student_id == student_id)
+    if conversation.summary_upto_id:
+        query = query.where(ChatMessage.id > conversation.summary_upto_id)
+    return query
+
+
+async def build_context(db: AsyncSession, student_id: int, message: str,
+                        budget: int = CONTEXT_TOKEN_BUDGET) -> ChatContext:
+    """
+    Streszczenie + tyle najnowszych wiadomości, ile zmieści się w budżecie,
+    + nowa wiadomość ucznia. `needs_summary` = część historii nie zmieściła
+    się i nie jest jeszcze ujęta w streszczeniu.
+
+    Na koniec zamyka sesję, żeby nie trzymać połączenia przez czas
+    wywołania LLM.
+    """
+    conversation = await get_or_create_conversation(db, student_id)
+
+    messages: List[dict] = []
+    tokens = _message_tokens(message)
+
+    if conversation.summary:
+        summary_msg = _summary_message(conversation.summary)
+        messages.append(summary_msg)
+        tokens += _message_tokens(summary_msg["content"])
+
+    result = await db.execute(
+        _unsummarized(student_id, conversation)
+        .order_by(ChatMessage.created_at.desc(), ChatMessage.id.desc())
+        .limit(CONTEXT_SCAN_LIMIT)
+    )
+    rows = result.scalars().all()
+
+    recent: List[dict] = []
+    for msg in rows:
+        cost = _message_tokens(msg.content)
+        if tokens + cost > budget:
+            break
+        recent.append({"role": msg.role, "content": msg.content})
+        tokens += cost
+
+    messages.extend(reversed(recent))
+    messages.append({"role": "user", "content": message})
+
+    ctx = ChatContext(
+        messages=messages,
+        tokens=tokens,
+        conversation_id=conversation.id,
+        needs_summary=len(recent) < len(rows),
+    )
+    await db.close()
+    return ctx
+
+
+# ---------------------------------------------------------
+# 🔹 Streszczenie w tle
+# ---------------------------------------------------------
+_summarizing: Set[int] = set()
+
+
+async def _messages_to_fold(db: AsyncSession, conversation: Conversation) -> List[ChatMessage]:
+    """Najstarsze niestreszczone wiadomości – poza ogonem trzymanym dosłownie."""
+    result = await db.execute(
+        _unsummarized(conversation.student_id, conversation)
+        .order_by(ChatMessage.created_at.desc(), ChatMessage.id.desc())
+        .limit(CONTEXT_SCAN_LIMIT)
+    )
+    rows = result.scalars().all()
+
+    kept_tokens = 0
+    split = len(rows)
+    for i, msg in enumerate(rows):
+        kept_tokens += _message_tokens(msg.content)
+        if kept_tokens > CONTEXT_RECENT_TOKENS:
+            split = i
+            break
+    else:
+        return []
+
+    return list(reversed(rows[split:]))[:SUMMARY_BATCH]
+
+
+async def _load_fold_input(student_id: int):
+    async with AsyncReadSessionLocal() as db:
+        conversation = await _find_conversation(db, student_id)
+        if conversation is None:
+            return None, "", None
+        to_fold = await _messages_to_fold(db, conversation)
+        transcript = "\n".join(f"{m.role}: {m.content}" for m in to_fold)
+        last_id = to_fold[-1].id if to_fold else None
+        return conversation.summary, transcript, last_id
+
+
+async def _save_summary(student_id: int, summary: str, upto_id: int) -> None:
+    async with AsyncSessionLocal() as db:
+        conversation = await _find_conversation(db, student_id)
+        if conversation is None:
+            return
+        # inny przebieg mógł już zwinąć dalszą część historii
+        if conversation.summary_upto_id and conversation.summary_upto_id >= upto_id:
+            return
+        conversation.summary = summary
+        conversation.summary_upto_id = upto_id
+        await db.commit()
+
+
+async def refresh_summary(student_id: int) -> Optional[int]:
+    """
+    Zwija starszą część historii do streszczenia rozmowy.
+    Uruchamiane jako background task; zwraca nowe summary_upto_id.
+    """
+    if student_id in _summarizing:
+        return None
+    _summarizing.add(student_id)
+
+    try:
+        previous, transcript, last_id = await _load_fold_input(student_id)
+        if last_id is None:
+            return None
+
+        user_content = (
+            f"Dotychczasowe streszczenie:\n{previous or '(brak)'}\n\n"
+            f"Nowe wiadomości do uwzględnienia:\n{transcript}"
+        )
+
+        try:
+            response = await get_llm_client().responses.create(
+                model=SUMMARY_MODEL,
+                input=[
+                    {"role": "system", "content": SUMMARY_PROMPT},
+                    {"role": "user", "content": user_content},
+                ],
+            )
+        except Exception as e:
+            print("[Context] Błąd streszczania:", e)
+            return None
+
+        await _save_summary(student_id, response.output_text, last_id)
+        return last_id
+    finally:
+        _summarizing.discard(student_id)
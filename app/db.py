@@ -1,15 +1,107 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 
-DATABASE_URL = "sqlite:///./korepetyorai.db"
-
-engine = create_engine(
-    DATABASE_URL, connect_args={"check_same_thread": False}
+from app.config import (
+    DATABASE_URL,
+    DB_READ_POOL_SIZE,
+    SQLITE_BUSY_TIMEOUT_MS,
+    SQLITE_MMAP_SIZE,
+    SQLITE_CACHE_SIZE_KIB,
 )
 
+IS_SQLITE = DATABASE_URL.startswith("sqlite")
+
+
+def _async_url(url: str) -> str:
+    """Ten sam adres z async sterownikiem (aiosqlite / asyncpg)."""
+    if url.startswith("sqlite:"):
+        return url.replace("sqlite:", "sqlite+aiosqlite:", 1)
+    if url.startswith("postgres://"):
+        return url.replace("postgres://", "postgresql+asyncpg://", 1)
+    if url.startswith("postgresql://"):
+        return url.replace("postgresql://", "postgresql+asyncpg://", 1)
+    return url
+
+
+ASYNC_DATABASE_URL = _async_url(DATABASE_URL)
+
+
+def _sqlite_pragmas(read_only: bool):
+    def _on_connect(dbapi_conn, _record):
+        cursor = dbapi_conn.cursor()
+        # WAL: czytelnicy nie czekają na pisarza (i odwrotnie)
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}")
+        cursor.execute(f"PRAGMA mmap_size={SQLITE_MMAP_SIZE}")
+        cursor.execute(f"PRAGMA cache_size=-{SQLITE_CACHE_SIZE_KIB}")
+        cursor.execute("PRAGMA temp_store=MEMORY")
+        if read_only:
+            cursor.execute("PRAGMA query_only=ON")
+        cursor.close()
+
+    return _on_connect
+
+
+if IS_SQLITE:
+    # SQLite ma jednego pisarza naraz – dedykowany silnik z 1 połączeniem
+    # zamiast "database is locked" przy konkurencyjnych zapisach
+    write_engine = create_engine(
+        DATABASE_URL,
+        connect_args={"check_same_thread": False},
+        pool_size=1,
+        max_overflow=0,
+    )
+    # Odczyty (leaderboard, historia, stan ucznia) z osobnej puli
+    read_engine = create_engine(
+        DATABASE_URL,
+        connect_args={"check_same_thread": False},
+        pool_size=DB_READ_POOL_SIZE,
+        max_overflow=DB_READ_POOL_SIZE,
+    )
+    event.listen(write_engine, "connect", _sqlite_pragmas(read_only=False))
+    event.listen(read_engine, "connect", _sqlite_pragmas(read_only=True))
+else:
+    write_engine = create_engine(DATABASE_URL, pool_pre_ping=True)
+    read_engine = write_engine
+
+# zgodność wstecz: create_all / skrypty używają `engine`
+engine = write_engine
+
+# ---------------------------------------------------------
+# 🔹 Async (routery) – te same zasady: jeden pisarz, pula czytelników
+# ---------------------------------------------------------
+if IS_SQLITE:
+    async_write_engine = create_async_engine(
+        ASYNC_DATABASE_URL, pool_size=1, max_overflow=0
+    )
+    async_read_engine = create_async_engine(
+        ASYNC_DATABASE_URL,
+        pool_size=DB_READ_POOL_SIZE,
+        max_overflow=DB_READ_POOL_SIZE,
+    )
+    event.listen(async_write_engine.sync_engine, "connect", _sqlite_pragmas(read_only=False))
+    event.listen(async_read_engine.sync_engine, "connect", _sqlite_pragmas(read_only=True))
+else:
+    async_write_engine = create_async_engine(ASYNC_DATABASE_URL, pool_pre_ping=True)
+    async_read_engine = async_write_engine
+
 SessionLocal = sessionmaker(
-    autocommit=False, autoflush=False, bind=engine
+    autocommit=False, autoflush=False, bind=write_engine
+)
+
+ReadSessionLocal = sessionmaker(
+    autocommit=False, autoflush=False, bind=read_engine
+)
+
+AsyncSessionLocal = async_sessionmaker(
+    async_write_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False
+)
+
+AsyncReadSessionLocal = async_sessionmaker(
+    async_read_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False
 )
 
 Base = declarative_base()
@@ -21,3 +113,33 @@ def get_db():
         yield db
     finally:
         db.close()
+
+
+def get_read_db():
+    """Sesja tylko do odczytu – dla endpointów, które nic nie zapisują."""
+    db = ReadSessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+async def get_async_db():
+    """Async sesja zapisu; przy wyjątku rollback, zawsze close."""
+    async with AsyncSessionLocal() as db:
+        try:
+            yield db
+        except Exception:
+            await db.rollback()
+            raise
+
+
+async def get_async_read_db():
+    async with AsyncReadSessionLocal() as db:
+        yield db
+
+
+async def dispose_engines() -> None:
+    await async_write_engine.dispose()
+    if async_read_engine is not async_write_engine:
+        await async_read_engine.dispose()
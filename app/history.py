@@ -0,0 +1,139 @@
+"""
+Historia czatu ucznia: strony po kursorze i strumień NDJSON.
+
+Kursor to klucz (created_at, id) najstarszej wiadomości na stronie, więc
+kolejna strona to `WHERE (created_at, id) < kursor` po indeksie
+ix_chat_messages_student_created. Nie używamy OFFSET, więc koszt strony
+nie zależy od tego, jak daleko w historii jesteśmy. Wiadomości
+z archiwum (app/archive.py) są dołączane w tym samym porządku.
+"""
+import base64
+import binascii
+import json
+from datetime import datetime
+from typing import AsyncIterator, List, Optional, Tuple
+
+from sqlalchemy import select, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.archive import unpack
+from app.db import AsyncReadSessionLocal
+from app.models import ChatArchive, ChatMessage
+
+Cursor = Tuple[datetime, int]
+
+STREAM_BATCH = 500
+
+# same kolumny – bez obiektów ORM w identity map przy długich strumieniach
+_COLUMNS = (ChatMessage.id, ChatMessage.role, ChatMessage.content, ChatMessage.created_at)
+
+
+def encode_cursor(created_at: Optional[datetime], message_id: int) -> str:
+    raw = f"{(created_at or datetime.min).isoformat()}|{message_id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Cursor:
+    """ValueError przy śmieciowym kursorze."""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        created_at, message_id = base64.urlsafe_b64decode(padded).decode().split("|")
+        return datetime.fromisoformat(created_at), int(message_id)
+    except (binascii.Error, UnicodeDecodeError, ValueError) as e:
+        raise ValueError("Nieprawidłowy kursor") from e
+
+
+def _key(message: dict) -> Cursor:
+    return message["created_at"] or datetime.min, message["id"]
+
+
+def _as_dict(row) -> dict:
+    return dict(row._mapping)
+
+
+def _hot_query(student_id: int, before: Optional[Cursor]):
+    query = select(*_COLUMNS).where(ChatMessage.student_id == student_id)
+    if before:
+        query = query.where(tuple_(ChatMessage.created_at, ChatMessage.id) < tuple_(*before))
+    return query
+
+
+async def _archived_before(db: AsyncSession, student_id: int,
+                           before: Optional[Cursor], need: int) -> List[dict]:
+    """Do `need` najnowszych zarchiwizowanych wiadomości starszych niż kursor."""
+    query = select(ChatArchive).where(ChatArchive.student_id == student_id)
+    if before:
+        query = query.where(ChatArchive.first_created_at <= before[0])
+    result = await db.stream(
+        query.order_by(ChatArchive.last_created_at.desc(), ChatArchive.id.desc())
+        .execution_options(yield_per=1)
+    )
+
+    found: List[dict] = []
+    async for archive in result.scalars():
+        found.extend(m for m in unpack(archive) if before is None or _key(m) < before)
+        if len(found) >= need:
+            break
+    await result.close()
+    return found
+
+
+async def load_page(db: AsyncSession, student_id: int, limit: int,
+                    before: Optional[Cursor] = None) -> Tuple[List[dict], Optional[str]]:
+    """
+    `limit` wiadomości starszych niż `before` (domyślnie najnowsze),
+    chronologicznie + kursor do poprzedniej strony (None = początek historii).
+    """
+    result = await db.execute(
+        _hot_query(student_id, before)
+        .order_by(ChatMessage.created_at.desc(), ChatMessage.id.desc())
+        .limit(limit + 1)
+    )
+    page = [_as_dict(row) for row in result.all()]
+
+    if len(page) <= limit:
+        page.extend(await _archived_before(db, student_id, before, limit + 1 - len(page)))
+        page.sort(key=_key, reverse=True)
+
+    has_more = len(page) > limit
+    page = page[:limit]
+    next_before = encode_cursor(page[-1]["created_at"], page[-1]["id"]) if has_more else None
+    page.reverse()
+    return page, next_before
+
+
+def _ndjson(message: dict) -> str:
+    created_at = message["created_at"]
+    return json.dumps({
+        "id": message["id"],
+        "role": message["role"],
+        "content": message["content"],
+        "created_at": created_at.isoformat() if created_at else None,
+    }, ensure_ascii=False) + "\n"
+
+
+async def stream_ndjson(student_id: int, before: Optional[Cursor] = None) -> AsyncIterator[str]:
+    """
+    Cała historia (starsza niż `before`) od najstarszej, linia po linii.
+    Pamięć jest stała: bloby archiwum po jednym, wiadomości przez yield_per.
+    Własna sesja – żyje tyle, co odpowiedź, a nie request.
+    """
+    async with AsyncReadSessionLocal() as db:
+        archives = await db.stream(
+            select(ChatArchive)
+            .where(ChatArchive.student_id == student_id)
+            .order_by(ChatArchive.first_created_at.asc(), ChatArchive.id.asc())
+            .execution_options(yield_per=1)
+        )
+        async for archive in archives.scalars():
+            for message in unpack(archive):
+                if before is None or _key(message) < before:
+                    yield _ndjson(message)
+
+        messages = await db.stream(
+            _hot_query(student_id, before)
+            .order_by(ChatMessage.created_at.asc(), ChatMessage.id.asc())
+            .execution_options(yield_per=STREAM_BATCH)
+        )
+        async for row in messages:
+            yield _ndjson(_as_dict(row))
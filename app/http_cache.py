@@ -0,0 +1,117 @@
+"""
+Warunkowy cache HTTP (ETag / 304) dla często odpytywanych odczytów.
+
+Licznik wersji rośnie przy każdej zmianie XP / poziomu (zmiany rankingu,
+commit tury przez write-behind). Klucz odpowiedzi = (endpoint, parametry,
+wersja), więc:
+
+- `If-None-Match` z aktualnym ETagiem → 304 bez zapytania do bazy,
+- inaczej gotowe bajty z małego LRU, a dopiero przy braku – render.
+
+Wersje są per proces (ETag zawiera epokę procesu); zmiany z innych
+workerów wyłapuje okresowe uzgadnianie rankingu z bazą.
+"""
+import hashlib
+import json
+import threading
+import uuid
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Iterable, Optional
+
+from fastapi import Request, Response
+from fastapi.encoders import jsonable_encoder
+
+from app.config import HTTP_CACHE_MAX_ENTRIES, HTTP_CACHE_MAX_AGE
+from app.ranking import ranking
+from app.write_behind import writer
+
+
+def _matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate == "*" or candidate.removeprefix("W/") == etag:
+            return True
+    return False
+
+
+class ResponseCache:
+    def __init__(self, max_entries: int = HTTP_CACHE_MAX_ENTRIES, max_age: int = HTTP_CACHE_MAX_AGE):
+        self.max_entries = max_entries
+        self.cache_control = f"max-age={max_age}, must-revalidate"
+        self._epoch = uuid.uuid4().hex[:8]
+        self._entries: "OrderedDict[tuple, bytes]" = OrderedDict()
+        self._lock = threading.Lock()
+
+        self.version = 0
+        # wersja z chwili ostatniej zmiany danego ucznia
+        self._student_versions: Dict[int, int] = {}
+
+        self.hits = 0
+        self.misses = 0
+        self.not_modified = 0
+
+    def bump(self, student_id: Optional[int] = None) -> None:
+        with self._lock:
+            self.version += 1
+            if student_id is not None:
+                self._student_versions[student_id] = self.version
+
+    def settled(self, student_ids: Iterable[int], ok: bool) -> None:
+        """Callback write-behind: po commicie baza ma nowy stan ucznia."""
+        for student_id in student_ids:
+            self.bump(student_id)
+
+    def student_version(self, student_id: int) -> int:
+        return self._student_versions.get(student_id, 0)
+
+    def _etag(self, key: tuple) -> str:
+        digest = hashlib.sha1(f"{self._epoch}:{key!r}".encode()).hexdigest()[:24]
+        return f'"{digest}"'
+
+    def _response(self, body: Optional[bytes], etag: str) -> Response:
+        headers = {"ETag": etag, "Cache-Control": self.cache_control}
+        if body is None:
+            return Response(status_code=304, headers=headers)
+        return Response(content=body, media_type="application/json", headers=headers)
+
+    async def respond(self, request: Request, key: tuple,
+                      render: Callable[[], Awaitable[Any]]) -> Response:
+        """`key` musi zawierać wersję danych, od których zależy odpowiedź."""
+        etag = self._etag(key)
+        if _matches(request.headers.get("if-none-match"), etag):
+            self.not_modified += 1
+            return self._response(None, etag)
+
+        with self._lock:
+            body = self._entries.get(key)
+            if body is not None:
+                self._entries.move_to_end(key)
+        if body is not None:
+            self.hits += 1
+            return self._response(body, etag)
+
+        self.misses += 1
+        body = json.dumps(
+            jsonable_encoder(await render()), ensure_ascii=False, separators=(",", ":")
+        ).encode("utf-8")
+        with self._lock:
+            self._entries[key] = body
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return self._response(body, etag)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "version": self.version,
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "not_modified": self.not_modified,
+        }
+
+
+response_cache = ResponseCache()
+ranking.on_change(response_cache.bump)
+writer.on_settled(response_cache.settled)
@@ -1,14 +1,53 @@
 # app/llm_client.py
 
-from openai import OpenAI
-import os
+from typing import Optional
 
-def get_llm_client() -> OpenAI:
+import httpx
+from openai import AsyncOpenAI
+
+from app.config import (
+    OPENAI_API_KEY,
+    LLM_CONNECT_TIMEOUT,
+    LLM_READ_TIMEOUT,
+    LLM_MAX_CONNECTIONS,
+    LLM_MAX_KEEPALIVE,
+    LLM_MAX_RETRIES,
+)
+
+# Jeden klient na proces – jedna pula połączeń HTTP/TLS dla wszystkich requestów
+_client: Optional[AsyncOpenAI] = None
+
+
+def get_llm_client() -> AsyncOpenAI:
     """
-    Zwraca prawdziwego klienta OpenAI.
+    Zwraca współdzielonego (async) klienta OpenAI z pulą połączeń keep-alive.
     """
-    api_key = os.getenv("OPENAI_API_KEY")
-    if not api_key:
-        raise ValueError("Brak zmiennej OPENAI_API_KEY!")
+    global _client
+
+    if _client is None:
+        if not OPENAI_API_KEY:
+            raise ValueError("Brak zmiennej OPENAI_API_KEY!")
+
+        http_client = httpx.AsyncClient(
+            timeout=httpx.Timeout(LLM_READ_TIMEOUT, connect=LLM_CONNECT_TIMEOUT),
+            limits=httpx.Limits(
+                max_connections=LLM_MAX_CONNECTIONS,
+                max_keepalive_connections=LLM_MAX_KEEPALIVE,
+            ),
+        )
+        _client = AsyncOpenAI(
+            api_key=OPENAI_API_KEY,
+            http_client=http_client,
+            max_retries=LLM_MAX_RETRIES,
+        )
+
+    return _client
+
+
+async def close_llm_client() -> None:
+    """Zamyka pulę połączeń (wywoływane przy shutdownie aplikacji)."""
+    global _client
 
-    return OpenAI(api_key=api_key)
+    if _client is not None:
+        await _client.close()
+        _client = None
@@ -1,16 +1,78 @@
+import asyncio
+
 from fastapi import FastAPI
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
 
-from app.db import engine
+from app.db import engine, dispose_engines
+from app.llm_client import close_llm_client
+from app.semantic_cache import semantic_cache
+from app.singleflight import singleflight_stats
+from app.admission import admission
+from app.write_behind import writer
+from app.principals import principal_cache
+from app.passwords import hasher
+from app.archive import archive_periodically, stats as archive_stats
+from app.ranking import ranking, reconcile_periodically
+from app.http_cache import response_cache
+from app.config import (
+    ARCHIVE_INTERVAL_HOURS,
+    LEADERBOARD_RECONCILE_SECONDS,
+    RAG_WARMUP_ENABLED,
+    RAG_WARMUP_RETRY_SECONDS,
+)
+from app.streak import reset_streaks_nightly
 from app.models import Base
 from app.auth import router as auth_router
 from app.routers.chat import router as chat_router
 from app.routers.leaderboard import router as leaderboard_router
+from rag.engine import is_ready as rag_ready, warm_up as rag_warm_up, warmup_status
 
 Base.metadata.create_all(bind=engine)
 
 app = FastAPI(title="KorepetytorAI Backend", version="1.0.0")
 
+_background_tasks = []
+
+
+async def _warm_up_rag():
+    """Rozgrzewka RAG w tle – do jej końca /ready zwraca 503."""
+    while True:
+        try:
+            await run_in_threadpool(rag_warm_up)
+            return
+        except Exception as e:
+            print("[RAG] Rozgrzewka nieudana, ponawiam:", e)
+            await asyncio.sleep(RAG_WARMUP_RETRY_SECONDS)
+
+
+@app.on_event("startup")
+async def startup():
+    writer.start()
+    await ranking.reconcile()
+    _background_tasks.append(asyncio.create_task(reset_streaks_nightly()))
+    if RAG_WARMUP_ENABLED:
+        _background_tasks.append(asyncio.create_task(_warm_up_rag()))
+    if LEADERBOARD_RECONCILE_SECONDS > 0:
+        _background_tasks.append(
+            asyncio.create_task(reconcile_periodically(LEADERBOARD_RECONCILE_SECONDS))
+        )
+    if ARCHIVE_INTERVAL_HOURS > 0:
+        _background_tasks.append(asyncio.create_task(archive_periodically(ARCHIVE_INTERVAL_HOURS)))
+
+
+@app.on_event("shutdown")
+async def shutdown():
+    for task in _background_tasks:
+        task.cancel()
+    await close_llm_client()
+    # dopisz to, co zostało w kolejce write-behind
+    writer.close()
+    hasher.shutdown()
+    await dispose_engines()
+
+
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
@@ -32,3 +94,28 @@ def root():
 @app.get("/health")
 def health():
     return {"status": "ok"}
+
+
+@app.get("/ready")
+def ready():
+    """
+    Gotowość do ruchu (health check Fly): 503, dopóki RAG się nie rozgrzeje.
+    """
+    if RAG_WARMUP_ENABLED and not rag_ready():
+        return JSONResponse(status_code=503, content={"status": "warming_up", "rag": warmup_status()})
+    return {"status": "ready", "rag": warmup_status()}
+
+
+@app.get("/metrics")
+def metrics():
+    return {
+        "semantic_cache": semantic_cache.stats() if semantic_cache else None,
+        "singleflight": singleflight_stats(),
+        "admission": admission.stats(),
+        "write_behind": writer.stats(),
+        "auth_cache": principal_cache.stats(),
+        "password_hashing": hasher.stats(),
+        "archive": archive_stats(),
+        "leaderboard": ranking.stats(),
+        "http_cache": response_cache.stats(),
+    }
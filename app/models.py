@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Boolean, DateTime, Date, ForeignKey, Text
+from sqlalchemy import Column, Integer, String, Boolean, DateTime, Date, ForeignKey, Text, Index, LargeBinary
 from sqlalchemy.orm import relationship
 from datetime import datetime
 from app.db import Base
@@ -11,7 +11,7 @@ class Student(Base):
     email = Column(String, unique=True, index=True, nullable=False)
     hashed_password = Column(String, nullable=False)
 
-    xp = Column(Integer, default=0)
+    xp = Column(Integer, default=0, index=True)  # leaderboard: ORDER BY xp DESC LIMIT n
     level = Column(Integer, default=1)
 
     is_tester = Column(Boolean, default=False)
@@ -20,6 +20,9 @@ class Student(Base):
     subscription_expires = Column(Date, nullable=True)
     created_at = Column(DateTime, default=datetime.utcnow)
 
+    # podbijane przy wylogowaniu wszędzie / dezaktywacji – stare JWT przestają działać
+    token_version = Column(Integer, default=0, nullable=False)
+
     messages = relationship("ChatMessage", back_populates="student")
     streak = relationship("UserStreak", uselist=False, back_populates="student")
     conversation = relationship("Conversation", uselist=False, back_populates="student")
@@ -29,9 +32,13 @@ class Conversation(Base):
     __tablename__ = "conversations"
 
     id = Column(Integer, primary_key=True, index=True)
-    student_id = Column(Integer, ForeignKey("students.id"))
+    student_id = Column(Integer, ForeignKey("students.id"), unique=True, index=True)
     created_at = Column(DateTime, default=datetime.utcnow)
 
+    # Kroczące streszczenie starszej części rozmowy (aktualizowane w tle)
+    summary = Column(Text, nullable=True)
+    summary_upto_id = Column(Integer, nullable=True)  # ostatnie ChatMessage.id ujęte w streszczeniu
+
     student = relationship("Student", back_populates="conversation")
     messages = relationship("ChatMessage", back_populates="conversation")
 
@@ -50,12 +57,65 @@ class ChatMessage(Base):
     student = relationship("Student", back_populates="messages")
     conversation = relationship("Conversation", back_populates="messages")
 
+    # historia ucznia: WHERE student_id = ? ORDER BY created_at, id (w obie strony)
+    __table_args__ = (
+        Index("ix_chat_messages_student_created", "student_id", "created_at", "id"),
+    )
+
+
+class ChatArchive(Base):
+    """Stare wiadomości jednej rozmowy, spakowane w jeden skompresowany blob (app/archive.py)."""
+    __tablename__ = "chat_archives"
+
+    id = Column(Integer, primary_key=True, index=True)
+    student_id = Column(Integer, ForeignKey("students.id"), index=True)
+    conversation_id = Column(Integer, ForeignKey("conversations.id"))
+
+    first_message_id = Column(Integer, nullable=False)
+    last_message_id = Column(Integer, nullable=False)
+    first_created_at = Column(DateTime, nullable=False)
+    last_created_at = Column(DateTime, nullable=False)
+    message_count = Column(Integer, nullable=False)
+
+    codec = Column(String, default="zlib", nullable=False)
+    raw_bytes = Column(Integer, nullable=False)   # rozmiar JSON-a przed kompresją
+    payload = Column(LargeBinary, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+
+class XpEvent(Base):
+    """Dziennik XP (tylko dopisywanie) – Student.xp to suma tych wpisów (app/xp_ledger.py)."""
+    __tablename__ = "xp_events"
+
+    id = Column(Integer, primary_key=True, index=True)
+    student_id = Column(Integer, ForeignKey("students.id"), nullable=False, index=True)
+    amount = Column(Integer, nullable=False)
+    reason = Column(String, nullable=False)   # "chat", "manual", "opening_balance", ...
+    # hurtowe przyznawanie XP: ten sam klucz nie naliczy się drugi raz
+    idempotency_key = Column(String, unique=True, index=True, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+
+
+class XpBucket(Base):
+    """XP ucznia zsumowane w dniu / tygodniu / miesiącu – rankingi okresowe."""
+    __tablename__ = "xp_buckets"
+
+    period = Column(String, primary_key=True)        # "day" | "week" | "month"
+    bucket_start = Column(Date, primary_key=True)    # pierwszy dzień okresu
+    student_id = Column(Integer, ForeignKey("students.id"), primary_key=True)
+    xp = Column(Integer, default=0, nullable=False)
+
+    # /leaderboard?window=week: WHERE period = ? AND bucket_start = ? ORDER BY xp DESC
+    __table_args__ = (
+        Index("ix_xp_buckets_window_xp", "period", "bucket_start", "xp", "student_id"),
+    )
+
 
 class UserStreak(Base):
     __tablename__ = "user_streaks"
 
     id = Column(Integer, primary_key=True, index=True)
-    student_id = Column(Integer, ForeignKey("students.id"))
+    student_id = Column(Integer, ForeignKey("students.id"), unique=True, index=True)
 
     current_streak = Column(Integer, default=0)
     longest_streak = Column(Integer, default=0)
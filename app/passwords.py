@@ -0,0 +1,117 @@
+"""
+Hashowanie i weryfikacja haseł (argon2) w dedykowanej puli procesów.
+
+argon2 celowo zjada CPU i pamięć – liczony w wątkach requestów zagładza
+/chat przy fali rejestracji. Tu ma własną, ograniczoną pulę i własną
+kolejkę; gdy kolejka jest pełna, od razu zwracamy 503.
+"""
+import asyncio
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Optional, Tuple
+
+from fastapi import HTTPException
+from passlib.context import CryptContext
+
+from app.config import (
+    PASSWORD_HASH_WORKERS,
+    PASSWORD_HASH_QUEUE,
+    ARGON2_TIME_COST,
+    ARGON2_MEMORY_COST,
+    ARGON2_PARALLELISM,
+)
+
+# Zmiana parametrów → stare hashe są "deprecated" i przeliczane przy logowaniu
+pwd_context = CryptContext(
+    schemes=["argon2"],
+    deprecated="auto",
+    argon2__time_cost=ARGON2_TIME_COST,
+    argon2__memory_cost=ARGON2_MEMORY_COST,
+    argon2__parallelism=ARGON2_PARALLELISM,
+)
+
+
+# Funkcje wykonywane w procesach puli (muszą być na poziomie modułu)
+def _hash(password: str) -> str:
+    return pwd_context.hash(password)
+
+
+def _verify_and_update(password: str, hashed: str) -> Tuple[bool, Optional[str]]:
+    return pwd_context.verify_and_update(password, hashed)
+
+
+class PasswordHasher:
+    def __init__(self, workers: int = PASSWORD_HASH_WORKERS, queue_limit: int = PASSWORD_HASH_QUEUE):
+        self.workers = workers
+        self.queue_limit = queue_limit
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._outstanding = 0
+
+        self.completed = 0
+        self.errors = 0       # wyjątek w puli (np. padnięty proces) – poza completed
+        self.rejected = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return self._executor
+
+    async def _run(self, fn, *args):
+        if self._outstanding >= self.workers + self.queue_limit:
+            self.rejected += 1
+            raise HTTPException(
+                status_code=503,
+                detail="Za dużo logowań naraz, spróbuj za chwilę.",
+                headers={"Retry-After": "2"},
+            )
+
+        self._outstanding += 1
+        started = time.perf_counter()
+        try:
+            loop = asyncio.get_running_loop()
+            result = await loop.run_in_executor(self._get_executor(), fn, *args)
+        except Exception:
+            self.errors += 1
+            raise
+        finally:
+            self._outstanding -= 1
+
+        elapsed = (time.perf_counter() - started) * 1000
+        self.completed += 1
+        self.total_ms += elapsed
+        self.max_ms = max(self.max_ms, elapsed)
+        return result
+
+    async def hash(self, password: str) -> str:
+        return await self._run(_hash, password)
+
+    async def verify_and_update(self, password: str, hashed: str) -> Tuple[bool, Optional[str]]:
+        """(czy hasło poprawne, nowy hash jeśli parametry argon2 się zmieniły)."""
+        return await self._run(_verify_and_update, password, hashed)
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            "workers": self.workers,
+            # zadania w puli ponad liczbę workerów = czekające w kolejce
+            "queue_depth": max(0, self._outstanding - self.workers),
+            "in_progress": min(self._outstanding, self.workers),
+            "completed": self.completed,
+            "errors": self.errors,
+            "rejected": self.rejected,
+            "avg_ms": round(self.total_ms / self.completed, 2) if self.completed else 0.0,
+            "max_ms": round(self.max_ms, 2),
+        }
+
+
+hasher = PasswordHasher()
@@ -0,0 +1,101 @@
+"""
+Principal = to, co o zalogowanym uczniu potrzebują endpointy na gorącej
+ścieżce. Trzymany w ograniczonym cache LRU z TTL, żeby autoryzacja przy
+trafieniu nie dotykała bazy.
+"""
+import threading
+import time
+from collections import OrderedDict
+from datetime import date, datetime, time as dt_time
+from typing import Dict, Optional
+
+from app.config import AUTH_CACHE_SIZE, AUTH_CACHE_TTL_SECONDS
+from app.models import Student
+
+
+class Principal:
+    __slots__ = (
+        "id", "email", "name", "is_active", "is_tester",
+        "subscription_expires", "token_version",
+    )
+
+    def __init__(self, id: int, email: str, name: str, is_active: bool,
+                 is_tester: bool, subscription_expires: Optional[date],
+                 token_version: int):
+        self.id = id
+        self.email = email
+        self.name = name
+        self.is_active = is_active
+        self.is_tester = is_tester
+        self.subscription_expires = subscription_expires
+        self.token_version = token_version
+
+    @classmethod
+    def from_student(cls, student: Student) -> "Principal":
+        return cls(
+            id=student.id,
+            email=student.email,
+            name=student.name,
+            is_active=bool(student.is_active),
+            is_tester=bool(student.is_tester),
+            subscription_expires=student.subscription_expires,
+            token_version=student.token_version or 0,
+        )
+
+
+class PrincipalCache:
+    def __init__(self, max_size: int = AUTH_CACHE_SIZE, ttl_seconds: int = AUTH_CACHE_TTL_SECONDS):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[int, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+
+    def _expires_at(self, principal: Principal) -> float:
+        expires = time.time() + self.ttl_seconds
+        # wpis nie może przeżyć końca subskrypcji
+        if principal.subscription_expires:
+            end = datetime.combine(principal.subscription_expires, dt_time.max).timestamp()
+            expires = min(expires, end)
+        return expires
+
+    def get(self, student_id: int) -> Optional[Principal]:
+        with self._lock:
+            entry = self._entries.get(student_id)
+            if entry is None or entry[1] < time.time():
+                if entry is not None:
+                    del self._entries[student_id]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(student_id)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, principal: Principal) -> None:
+        with self._lock:
+            self._entries[principal.id] = (principal, self._expires_at(principal))
+            self._entries.move_to_end(principal.id)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, student_id: int) -> None:
+        with self._lock:
+            self._entries.pop(student_id, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, float]:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+
+principal_cache = PrincipalCache()
@@ -0,0 +1,143 @@
+"""
+XP, poziomy i streaki ucznia.
+
+`ProgressOverlay` daje read-your-writes dla write-behind: dopóki zapis tury
+czeka w kolejce, aktualne xp / level / streak ucznia są trzymane w pamięci,
+a po commicie wpis znika i kolejny odczyt idzie znowu do bazy.
+"""
+import threading
+from datetime import date
+from typing import Dict, Iterable, Optional, Tuple
+
+from sqlalchemy import select
+
+from app.db import AsyncReadSessionLocal
+from app.models import Student, UserStreak
+from app.streak import advance_streak
+from app.write_behind import writer
+
+XP_BASE = 5
+XP_LONG_MESSAGE_BONUS = 5
+LONG_MESSAGE_CHARS = 80
+
+
+def xp_for_message(message: str) -> int:
+    bonus = XP_LONG_MESSAGE_BONUS if len(message) > LONG_MESSAGE_CHARS else 0
+    return XP_BASE + bonus
+
+
+def next_level(xp: int, level: int) -> int:
+    # poziomy: co 100 XP = level up (poziom nigdy nie spada)
+    return max(level, xp // 100 + 1)
+
+
+class _State:
+    __slots__ = ("xp", "level", "current", "longest", "last_date", "pending", "stale")
+
+    def __init__(self, xp: int, level: int, current: int, longest: int,
+                 last_date: Optional[date]):
+        self.xp = xp
+        self.level = level
+        self.current = current
+        self.longest = longest
+        self.last_date = last_date
+        self.pending = 0
+        # któraś tura się nie zapisała – stan zawyżony do czasu odczytu z bazy
+        self.stale = False
+
+
+class ProgressOverlay:
+    def __init__(self):
+        self._states: Dict[int, _State] = {}
+        # podbijane przy każdym usunięciu wpisu – wykrywa odczyt z bazy sprzed commitu
+        self._epochs: Dict[int, int] = {}
+        self._lock = threading.Lock()
+
+    async def _load(self, student_id: int) -> _State:
+        async with AsyncReadSessionLocal() as db:
+            student = (
+                await db.execute(
+                    select(Student.xp, Student.level).where(Student.id == student_id)
+                )
+            ).first()
+            streak = (
+                await db.execute(
+                    select(UserStreak).where(UserStreak.student_id == student_id)
+                )
+            ).scalars().first()
+
+        xp, level = student if student else (0, 1)
+        if streak:
+            return _State(xp or 0, level or 1, streak.current_streak or 0,
+                          streak.longest_streak or 0, streak.last_streak_date)
+        return _State(xp or 0, level or 1, 0, 0, None)
+
+    async def apply_turn(self, student_id: int, xp_awarded: int, today: date) -> Tuple[int, int, int]:
+        """
+        Nakłada turę na stan w pamięci i zwraca (total_xp, level, streak),
+        jakie uczeń zobaczy po zapisaniu jej przez write-behind.
+        """
+        while True:
+            with self._lock:
+                if student_id in self._states:
+                    return self._apply(self._states[student_id], xp_awarded, today)
+                epoch = self._epochs.get(student_id, 0)
+
+            loaded = await self._load(student_id)
+
+            with self._lock:
+                state = self._states.get(student_id)
+                if state is None:
+                    # w międzyczasie ktoś zapisał i rozliczył turę → odczyt nieaktualny
+                    if self._epochs.get(student_id, 0) != epoch:
+                        continue
+                    state = self._states[student_id] = loaded
+                return self._apply(state, xp_awarded, today)
+
+    @staticmethod
+    def _apply(state: _State, xp_awarded: int, today: date) -> Tuple[int, int, int]:
+        # wołane pod self._lock
+        state.xp += xp_awarded
+        state.level = next_level(state.xp, state.level)
+        state.current, state.longest, state.last_date = advance_streak(
+            state.current, state.longest, state.last_date, today
+        )
+        state.pending += 1
+
+        return state.xp, state.level, state.current
+
+    def settle(self, student_ids: Iterable[int], ok: bool) -> None:
+        """
+        Callback write-behind: zapis zacommitowany (albo nieudany). Po błędzie
+        stan jest tylko oznaczany jako nieaktualny – usunięcie go przy innych
+        czekających turach dałoby im odczyt z bazy bez ich własnego XP.
+        Wpis znika, gdy wszystkie tury ucznia się rozliczą; kolejny odczyt
+        idzie wtedy do bazy.
+        """
+        with self._lock:
+            for student_id in student_ids:
+                state = self._states.get(student_id)
+                if state is None:
+                    continue
+                state.pending -= 1
+                if not ok:
+                    state.stale = True
+                if state.pending <= 0:
+                    del self._states[student_id]
+                    self._epochs[student_id] = self._epochs.get(student_id, 0) + 1
+
+    def snapshot(self) -> Dict[int, Tuple[int, int]]:
+        """(xp, level) uczniów z turami jeszcze niezapisanymi w bazie."""
+        with self._lock:
+            return {sid: (state.xp, state.level) for sid, state in self._states.items()}
+
+    def pending(self) -> int:
+        return len(self._states)
+
+    def has_pending(self, student_id: int) -> bool:
+        with self._lock:
+            return student_id in self._states
+
+
+overlay = ProgressOverlay()
+writer.on_settled(overlay.settle)
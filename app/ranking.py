@@ -0,0 +1,328 @@
+"""
+Ranking uczniów w pamięci procesu.
+
+Indeksowana skip lista trzyma klucze (-xp, -student_id), więc top-N, dowolna
+strona i "moje miejsce" kosztują O(log n) zamiast sortowania tabeli
+`students` przy każdym żądaniu. Ranking jest ładowany z bazy przy starcie,
+aktualizowany przy każdym przyznaniu XP i co LEADERBOARD_RECONCILE_SECONDS
+uzgadniany z bazą (łapie zapisy spoza tego procesu i nieudane batche).
+"""
+import asyncio
+import random
+import threading
+import time
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import select
+
+from app.db import AsyncReadSessionLocal, ReadSessionLocal
+from app.models import Student
+from app.progress import overlay
+from app.write_behind import writer
+
+MAX_LEVEL = 32
+
+
+# ---------------------------------------------------------
+# 🔹 Indeksowana skip lista (szerokości = liczba elementów "przeskakiwanych")
+# ---------------------------------------------------------
+class _Node:
+    __slots__ = ("value", "next", "width")
+
+    def __init__(self, value, level: int):
+        self.value = value
+        self.next: List[Optional["_Node"]] = [None] * level
+        self.width = [1] * level
+
+
+def _random_level() -> int:
+    level = 1
+    while level < MAX_LEVEL and random.random() < 0.5:
+        level += 1
+    return level
+
+
+class IndexableSkipList:
+    def __init__(self):
+        self._head = _Node(None, MAX_LEVEL)
+        self._size = 0
+
+    @classmethod
+    def from_sorted(cls, values: Iterable) -> "IndexableSkipList":
+        """Budowa w O(n) z posortowanych wartości (przeładowanie rankingu)."""
+        skiplist = cls()
+        last = [skiplist._head] * MAX_LEVEL
+        last_pos = [0] * MAX_LEVEL
+        pos = 0
+        for pos, value in enumerate(values, start=1):
+            node = _Node(value, _random_level())
+            for level in range(len(node.next)):
+                prev = last[level]
+                prev.next[level] = node
+                prev.width[level] = pos - last_pos[level]
+                last[level] = node
+                last_pos[level] = pos
+        for level in range(MAX_LEVEL):
+            last[level].width[level] = pos + 1 - last_pos[level]
+        skiplist._size = pos
+        return skiplist
+
+    def __len__(self) -> int:
+        return self._size
+
+    def _path(self, value) -> List[_Node]:
+        """Ostatni węzeł < value na każdym poziomie."""
+        chain = [self._head] * MAX_LEVEL
+        node = self._head
+        for level in reversed(range(MAX_LEVEL)):
+            while node.next[level] is not None and node.next[level].value < value:
+                node = node.next[level]
+            chain[level] = node
+        return chain
+
+    def insert(self, value) -> None:
+        chain = [self._head] * MAX_LEVEL
+        steps_at_level = [0] * MAX_LEVEL
+        node = self._head
+        for level in reversed(range(MAX_LEVEL)):
+            while node.next[level] is not None and node.next[level].value < value:
+                steps_at_level[level] += node.width[level]
+                node = node.next[level]
+            chain[level] = node
+
+        new = _Node(value, _random_level())
+        steps = 0
+        for level in range(len(new.next)):
+            prev = chain[level]
+            new.next[level] = prev.next[level]
+            prev.next[level] = new
+            new.width[level] = prev.width[level] - steps
+            prev.width[level] = steps + 1
+            steps += steps_at_level[level]
+        for level in range(len(new.next), MAX_LEVEL):
+            chain[level].width[level] += 1
+        self._size += 1
+
+    def remove(self, value) -> None:
+        chain = self._path(value)
+        target = chain[0].next[0]
+        if target is None or target.value != value:
+            raise KeyError(value)
+        for level in range(len(target.next)):
+            prev = chain[level]
+            prev.width[level] += target.width[level] - 1
+            prev.next[level] = target.next[level]
+        for level in range(len(target.next), MAX_LEVEL):
+            chain[level].width[level] -= 1
+        self._size -= 1
+
+    def index(self, value) -> int:
+        """Pozycja (od 0) istniejącej wartości."""
+        node = self._head
+        pos = 0
+        for level in reversed(range(MAX_LEVEL)):
+            while node.next[level] is not None and node.next[level].value < value:
+                pos += node.width[level]
+                node = node.next[level]
+        target = node.next[0]
+        if target is None or target.value != value:
+            raise KeyError(value)
+        return pos
+
+    def iter_from(self, start: int) -> Iterator:
+        if start >= self._size:
+            return
+        node = self._head
+        remaining = start + 1
+        for level in reversed(range(MAX_LEVEL)):
+            while node.width[level] <= remaining and node.next[level] is not None:
+                remaining -= node.width[level]
+                node = node.next[level]
+        while node is not None:
+            yield node.value
+            node = node.next[0]
+
+
+# ---------------------------------------------------------
+# 🔹 Ranking
+# ---------------------------------------------------------
+def _key(student_id: int, xp: int) -> Tuple[int, int]:
+    # xp malejąco, przy remisie wyższe id pierwsze – ten sam porządek co
+    # ORDER BY xp DESC, id DESC (wsteczny przebieg po ix_students_xp)
+    return -xp, -student_id
+
+
+class _Entry:
+    __slots__ = ("name", "xp", "level")
+
+    def __init__(self, name: str, xp: int, level: int):
+        self.name = name
+        self.xp = xp
+        self.level = level
+
+
+class RankedLeaderboard:
+    def __init__(self):
+        self._index = IndexableSkipList()
+        self._entries: Dict[int, _Entry] = {}
+        self._lock = threading.Lock()
+        # aktualizacje w trakcie uzgadniania – nakładane na świeży stan z bazy
+        self._dirty: Optional[Dict[int, Tuple[int, int, Optional[str]]]] = None
+        # wołane po każdej zmianie XP ucznia (None = mogło się zmienić wszystko)
+        self._on_change: List[Callable[[Optional[int]], None]] = []
+        # uczniowie z nieudanym zapisem tury – do odczytu z bazy po rozliczeniu kolejki
+        self._stale: Set[int] = set()
+
+        self.loaded = False
+        self.reconciled_at: Optional[float] = None
+        self.reconciliations = 0
+        self.corrections = 0
+
+    def on_change(self, callback: Callable[[Optional[int]], None]) -> None:
+        self._on_change.append(callback)
+
+    def _changed(self, student_id: Optional[int]) -> None:
+        for callback in self._on_change:
+            callback(student_id)
+
+    def update(self, student_id: int, xp: int, level: int, name: Optional[str] = None) -> None:
+        with self._lock:
+            if self._dirty is not None:
+                self._dirty[student_id] = (xp, level, name)
+            self._apply(student_id, xp, level, name)
+        self._changed(student_id)
+
+    def _apply(self, student_id: int, xp: int, level: int, name: Optional[str]) -> None:
+        # wołane pod self._lock
+        entry = self._entries.get(student_id)
+        if entry is None:
+            self._entries[student_id] = _Entry(name or "", xp, level)
+            self._index.insert(_key(student_id, xp))
+            return
+        if entry.xp != xp:
+            self._index.remove(_key(student_id, entry.xp))
+            self._index.insert(_key(student_id, xp))
+        entry.xp = xp
+        entry.level = level
+        if name is not None:
+            entry.name = name
+
+    def settle(self, student_ids: Iterable[int], ok: bool) -> None:
+        """
+        Callback write-behind (w wątku pisarza). XP z nieudanej tury jest już
+        w rankingu, więc po błędzie uczeń jest czytany z bazy – dopiero gdy
+        nie ma więcej czekających tur, inaczej baza nie zawiera jeszcze ich XP.
+        """
+        refresh = []
+        with self._lock:
+            for student_id in student_ids:
+                if not ok:
+                    self._stale.add(student_id)
+                if student_id in self._stale and not overlay.has_pending(student_id):
+                    self._stale.discard(student_id)
+                    refresh.append(student_id)
+        if not refresh:
+            return
+
+        db = ReadSessionLocal()
+        try:
+            rows = db.execute(
+                select(Student.id, Student.name, Student.xp, Student.level)
+                .where(Student.id.in_(refresh))
+            ).all()
+        finally:
+            db.close()
+        for student_id, name, xp, level in rows:
+            self.update(student_id, xp or 0, level or 1, name or "")
+
+    def remove(self, student_id: int) -> None:
+        with self._lock:
+            entry = self._entries.pop(student_id, None)
+            if entry is not None:
+                self._index.remove(_key(student_id, entry.xp))
+
+    def _row(self, rank: int, student_id: int) -> dict:
+        entry = self._entries[student_id]
+        return {"id": student_id, "name": entry.name, "xp": entry.xp,
+                "level": entry.level, "rank": rank}
+
+    def page(self, limit: int, offset: int = 0) -> List[dict]:
+        rows = []
+        with self._lock:
+            for i, (_, neg_id) in enumerate(self._index.iter_from(offset)):
+                if i >= limit:
+                    break
+                rows.append(self._row(offset + i + 1, -neg_id))
+        return rows
+
+    def rank_of(self, student_id: int) -> Optional[dict]:
+        with self._lock:
+            entry = self._entries.get(student_id)
+            if entry is None:
+                return None
+            rank = self._index.index(_key(student_id, entry.xp)) + 1
+            row = self._row(rank, student_id)
+            row["total"] = len(self._index)
+            return row
+
+    # -----------------------------------------------------
+    # Uzgadnianie z bazą
+    # -----------------------------------------------------
+    def _replace(self, rows: List[Tuple[int, str, int, int]]) -> None:
+        entries = {sid: _Entry(name or "", xp or 0, level or 1) for sid, name, xp, level in rows}
+        # tury czekające w write-behind nie są jeszcze w bazie
+        for sid, (xp, level) in overlay.snapshot().items():
+            if sid in entries:
+                entries[sid].xp, entries[sid].level = xp, level
+        index = IndexableSkipList.from_sorted(sorted(_key(sid, e.xp) for sid, e in entries.items()))
+
+        with self._lock:
+            corrections = sum(
+                1 for sid, e in entries.items()
+                if sid not in self._entries or self._entries[sid].xp != e.xp
+            ) + sum(1 for sid in self._entries if sid not in entries)
+            if self.loaded:
+                self.corrections += corrections
+            dirty, self._dirty = self._dirty or {}, None
+            self._entries = entries
+            self._index = index
+            for sid, (xp, level, name) in dirty.items():
+                self._apply(sid, xp, level, name)
+
+        if corrections:
+            self._changed(None)
+        self.loaded = True
+        self.reconciled_at = time.time()
+        self.reconciliations += 1
+
+    async def reconcile(self) -> None:
+        with self._lock:
+            self._dirty = {}
+        async with AsyncReadSessionLocal() as db:
+            rows = (
+                await db.execute(select(Student.id, Student.name, Student.xp, Student.level))
+            ).all()
+        await run_in_threadpool(self._replace, [tuple(r) for r in rows])
+
+    def stats(self) -> dict:
+        return {
+            "loaded": self.loaded,
+            "students": len(self._entries),
+            "reconciliations": self.reconciliations,
+            "corrections": self.corrections,
+            "reconciled_at": self.reconciled_at,
+        }
+
+
+ranking = RankedLeaderboard()
+writer.on_settled(ranking.settle)   # po overlay.settle – ten rejestruje się przy imporcie app.progress
+
+
+async def reconcile_periodically(interval_seconds: float) -> None:
+    while True:
+        await asyncio.sleep(interval_seconds)
+        try:
+            await ranking.reconcile()
+        except Exception as e:
+            print("[Ranking] Błąd uzgadniania z bazą:", e)
@@ -1,108 +1,281 @@
-from fastapi import APIRouter, HTTPException, Depends, status, Header
+import json
+import time
+
+from fastapi import APIRouter, BackgroundTasks, HTTPException, Depends, status
+from fastapi.responses import StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 from datetime import datetime
 
-from app.models import ChatMessage, Student
-from app.db import get_db
-from app.streak import update_streak_after_message
-from app.auth import get_current_user
-from app.config import OPENAI_API_KEY
+from app.models import ChatMessage
+from app.principals import Principal
+from app.db import get_async_read_db
+from app.streak import local_today, update_streak_after_message
+from app.admission import SLOT_RENEW_SECONDS, admission, rate_limited_user, too_many_requests
+from app.context import ChatContext, build_context, refresh_summary
+from app.progress import overlay, xp_for_message
+from app.ranking import ranking
+from app.semantic_cache import semantic_cache
+from app.singleflight import SingleFlight, request_key
+from app.write_behind import writer
+from app.xp_ledger import award_xp
+from app.llm_client import get_llm_client
 from app.schemas import ChatIn, ChatOut
 
-from openai import OpenAI
+from openai import AsyncOpenAI, RateLimitError
 
 router = APIRouter(prefix="/chat", tags=["chat"])
 
 
-def _get_client() -> OpenAI:
-    if not OPENAI_API_KEY:
+class _SlotStreamingResponse(StreamingResponse):
+    """
+    Po zakończeniu odpowiedzi woła `on_close` – także gdy klient rozłączył
+    się, zanim generator wystartował (wtedy jego `finally` się nie wykona).
+    """
+
+    def __init__(self, content, on_close, **kwargs):
+        super().__init__(content, **kwargs)
+        self._on_close = on_close
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            await self._on_close()
+
+
+CHAT_MODEL = "gpt-4o-mini"
+
+# Identyczne wejście (zwykle pierwsze pytanie bez historii) → jedno wywołanie
+_completion_flight = SingleFlight("chat_completion")
+
+
+def _get_client() -> AsyncOpenAI:
+    try:
+        return get_llm_client()
+    except ValueError:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail="OPENAI_API_KEY not configured",
         )
-    return OpenAI(api_key=OPENAI_API_KEY)
+
+
+async def _record_turn(student_id: int, name: str, conversation_id: int,
+                       message: str, answer: str) -> ChatOut:
+    """
+    Kolejkuje całą turę (pytanie, odpowiedź, XP, streak) do write-behind –
+    zapisze się w jednej transakcji razem z innymi turami (group commit).
+    XP / level / streak w odpowiedzi pochodzą z overlay (read-your-writes).
+    Nieudany zapis (tryb "commit") nie psuje odpowiedzi – wraca z saved=False.
+    """
+    xp_awarded = xp_for_message(message)
+    today = local_today()
+    asked_at = datetime.utcnow()
+    answered_at = datetime.utcnow()
+
+    total_xp, level, streak = await overlay.apply_turn(student_id, xp_awarded, today)
+    # z imieniem – pierwsza tura nowego ucznia nie może dodać go do rankingu bez nazwy
+    ranking.update(student_id, total_xp, level, name)
+
+    def apply(db: Session) -> None:
+        db.add(ChatMessage(
+            student_id=student_id,
+            conversation_id=conversation_id,
+            role="user",
+            content=message,
+            created_at=asked_at,
+        ))
+        db.add(ChatMessage(
+            student_id=student_id,
+            conversation_id=conversation_id,
+            role="assistant",
+            content=answer,
+            created_at=answered_at,
+        ))
+
+        # 🔥 XP system (dziennik + kubełki + Student.xp)
+        award_xp(db, student_id, xp_awarded, "chat", when=answered_at, day=today)
+
+        # 🔥 Streak
+        update_streak_after_message(db, student_id, today)
+
+    try:
+        await writer.submit(apply, keys=[student_id])
+    except Exception as e:
+        # odpowiedź już jest – uczeń ją dostaje, tylko bez XP za tę turę
+        # (overlay i ranking wrócą do stanu z bazy przez callback on_settled)
+        print("[Chat] Nie udało się zapisać tury:", e)
+        return ChatOut(
+            answer=answer,
+            xp_awarded=0,
+            total_xp=total_xp - xp_awarded,
+            level=level,
+            streak=streak,
+            new_badges=[],
+            saved=False,
+        )
+
+    return ChatOut(
+        answer=answer,
+        xp_awarded=xp_awarded,
+        total_xp=total_xp,
+        level=level,
+        streak=streak,
+        new_badges=[],
+    )
+
+
+async def _cache_lookup(in_: ChatIn, ctx: ChatContext):
+    """
+    Semantyczny cache tylko dla pytań bez kontekstu (pierwsza tura, brak
+    historii i streszczenia). Zwraca (answer | None, vector | None).
+    """
+    if semantic_cache is None or len(ctx.messages) != 1:
+        return None, None
+    if in_.no_cache:
+        semantic_cache.bypassed += 1
+        return None, None
+    return await semantic_cache.get(in_.message)
+
+
+def _sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
 
 
 @router.post("", response_model=ChatOut)
-def chat(
+async def chat(
     in_: ChatIn,
-    authorization: str = Header(None),   # 🔥 kluczowe, żeby JWT działał
-    db: Session = Depends(get_db),
+    background_tasks: BackgroundTasks,
+    user: Principal = Depends(rate_limited_user),   # 🔥 JWT + limit per uczeń
+    db: AsyncSession = Depends(get_async_read_db),
 ):
-    # 🔥 Pobranie usera z JWT
-    user = get_current_user(authorization)
-
     if not in_.message or not in_.message.strip():
         raise HTTPException(status_code=400, detail="Message is empty")
 
-    # 🔥 Pobieramy 20 ostatnich wiadomości użytkownika
-    history = (
-        db.query(ChatMessage)
-        .filter(ChatMessage.student_id == user.id)
-        .order_by(ChatMessage.created_at.desc())
-        .limit(20)
-        .all()
-    )
+    # 🔥 Historia w budżecie tokenów
+    ctx = await build_context(db, user.id, in_.message)
+    if ctx.needs_summary:
+        background_tasks.add_task(refresh_summary, user.id)
 
-    formatted_history = [
-        {"role": msg.role, "content": msg.content}
-        for msg in reversed(history)
-    ]
+    cached_answer, cache_vector = await _cache_lookup(in_, ctx)
 
-    # Dodajemy wiadomość użytkownika
-    formatted_history.append({"role": "user", "content": in_.message})
+    if cached_answer is not None:
+        answer = cached_answer
+    else:
+        # 🔥 Wywołanie OpenAI
+        client = _get_client()
 
-    # 🔥 Zapisujemy wiadomość użytkownika
-    db.add(ChatMessage(
-        student_id=user.id,
-        role="user",
-        content=in_.message,
-        created_at=datetime.utcnow(),
-    ))
-    db.flush()
+        try:
+            response = await _completion_flight.do(
+                request_key(CHAT_MODEL, ctx.messages),
+                lambda: admission.call(
+                    lambda: client.responses.create(model=CHAT_MODEL, input=ctx.messages)
+                ),
+            )
+            answer = response.output_text
+        except HTTPException:
+            raise
+        except RateLimitError:
+            raise too_many_requests("Limit OpenAI wyczerpany, spróbuj za chwilę.", 5)
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"OpenAI error: {str(e)}")
 
-    # 🔥 Wywołanie OpenAI
-    client = _get_client()
+        if cache_vector is not None:
+            await semantic_cache.put(in_.message, cache_vector, answer)
 
-    try:
-        response = client.responses.create(
-            model="gpt-4o-mini",
-            input=formatted_history,
-        )
-        answer = response.output_text
-    except Exception as e:
-        db.rollback()
-        raise HTTPException(status_code=500, detail=f"OpenAI error: {str(e)}")
+    # Trafienie w cache daje XP i streak tak samo jak zwykła odpowiedź
+    out = await _record_turn(user.id, user.name, ctx.conversation_id, in_.message, answer)
+    out.context_tokens = ctx.tokens
+    out.cached = cached_answer is not None
+    return out
 
-    # 🔥 Zapisujemy odpowiedź AI
-    db.add(ChatMessage(
-        student_id=user.id,
-        role="assistant",
-        content=answer,
-        created_at=datetime.utcnow(),
-    ))
 
-    # 🔥 XP system
-    base_xp = 5
-    bonus_xp = 5 if len(in_.message) > 80 else 0
-    xp_awarded = base_xp + bonus_xp
+# ---------------------------------------------------------
+# 📌 STREAMING (SSE) – tokeny lecą do ucznia na bieżąco
+# ---------------------------------------------------------
+@router.post("/stream")
+async def chat_stream(
+    in_: ChatIn,
+    background_tasks: BackgroundTasks,
+    user: Principal = Depends(rate_limited_user),
+    db: AsyncSession = Depends(get_async_read_db),
+):
+    """
+    Wersja /chat zwracająca Server-Sent Events:
+      - `delta` – kolejne fragmenty odpowiedzi,
+      - `done`  – pola ChatOut (xp_awarded, total_xp, level, streak...),
+      - `error` – błąd OpenAI w trakcie streamu.
+    Przeciążenie (pełna kolejka slotów) to zwykłe 429 z Retry-After, zanim
+    stream wystartuje. Nic nie jest kolejkowane do zapisu, dopóki stream się
+    nie zakończy; przy zerwaniu połączenia tura przepada.
+    """
+    if not in_.message or not in_.message.strip():
+        raise HTTPException(status_code=400, detail="Message is empty")
 
-    user.xp += xp_awarded
+    ctx = await build_context(db, user.id, in_.message)
+    if ctx.needs_summary:
+        background_tasks.add_task(refresh_summary, user.id)
+    cached_answer, cache_vector = await _cache_lookup(in_, ctx)
+    client = _get_client() if cached_answer is None else None
 
-    while user.xp >= user.level * 100:
-        user.level += 1
+    # Slot bierzemy PRZED wysłaniem nagłówków – pełna kolejka to prawdziwe
+    # 429 z Retry-After, a nie 200 z eventem "error".
+    held = [await admission.acquire_slot() if cached_answer is None else None]
 
-    # 🔥 Streak
-    streak = update_streak_after_message(db, user.id)
+    async def release():
+        slot, held[0] = held[0], None
+        if slot is not None:
+            await admission.release_slot(slot)
 
-    db.commit()
-    db.refresh(user)
+    async def event_stream():
+        stream = None
+        parts = []
+        completed = False
+        try:
+            if cached_answer is not None:
+                parts.append(cached_answer)
+                yield _sse("delta", {"text": cached_answer})
+            else:
+                # Slot trzymamy przez cały stream; zwalnia go blok finally
+                try:
+                    stream = await client.responses.create(
+                        model=CHAT_MODEL,
+                        input=ctx.messages,
+                        stream=True,
+                    )
+                    renewed = time.monotonic()
+                    async for event in stream:
+                        # długi stream: dzierżawa slotu (SQLite) nie może wygasnąć
+                        if time.monotonic() - renewed >= SLOT_RENEW_SECONDS:
+                            renewed = time.monotonic()
+                            await admission.renew_slot(held[0])
+                        if event.type == "response.output_text.delta":
+                            parts.append(event.delta)
+                            yield _sse("delta", {"text": event.delta})
+                except Exception as e:
+                    yield _sse("error", {"detail": f"OpenAI error: {str(e)}"})
+                    return
 
-    return ChatOut(
-        answer=answer,
-        xp_awarded=xp_awarded,
-        total_xp=user.xp,
-        level=user.level,
-        streak=streak,
-        new_badges=[],
+                await release()
+
+            answer = "".join(parts)
+            if cache_vector is not None and cached_answer is None:
+                await semantic_cache.put(in_.message, cache_vector, answer)
+
+            out = await _record_turn(user.id, user.name, ctx.conversation_id, in_.message, answer)
+            out.context_tokens = ctx.tokens
+            out.cached = cached_answer is not None
+            completed = True
+            yield _sse("done", out.dict(exclude={"answer"}))
+        finally:
+            # Zerwane połączenie → zwalniamy połączenie do OpenAI i nic nie zapisujemy
+            if stream is not None and not completed:
+                await stream.close()
+            await release()
+
+    return _SlotStreamingResponse(
+        event_stream(),
+        on_close=release,
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
     )
@@ -1,20 +1,58 @@
-from fastapi import APIRouter, Depends
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from sqlalchemy import and_, func, or_, select
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from app.db import get_db
-from app.models import Student
+from app.auth import get_current_user
+from app.config import LEADERBOARD_MAX_LIMIT
+from app.db import get_async_read_db
+from app.http_cache import response_cache
+from app.models import Student, XpBucket
+from app.principals import Principal
+from app.ranking import ranking
+from app.streak import local_today
+from app.xp_ledger import Window, bucket_start
 
 router = APIRouter(prefix="/leaderboard", tags=["leaderboard"])
 
 
-@router.get("")
-def leaderboard(limit: int = 10, db: Session = Depends(get_db)):
-    students = (
-        db.query(Student)
-        .order_by(Student.xp.desc())
+def _in_window(window: Window):
+    return and_(
+        XpBucket.period == window.value,
+        XpBucket.bucket_start == bucket_start(window, local_today()),
+    )
+
+
+async def _window_page(db: AsyncSession, window: Window, limit: int, offset: int):
+    # gotowe sumy z kubełków – bez skanowania dziennika
+    result = await db.execute(
+        select(XpBucket.student_id, Student.name, Student.level, XpBucket.xp)
+        .join(Student, Student.id == XpBucket.student_id)
+        .where(_in_window(window))
+        .order_by(XpBucket.xp.desc(), XpBucket.student_id.desc())
+        .offset(offset)
+        .limit(limit)
+    )
+    return [
+        {"id": sid, "name": name, "xp": xp, "level": level, "rank": offset + i + 1}
+        for i, (sid, name, level, xp) in enumerate(result.all())
+    ]
+
+
+async def _leaderboard_rows(db: AsyncSession, window: Window, limit: int, offset: int):
+    if window != Window.all:
+        return await _window_page(db, window, limit, offset)
+
+    if ranking.loaded:
+        return ranking.page(limit, offset)
+
+    # ranking jeszcze się ładuje (start aplikacji) – prosto z bazy
+    result = await db.execute(
+        select(Student)
+        .order_by(Student.xp.desc(), Student.id.desc())
+        .offset(offset)
         .limit(limit)
-        .all()
     )
+    students = result.scalars().all()
 
     return [
         {
@@ -22,6 +60,69 @@ def leaderboard(limit: int = 10, db: Session = Depends(get_db)):
             "name": s.name,
             "xp": s.xp,
             "level": s.level,
+            "rank": offset + i + 1,
         }
-        for s in students
+        for i, s in enumerate(students)
     ]
+
+
+@router.get("")
+async def leaderboard(
+    request: Request,
+    limit: int = Query(10, ge=1, le=LEADERBOARD_MAX_LIMIT),
+    offset: int = Query(0, ge=0),
+    window: Window = Window.all,
+    db: AsyncSession = Depends(get_async_read_db),
+):
+    # okresy zmieniają się też o północy, bez żadnej zmiany XP
+    period = None if window == Window.all else bucket_start(window, local_today())
+    key = ("leaderboard", window.value, period, limit, offset, response_cache.version)
+    return await response_cache.respond(
+        request, key, lambda: _leaderboard_rows(db, window, limit, offset)
+    )
+
+
+async def _window_rank(db: AsyncSession, window: Window, user: Principal) -> dict:
+    total = (
+        await db.execute(select(func.count()).select_from(XpBucket).where(_in_window(window)))
+    ).scalar_one()
+    mine = (
+        await db.execute(
+            select(XpBucket.xp).where(_in_window(window), XpBucket.student_id == user.id)
+        )
+    ).scalar()
+
+    if mine is None:
+        # w tym okresie jeszcze bez XP – poza rankingiem
+        return {"id": user.id, "name": user.name, "xp": 0, "rank": None, "total": total}
+
+    ahead = (
+        await db.execute(
+            select(func.count()).select_from(XpBucket).where(
+                _in_window(window),
+                or_(
+                    XpBucket.xp > mine,
+                    and_(XpBucket.xp == mine, XpBucket.student_id > user.id),
+                ),
+            )
+        )
+    ).scalar_one()
+    return {"id": user.id, "name": user.name, "xp": mine, "rank": ahead + 1, "total": total}
+
+
+@router.get("/me")
+async def my_rank(
+    window: Window = Window.all,
+    user: Principal = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_read_db),
+):
+    if window != Window.all:
+        return await _window_rank(db, window, user)
+
+    if not ranking.loaded:
+        raise HTTPException(status_code=503, detail="Ranking się ładuje, spróbuj za chwilę.")
+
+    row = ranking.rank_of(user.id)
+    if row is None:
+        raise HTTPException(status_code=404, detail="Brak ucznia w rankingu")
+    return row
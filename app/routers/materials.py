@@ -4,7 +4,7 @@ from fastapi import APIRouter
 from pydantic import BaseModel
 from typing import Optional, Dict
 
-from rag.engine import rebuild_rag_all
+from rag.engine import embedding_cache_stats, rebuild_rag_all
 
 router = APIRouter(prefix="/materials", tags=["Materials"])
 
@@ -18,6 +18,10 @@ class BuildResponse(BaseModel):
     knowledge: int
     tasks: int
     criteria: int
+    # przyrostowo: ile chunków doszło / zniknęło / zostało bez ponownego embedowania
+    added: int
+    removed: int
+    unchanged: int
 
 
 # Trzymamy nazwę "aktywnego" pliku tylko informacyjnie
@@ -43,3 +47,11 @@ def build_rag():
     """
     stats: Dict[str, int] = rebuild_rag_all()
     return BuildResponse(status="ok", **stats)
+
+
+@router.get("/embedding-cache")
+def get_embedding_cache_stats():
+    """
+    Trafienia, rozmiar i limit trwałego cache embeddingów.
+    """
+    return embedding_cache_stats()
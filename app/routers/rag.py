@@ -1,17 +1,26 @@
 # app/routers/rag.py
 
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, Depends, HTTPException
+from fastapi.concurrency import run_in_threadpool
 from pydantic import BaseModel
 from typing import List
 
-from openai import OpenAI
+from openai import RateLimitError
 
 from rag.engine import query_rag
+from app.llm_client import get_llm_client
+from app.singleflight import SingleFlight, request_key
+from app.admission import admission, rate_limited_client, too_many_requests
 from app.routers import materials  # importujemy moduł, nie samą zmienną
 
 
 router = APIRouter()
 
+RAG_MODEL = "gpt-4.1-mini"  # możesz zmienić na inny, jeśli chcesz
+
+# Cała klasa pyta o to samo zadanie → jedno wywołanie modelu
+_completion_flight = SingleFlight("rag_completion")
+
 
 # ---------------------------------------------------------
 # MODELE
@@ -28,8 +37,12 @@ class RAGQueryOut(BaseModel):
 # ---------------------------------------------------------
 # 📌 RAG QUERY – odpowiada na pytania ucznia w stylu Weroniki
 # ---------------------------------------------------------
-@router.post("/query", response_model=RAGQueryOut)
-def rag_query(data: RAGQueryIn):
+@router.post(
+    "/query",
+    response_model=RAGQueryOut,
+    dependencies=[Depends(rate_limited_client)],
+)
+async def rag_query(data: RAGQueryIn):
     """
     Odpowiada na pytania na podstawie aktualnie aktywnego materiału
     (ustawianego w /api/materials/activate).
@@ -45,7 +58,11 @@ def rag_query(data: RAGQueryIn):
         )
 
     # 1. Znajdź najlepsze fragmenty z bazy wektorowej
-    top_chunks = query_rag(data.question)
+    #    (Chroma + embedding są synchroniczne → threadpool)
+    try:
+        top_chunks = await run_in_threadpool(query_rag, data.question)
+    except RateLimitError:
+        raise too_many_requests("Limit OpenAI wyczerpany, spróbuj za chwilę.", 5)
 
     if not top_chunks:
         # nic sensownego nie znaleziono w materiale
@@ -76,16 +93,26 @@ Na podstawie tych fragmentów odpowiedz krok po kroku,
 ale zwięźle i zrozumiale dla licealisty. Jeśli czegoś brakuje, powiedz to wprost.
 """
 
-    client = OpenAI()  # klucz bierze z OPENAI_API_KEY ustawionego w systemie
-
-    completion = client.chat.completions.create(
-        model="gpt-4.1-mini",  # możesz zmienić na inny, jeśli chcesz
-        messages=[
-            {"role": "system", "content": system_msg},
-            {"role": "user", "content": user_prompt},
-        ],
-        temperature=0.3,
-    )
+    client = get_llm_client()  # współdzielony klient z pulą połączeń
+
+    messages = [
+        {"role": "system", "content": system_msg},
+        {"role": "user", "content": user_prompt},
+    ]
+
+    try:
+        completion = await _completion_flight.do(
+            request_key(RAG_MODEL, messages),
+            lambda: admission.call(
+                lambda: client.chat.completions.create(
+                    model=RAG_MODEL,
+                    messages=messages,
+                    temperature=0.3,
+                )
+            ),
+        )
+    except RateLimitError:
+        raise too_many_requests("Limit OpenAI wyczerpany, spróbuj za chwilę.", 5)
 
     answer_text = completion.choices[0].message.content.strip()
 
@@ -1,10 +1,21 @@
-from fastapi import APIRouter, HTTPException
-from pydantic import BaseModel
-from typing import List
-from datetime import date
-
-from app.db import SessionLocal
-from app.models import Student, ChatMessage, UserStreak
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, conlist
+from typing import List, Optional
+from datetime import date, datetime
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.auth import get_current_user
+from app.config import HISTORY_PAGE_SIZE, HISTORY_MAX_LIMIT, STATE_BATCH_MAX_IDS
+from app.db import get_async_db, get_async_read_db
+from app.history import decode_cursor, load_page, stream_ndjson
+from app.http_cache import response_cache
+from app.models import Student, UserStreak
+from app.principals import Principal
+from app.ranking import ranking
+from app.xp_ledger import award_xp
 
 router = APIRouter()
 
@@ -28,27 +39,28 @@ class XPUpdate(BaseModel):
 
 
 class MessageOut(BaseModel):
+    id: int
     role: str
     content: str
+    created_at: Optional[datetime]
 
 
 class ChatHistoryOut(BaseModel):
     user_id: int
     messages: List[MessageOut]
+    next_before: Optional[str] = None   # kursor do starszej strony; None = początek historii
 
 
 # =========================
 # 1. TWORZENIE UCZNIA
 # =========================
 @router.post("/create", response_model=UserOut)
-def create_user(payload: UserCreate):
-    db = SessionLocal()
-
+async def create_user(payload: UserCreate, db: AsyncSession = Depends(get_async_db)):
     student = Student(name=payload.name)
     db.add(student)
-    db.commit()
-    db.refresh(student)
-    db.close()
+    await db.commit()
+    await db.refresh(student)
+    ranking.update(student.id, student.xp, student.level, student.name)
 
     return UserOut(
         id=student.id,
@@ -61,11 +73,8 @@ def create_user(payload: UserCreate):
 # =========================
 # 2. POBIERANIE STANU UCZNIA
 # =========================
-@router.get("/state/{user_id}", response_model=UserOut)
-def get_user_state(user_id: int):
-    db = SessionLocal()
-    student = db.query(Student).filter(Student.id == user_id).first()
-    db.close()
+async def _user_state(db: AsyncSession, user_id: int) -> UserOut:
+    student = await db.get(Student, user_id)
 
     if not student:
         raise HTTPException(404, "Nie znaleziono użytkownika")
@@ -78,24 +87,98 @@ def get_user_state(user_id: int):
     )
 
 
+@router.get("/state/{user_id}", response_model=UserOut)
+async def get_user_state(user_id: int, request: Request,
+                         db: AsyncSession = Depends(get_async_read_db)):
+    # 304 / gotowa odpowiedź bez zapytania, dopóki XP ucznia się nie zmieni
+    key = ("state", user_id, response_cache.student_version(user_id))
+    return await response_cache.respond(request, key, lambda: _user_state(db, user_id))
+
+
+# ---- wielu uczniów naraz (panel nauczyciela) ----
+class StateBatchIn(BaseModel):
+    ids: conlist(int, min_items=1, max_items=STATE_BATCH_MAX_IDS)
+
+
+class StudentStateOut(BaseModel):
+    id: int
+    name: str
+    xp: int
+    level: int
+    current_streak: int
+    longest_streak: int
+    last_activity: Optional[date]
+
+
+class StateBatchOut(BaseModel):
+    students: List[StudentStateOut]   # po id rosnąco
+    missing: List[int]
+
+
+@router.post("/state/batch", response_model=StateBatchOut)
+async def get_states(payload: StateBatchIn, db: AsyncSession = Depends(get_async_read_db)):
+    ids = sorted(set(payload.ids))
+
+    # jedno zapytanie zamiast /state + /streak na każdego ucznia
+    result = await db.execute(
+        select(
+            Student.id, Student.name, Student.xp, Student.level,
+            UserStreak.current_streak, UserStreak.longest_streak, UserStreak.last_streak_date,
+        )
+        .outerjoin(UserStreak, UserStreak.student_id == Student.id)
+        .where(Student.id.in_(ids))
+        .order_by(Student.id.asc())
+    )
+
+    students = [
+        StudentStateOut(
+            id=sid,
+            name=name,
+            xp=xp or 0,
+            level=level or 1,
+            current_streak=current or 0,
+            longest_streak=longest or 0,
+            last_activity=last_date,
+        )
+        for sid, name, xp, level, current, longest, last_date in result.all()
+    ]
+    found = {s.id for s in students}
+
+    return StateBatchOut(students=students, missing=[i for i in ids if i not in found])
+
+
 # =========================
 # 3. HISTORIA CZATU
 # =========================
 @router.get("/history/{user_id}", response_model=ChatHistoryOut)
-def get_history(user_id: int):
-    db = SessionLocal()
-
-    messages = (
-        db.query(ChatMessage)
-        .filter(ChatMessage.user_id == user_id)
-        .order_by(ChatMessage.id.asc())
-        .all()
-    )
-    db.close()
+async def get_history(
+    user_id: int,
+    limit: int = Query(HISTORY_PAGE_SIZE, ge=1, le=HISTORY_MAX_LIMIT),
+    before: Optional[str] = None,
+    format: str = Query("json", pattern="^(json|ndjson)$"),
+    user: Principal = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_read_db),
+):
+    # uczeń widzi tylko swoją historię
+    if user.id != user_id:
+        raise HTTPException(403, "Brak dostępu do historii innego ucznia")
+
+    try:
+        cursor = decode_cursor(before) if before else None
+    except ValueError as e:
+        raise HTTPException(400, str(e))
+
+    if format == "ndjson":
+        # cała historia strumieniem, stała pamięć niezależnie od jej długości
+        return StreamingResponse(
+            stream_ndjson(user_id, cursor), media_type="application/x-ndjson"
+        )
 
+    messages, next_before = await load_page(db, user_id, limit, cursor)
     return ChatHistoryOut(
         user_id=user_id,
-        messages=[MessageOut(role=m.role, content=m.content) for m in messages]
+        messages=[MessageOut(**m) for m in messages],
+        next_before=next_before,
     )
 
 
@@ -103,23 +186,15 @@ def get_history(user_id: int):
 # 4. DODAWANIE XP
 # =========================
 @router.post("/{user_id}/add_xp", response_model=UserOut)
-def add_xp(user_id: int, payload: XPUpdate):
-    db = SessionLocal()
-
-    student = db.query(Student).filter(Student.id == user_id).first()
+async def add_xp(user_id: int, payload: XPUpdate, db: AsyncSession = Depends(get_async_db)):
+    student = await db.get(Student, user_id)
     if not student:
-        db.close()
         raise HTTPException(404, "Nie znaleziono użytkownika")
 
-    student.xp += payload.xp
-
-    # mechanika levelowania
-    while student.xp >= student.level * 100:
-        student.level += 1
-
-    db.commit()
-    db.refresh(student)
-    db.close()
+    # wpis w dzienniku XP; Student.xp i level liczone z niego w tej samej transakcji
+    await db.run_sync(lambda session: award_xp(session, user_id, payload.xp, "manual"))
+    await db.commit()
+    ranking.update(student.id, student.xp, student.level, student.name)
 
     return UserOut(
         id=student.id,
@@ -132,18 +207,16 @@ def add_xp(user_id: int, payload: XPUpdate):
 # =========================
 # 5. LEADERBOARD
 # =========================
-@router.get("/leaderboard", response_model=List[UserOut])
-def leaderboard():
-    db = SessionLocal()
+async def _top_users(db: AsyncSession) -> List[UserOut]:
+    if ranking.loaded:
+        return [UserOut(**row) for row in ranking.page(50)]
 
-    students = (
-        db.query(Student)
+    result = await db.execute(
+        select(Student)
         .order_by(Student.xp.desc())
         .limit(50)
-        .all()
     )
-
-    db.close()
+    students = result.scalars().all()
 
     return [
         UserOut(
@@ -156,6 +229,12 @@ def leaderboard():
     ]
 
 
+@router.get("/leaderboard", response_model=List[UserOut])
+async def leaderboard(request: Request, db: AsyncSession = Depends(get_async_read_db)):
+    key = ("user_leaderboard", response_cache.version)
+    return await response_cache.respond(request, key, lambda: _top_users(db))
+
+
 # ===============================
 # 6. STREAK API
 # ===============================
@@ -167,22 +246,17 @@ class StreakResponse(BaseModel):
 
 
 @router.get("/streak", response_model=StreakResponse)
-def get_streak(user_id: int):
-    db = SessionLocal()
-
-    student = db.query(Student).filter(Student.id == user_id).first()
+async def get_streak(user_id: int, db: AsyncSession = Depends(get_async_read_db)):
+    student = await db.get(Student, user_id)
     if not student:
-        db.close()
         raise HTTPException(status_code=404, detail="Użytkownik nie istnieje")
 
-    streak = (
-        db.query(UserStreak)
-        .filter(UserStreak.user_id == user_id)
-        .first()
+    result = await db.execute(
+        select(UserStreak).where(UserStreak.student_id == user_id)
     )
+    streak = result.scalars().first()
 
     if not streak:
-        db.close()
         return StreakResponse(
             user_id=user_id,
             current_streak=0,
@@ -190,12 +264,9 @@ def get_streak(user_id: int):
             last_streak_date=None
         )
 
-    response = StreakResponse(
+    return StreakResponse(
         user_id=user_id,
         current_streak=streak.current_streak,
         longest_streak=streak.longest_streak,
         last_streak_date=streak.last_streak_date
     )
-
-    db.close()
-    return response
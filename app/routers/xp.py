@@ -1,36 +1,94 @@
-from fastapi import APIRouter, HTTPException
-from pydantic import BaseModel
-from app.db import SessionLocal
-from app.models import User
+from typing import List, Optional
+
+from fastapi import APIRouter, Depends, HTTPException
+from pydantic import BaseModel, conlist, constr
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config import XP_BULK_MAX_ENTRIES
+from app.db import get_async_db
+from app.models import Student
+from app.ranking import ranking
+from app.xp_ledger import APPLIED, Award, award_xp, award_xp_bulk
 
 router = APIRouter()
 
+
 class AddXP(BaseModel):
     user_id: int
     xp: int
 
 
 @router.post("/add_xp")
-def add_xp(payload: AddXP):
-    db = SessionLocal()
-
-    user = db.query(User).filter(User.id == payload.user_id).first()
-    if not user:
-        db.close()
+async def add_xp(payload: AddXP, db: AsyncSession = Depends(get_async_db)):
+    student = await db.get(Student, payload.user_id)
+    if not student:
         raise HTTPException(404, "Nie znaleziono użytkownika")
 
-    user.xp += payload.xp
-
-    # poziomy: co 100 XP = level up
-    user.level = max(1, user.xp // 100 + 1)
-
-    db.commit()
-    db.refresh(user)
-    db.close()
+    xp, level = await db.run_sync(
+        lambda session: award_xp(session, payload.user_id, payload.xp, "manual")
+    )
+    await db.commit()
+    ranking.update(payload.user_id, xp, level, student.name)
 
     return {
         "status": "ok",
-        "user_id": user.id,
-        "new_xp": user.xp,
-        "level": user.level
+        "user_id": payload.user_id,
+        "new_xp": xp,
+        "level": level
     }
+
+
+# ---- hurtowo (skrypty oceniające całe karty pracy) ----
+class AwardIn(BaseModel):
+    student_id: int
+    amount: int
+    reason: constr(min_length=1, max_length=64) = "manual"
+    # ten sam klucz przy ponowieniu = wpis nie nalicza się drugi raz
+    idempotency_key: constr(min_length=1, max_length=128)
+
+
+class BulkAwardIn(BaseModel):
+    entries: conlist(AwardIn, min_items=1, max_items=XP_BULK_MAX_ENTRIES)
+
+
+class AwardOut(BaseModel):
+    idempotency_key: str
+    student_id: int
+    status: str   # applied | already_applied | unknown_student
+    xp: Optional[int]      # stan ucznia po całym żądaniu
+    level: Optional[int]
+
+
+class BulkAwardOut(BaseModel):
+    applied: int
+    results: List[AwardOut]   # w kolejności wpisów z żądania
+
+
+@router.post("/add_xp/bulk", response_model=BulkAwardOut)
+async def add_xp_bulk(payload: BulkAwardIn, db: AsyncSession = Depends(get_async_db)):
+    awards = [
+        Award(e.student_id, e.amount, e.reason, e.idempotency_key) for e in payload.entries
+    ]
+    try:
+        results = await db.run_sync(lambda session: award_xp_bulk(session, awards))
+        await db.commit()
+    except IntegrityError:
+        # równoległe żądanie z tym samym kluczem zdążyło pierwsze – ponów, dostaniesz already_applied
+        await db.rollback()
+        raise HTTPException(409, "Konflikt kluczy idempotencji, ponów żądanie")
+
+    applied = [r for r in results if r.status == APPLIED]
+    if applied:
+        # imiona dla rankingu – uczeń może się w nim pojawić pierwszy raz
+        names = dict((await db.execute(
+            select(Student.id, Student.name).where(Student.id.in_({r.student_id for r in applied}))
+        )).all())
+        for r in applied:
+            ranking.update(r.student_id, r.xp, r.level, names.get(r.student_id))
+
+    return BulkAwardOut(
+        applied=sum(r.status == APPLIED for r in results),
+        results=[AwardOut(**r._asdict()) for r in results],
+    )
@@ -35,6 +35,7 @@ class LoginResponse(BaseModel):
 # -----------------------------
 class ChatIn(BaseModel):
     message: str
+    no_cache: bool = False  # pomiń semantyczny cache odpowiedzi
 
 
 class ChatOut(BaseModel):
@@ -44,3 +45,6 @@ class ChatOut(BaseModel):
     level: int
     streak: int
     new_badges: List[str]
+    context_tokens: Optional[int] = None  # ile tokenów historii poszło do modelu
+    cached: bool = False                  # odpowiedź z semantycznego cache
+    saved: bool = True                    # False = zapis tury się nie udał (XP nieprzyznane)
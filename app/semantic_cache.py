@@ -0,0 +1,289 @@
+"""
+Semantyczny cache odpowiedzi czatu.
+
+Klucz = embedding pytania. Jeśli nowe pytanie jest wystarczająco podobne
+(cosinus >= próg) do pytania już zadanego, zwracamy zapamiętaną odpowiedź
+zamiast wołać model. Pamięć jest ograniczona (LRU + TTL), a wpisy są
+trwale zapisywane w lokalnym SQLite, więc przeżywają restart.
+"""
+import hashlib
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from fastapi.concurrency import run_in_threadpool
+
+from app.config import (
+    SEMANTIC_CACHE_ENABLED,
+    SEMANTIC_CACHE_PATH,
+    SEMANTIC_CACHE_MODEL,
+    SEMANTIC_CACHE_THRESHOLD,
+    SEMANTIC_CACHE_MAX_ENTRIES,
+    SEMANTIC_CACHE_TTL_SECONDS,
+)
+from app.admission import admission
+from app.llm_client import get_llm_client
+from app.singleflight import SingleFlight, request_key
+
+
+def normalize_question(text: str) -> str:
+    return " ".join(text.lower().split())
+
+
+class _Entry:
+    __slots__ = ("question", "answer", "vector", "created_at")
+
+    def __init__(self, question: str, answer: str, vector: np.ndarray, created_at: float):
+        self.question = question
+        self.answer = answer
+        self.vector = vector
+        self.created_at = created_at
+
+
+class SemanticCache:
+    def __init__(self, path: Path, model: str, threshold: float,
+                 max_entries: int, ttl_seconds: int):
+        self.path = Path(path)
+        self.model = model
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+
+        self._entries: "OrderedDict[str, _Entry]" = OrderedDict()
+        # klucz → created_at w kolejności powstania (TTL); _entries jest w kolejności LRU
+        self._by_age: "OrderedDict[str, float]" = OrderedDict()
+        # wektory wpisów jako bufor z zapasem: wiersze [0, len(_keys)) są zajęte,
+        # put dopisuje wiersz, eksmisja przenosi na jej miejsce ostatni
+        self._matrix: Optional[np.ndarray] = None
+        self._keys: List[str] = []
+        self._rows: Dict[str, int] = {}
+        self._conn: Optional[sqlite3.Connection] = None
+        self._db_lock = threading.Lock()
+        # wpisy + macierz: load działa w threadpoolu, lookup/store na event loopie
+        self._lock = threading.Lock()
+        self._loaded = False
+
+        self._embed_flight = SingleFlight("semantic_cache_embed")
+
+        self.hits = 0
+        self.misses = 0
+        self.bypassed = 0
+
+    # ---------------- persystencja ----------------
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self._conn = sqlite3.connect(str(self.path), check_same_thread=False)
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS semantic_cache ("
+                " key TEXT PRIMARY KEY, question TEXT NOT NULL, answer TEXT NOT NULL,"
+                " embedding BLOB NOT NULL, created_at REAL NOT NULL, last_used REAL NOT NULL)"
+            )
+            self._conn.commit()
+        return self._conn
+
+    def load(self) -> None:
+        """Wczytuje najświeższe wpisy z dysku (LRU wg last_used)."""
+        if self._loaded:
+            return
+        cutoff = time.time() - self.ttl_seconds
+        with self._db_lock:
+            conn = self._connect()
+            conn.execute("DELETE FROM semantic_cache WHERE created_at < ?", (cutoff,))
+            conn.commit()
+            rows = conn.execute(
+                "SELECT key, question, answer, embedding, created_at FROM semantic_cache"
+                " ORDER BY last_used DESC LIMIT ?",
+                (self.max_entries,),
+            ).fetchall()
+
+        with self._lock:
+            if self._loaded:
+                return
+            for key, question, answer, blob, created_at in reversed(rows):
+                vector = np.frombuffer(blob, dtype=np.float32)
+                self._entries[key] = _Entry(question, answer, vector, created_at)
+            for key, created_at in sorted(((k, e.created_at) for k, e in self._entries.items()),
+                                          key=lambda item: item[1]):
+                self._by_age[key] = created_at
+            self._matrix = None
+            self._loaded = True
+
+    def _persist(self, key: str, entry: _Entry, evicted: List[str]) -> None:
+        with self._db_lock:
+            conn = self._connect()
+            conn.execute(
+                "INSERT OR REPLACE INTO semantic_cache VALUES (?, ?, ?, ?, ?, ?)",
+                (key, entry.question, entry.answer, entry.vector.tobytes(),
+                 entry.created_at, time.time()),
+            )
+            conn.executemany("DELETE FROM semantic_cache WHERE key = ?", [(k,) for k in evicted])
+            conn.commit()
+
+    def _touch(self, key: str) -> None:
+        with self._db_lock:
+            conn = self._connect()
+            conn.execute("UPDATE semantic_cache SET last_used = ? WHERE key = ?", (time.time(), key))
+            conn.commit()
+
+    # ---------------- embedding + wyszukiwanie ----------------
+    async def embed(self, question: str) -> np.ndarray:
+        text = normalize_question(question)
+        response = await self._embed_flight.do(
+            request_key(self.model, text),
+            # embedding to też wywołanie upstream – w tym samym limicie równoległości co czat
+            lambda: admission.call(
+                lambda: get_llm_client().embeddings.create(model=self.model, input=text)
+            ),
+        )
+        vector = np.asarray(response.data[0].embedding, dtype=np.float32)
+        return vector / (np.linalg.norm(vector) or 1.0)
+
+    # ---------------- macierz wektorów (pod self._lock) ----------------
+    def _rebuild_matrix(self) -> None:
+        self._keys = list(self._entries.keys())
+        self._rows = {k: i for i, k in enumerate(self._keys)}
+        self._matrix = np.vstack([self._entries[k].vector for k in self._keys])
+
+    def _set_row(self, key: str, vector: np.ndarray) -> None:
+        if self._matrix is None:
+            return  # zbuduje ją pierwszy lookup
+        if vector.shape[0] != self._matrix.shape[1]:
+            self._matrix = None  # inny wymiar (zmiana modelu) → pełna przebudowa
+            return
+        row = self._rows.get(key)
+        if row is None:
+            row = len(self._keys)
+            if row == len(self._matrix):
+                grown = np.empty((max(16, 2 * row), self._matrix.shape[1]), dtype=np.float32)
+                grown[:row] = self._matrix[:row]
+                self._matrix = grown
+            self._keys.append(key)
+            self._rows[key] = row
+        self._matrix[row] = vector
+
+    def _drop_row(self, key: str) -> None:
+        if self._matrix is None:
+            return
+        row = self._rows.pop(key, None)
+        if row is None:
+            return
+        last = len(self._keys) - 1
+        if row != last:
+            moved = self._keys[last]
+            self._keys[row] = moved
+            self._rows[moved] = row
+            self._matrix[row] = self._matrix[last]
+        self._keys.pop()
+
+    def _remove(self, key: str) -> None:
+        del self._entries[key]
+        self._by_age.pop(key, None)
+        self._drop_row(key)
+
+    def _expire(self) -> None:
+        # od najstarszego; pierwszy niewygasły kończy przegląd
+        cutoff = time.time() - self.ttl_seconds
+        while self._by_age:
+            key, created_at = next(iter(self._by_age.items()))
+            if created_at >= cutoff:
+                break
+            self._remove(key)
+
+    def lookup(self, vector: np.ndarray) -> Optional[Tuple[str, str]]:
+        """(klucz, odpowiedź) najbardziej podobnego pytania powyżej progu albo None."""
+        with self._lock:
+            self._expire()
+
+            if self._entries:
+                if self._matrix is None:
+                    self._rebuild_matrix()
+
+                sims = self._matrix[:len(self._keys)] @ vector
+                best = int(np.argmax(sims))
+                if sims[best] >= self.threshold:
+                    key = self._keys[best]
+                    entry = self._entries[key]
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return key, entry.answer
+
+            self.misses += 1
+            return None
+
+    def store(self, question: str, vector: np.ndarray, answer: str) -> Tuple[str, _Entry, List[str]]:
+        """
+        Dodaje wpis do pamięci; zwraca argumenty do `_persist` (zapis na dysk
+        robi wołający, poza event loopem).
+        """
+        key = hashlib.sha1(normalize_question(question).encode("utf-8")).hexdigest()
+        vector = np.asarray(vector, dtype=np.float32)
+        entry = _Entry(question, answer, vector, time.time())
+        evicted = []
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            self._by_age[key] = entry.created_at
+            self._by_age.move_to_end(key)
+            self._set_row(key, vector)
+
+            while len(self._entries) > self.max_entries:
+                old_key = next(iter(self._entries))
+                self._remove(old_key)
+                evicted.append(old_key)
+
+        return key, entry, evicted
+
+    def stats(self) -> Dict[str, float]:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "bypassed": self.bypassed,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+    # ---------------- API dla routera ----------------
+    async def get(self, question: str):
+        """
+        Zwraca (answer | None, vector | None). Błąd embeddingu = miss,
+        czat ma działać dalej bez cache.
+        """
+        if not self._loaded:
+            await run_in_threadpool(self.load)
+        try:
+            vector = await self.embed(question)
+        except Exception as e:
+            print("[SemanticCache] Błąd embeddingu:", e)
+            self.misses += 1
+            return None, None
+
+        found = self.lookup(vector)
+        if found is None:
+            return None, vector
+
+        key, answer = found
+        await run_in_threadpool(self._touch, key)
+        return answer, vector
+
+    async def put(self, question: str, vector: np.ndarray, answer: str) -> None:
+        if vector is None or not answer:
+            return
+        key, entry, evicted = self.store(question, vector, answer)
+        await run_in_threadpool(self._persist, key, entry, evicted)
+
+
+semantic_cache: Optional[SemanticCache] = None
+if SEMANTIC_CACHE_ENABLED:
+    semantic_cache = SemanticCache(
+        path=SEMANTIC_CACHE_PATH,
+        model=SEMANTIC_CACHE_MODEL,
+        threshold=SEMANTIC_CACHE_THRESHOLD,
+        max_entries=SEMANTIC_CACHE_MAX_ENTRIES,
+        ttl_seconds=SEMANTIC_CACHE_TTL_SECONDS,
+    )
@@ -0,0 +1,107 @@
+"""
+Single-flight: równoległe identyczne wywołania (to samo pytanie, ten sam
+prompt) czekają na JEDNO wywołanie upstream i dostają ten sam wynik.
+
+`SingleFlight` jest dla kodu async (OpenAI), `SyncSingleFlight` dla kodu
+uruchamianego w threadpoolu (embedding w rag.engine).
+"""
+import asyncio
+import hashlib
+import json
+import threading
+from typing import Any, Awaitable, Callable, Dict, List, TypeVar
+
+T = TypeVar("T")
+
+_groups: List["_FlightStats"] = []
+
+
+def request_key(*parts: Any) -> str:
+    """Stabilny klucz z dowolnych danych serializowalnych do JSON."""
+    raw = json.dumps(parts, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class _FlightStats:
+    def __init__(self, name: str):
+        self.name = name
+        self.calls = 0       # faktyczne wywołania upstream
+        self.coalesced = 0   # requesty obsłużone cudzym wywołaniem
+        _groups.append(self)
+
+    def stats(self) -> Dict[str, int]:
+        return {"calls": self.calls, "coalesced": self.coalesced}
+
+
+class SingleFlight(_FlightStats):
+    def __init__(self, name: str):
+        super().__init__(name)
+        self._inflight: Dict[str, "asyncio.Future"] = {}
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[T]]) -> T:
+        task = self._inflight.get(key)
+
+        if task is None:
+            self.calls += 1
+            # Osobny task: rozłączenie pierwszego klienta nie anuluje pozostałych
+            task = asyncio.ensure_future(fn())
+            self._inflight[key] = task
+
+            def _done(t: "asyncio.Future") -> None:
+                self._inflight.pop(key, None)
+                if not t.cancelled():
+                    t.exception()  # oznacza wyjątek jako odebrany
+
+            task.add_done_callback(_done)
+        else:
+            self.coalesced += 1
+
+        return await asyncio.shield(task)
+
+
+class _Call:
+    __slots__ = ("event", "result", "error")
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SyncSingleFlight(_FlightStats):
+    def __init__(self, name: str):
+        super().__init__(name)
+        self._inflight: Dict[str, _Call] = {}
+        self._lock = threading.Lock()
+
+    def do(self, key: str, fn: Callable[[], T]) -> T:
+        with self._lock:
+            call = self._inflight.get(key)
+            leader = call is None
+            if leader:
+                call = _Call()
+                self._inflight[key] = call
+                self.calls += 1
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+            return call.result
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+            call.event.set()
+
+
+def singleflight_stats() -> Dict[str, Dict[str, int]]:
+    return {g.name: g.stats() for g in _groups}
@@ -1,11 +1,93 @@
-from datetime import date
+import asyncio
+import threading
+from datetime import date, datetime, time, timedelta, timezone
+from typing import Dict, Optional, Tuple
+from zoneinfo import ZoneInfo
+
+from sqlalchemy import event, update
 from sqlalchemy.orm import Session
+
+from app.config import STREAK_TIMEZONE
 from app.models import UserStreak
+from app.write_behind import writer
+
+TZ = ZoneInfo(STREAK_TIMEZONE)
+
+# Streak can change at most once per local day, so after the first message
+# of the day we remember the result and skip user_streaks entirely.
+# Entries become visible only after the write-behind transaction commits.
+_counted_day: Optional[date] = None
+_counted: Dict[int, int] = {}
+_counted_lock = threading.Lock()
+_PENDING_KEY = "streaks_counted_today"
+
+
+def local_today() -> date:
+    """Today in the school's timezone (STREAK_TIMEZONE), not UTC."""
+    return datetime.now(TZ).date()
+
+
+def local_date(utc_dt: datetime) -> date:
+    """Local day of a naive UTC timestamp (as stored in the DB)."""
+    return utc_dt.replace(tzinfo=timezone.utc).astimezone(TZ).date()
+
+
+def advance_streak(current: int, longest: int, last_date: Optional[date],
+                   today: date) -> Tuple[int, int, date]:
+    """Pure streak transition for one day of activity: (current, longest, last_date)."""
+    if last_date == today:
+        return current, longest, last_date
+
+    delta_days = (today - last_date).days if last_date else None
+
+    if delta_days == 1:
+        current += 1
+    else:
+        current = 1
+
+    return current, max(longest, current), today
+
+
+def _already_counted(student_id: int, today: date) -> Optional[int]:
+    global _counted_day
+    with _counted_lock:
+        if _counted_day != today:
+            _counted_day = today
+            _counted.clear()
+        return _counted.get(student_id)
 
 
-def update_streak_after_message(db: Session, student_id: int) -> int:
+def _mark_counted(db: Session, student_id: int, today: date, current: int) -> None:
+    db.info.setdefault(_PENDING_KEY, {})[student_id] = (today, current)
+
+
+@event.listens_for(Session, "after_commit")
+def _promote_counted(session: Session) -> None:
+    pending = session.info.pop(_PENDING_KEY, None)
+    if not pending:
+        return
+    with _counted_lock:
+        for student_id, (day, current) in pending.items():
+            if day == _counted_day:
+                _counted[student_id] = current
+
+
+@event.listens_for(Session, "after_rollback")
+def _drop_counted(session: Session) -> None:
+    session.info.pop(_PENDING_KEY, None)
+
+
+def update_streak_after_message(db: Session, student_id: int,
+                                today: Optional[date] = None) -> int:
     """Update streak for a student based on today's activity."""
-    today = date.today()
+    today = today or local_today()
+
+    current = _already_counted(student_id, today)
+    if current is not None:
+        return current
+    pending = db.info.get(_PENDING_KEY, {}).get(student_id)
+    if pending and pending[0] == today:
+        return pending[1]
 
     streak = db.query(UserStreak).filter(UserStreak.student_id == student_id).first()
     if not streak:
@@ -17,24 +99,57 @@ def update_streak_after_message(db: Session, student_id: int) -> int:
         )
         db.add(streak)
         db.flush()
+        _mark_counted(db, student_id, today, streak.current_streak)
         return streak.current_streak
 
-    last_date = streak.last_streak_date
+    if streak.last_streak_date != today:
+        (
+            streak.current_streak,
+            streak.longest_streak,
+            streak.last_streak_date,
+        ) = advance_streak(
+            streak.current_streak, streak.longest_streak, streak.last_streak_date, today
+        )
+        db.flush()
+
+    _mark_counted(db, student_id, today, streak.current_streak)
+    return streak.current_streak
 
-    if last_date == today:
-        return streak.current_streak
 
-    delta_days = (today - last_date).days if last_date else None
+# ---------------------------------------------------------
+# Nightly reset of broken streaks
+# ---------------------------------------------------------
+def reset_broken_streaks(db: Session, today: Optional[date] = None) -> int:
+    """Zero every streak whose last active day is before yesterday, in one UPDATE."""
+    today = today or local_today()
+    result = db.execute(
+        update(UserStreak)
+        .where(
+            UserStreak.current_streak > 0,
+            UserStreak.last_streak_date < today - timedelta(days=1),
+        )
+        .values(current_streak=0)
+    )
+    return result.rowcount
 
-    if delta_days == 1:
-        streak.current_streak += 1
-    else:
-        streak.current_streak = 1
 
-    if streak.current_streak > streak.longest_streak:
-        streak.longest_streak = streak.current_streak
+def _seconds_until_midnight() -> float:
+    now = datetime.now(TZ)
+    midnight = datetime.combine(now.date() + timedelta(days=1), time.min, tzinfo=TZ)
+    return (midnight - now).total_seconds()
 
-    streak.last_streak_date = today
-    db.flush()
 
-    return streak.current_streak
+async def reset_streaks_nightly() -> None:
+    """
+    Runs once at startup and then right after every local midnight.
+    Goes through write-behind, so the UPDATE is ordered with queued chat turns.
+    """
+    while True:
+        reset = []
+        try:
+            await writer.submit(lambda db: reset.append(reset_broken_streaks(db)), keys=[])
+            if reset:  # w trybie "buffered" submit nie czeka na zapis
+                print(f"[Streak] Wyzerowano {reset[0]} przerwanych streaków")
+        except Exception as e:
+            print("[Streak] Błąd nocnego resetu:", e)
+        await asyncio.sleep(_seconds_until_midnight() + 1)
@@ -0,0 +1,194 @@
+"""
+Write-behind z group commitem.
+
+Zamiast commitu (i fsync) na każdą turę czatu, mutacje trafiają do kolejki,
+a jeden wątek-pisarz zbiera je w batche (co WRITE_BEHIND_FLUSH_MS albo
+WRITE_BEHIND_MAX_BATCH operacji) i zapisuje w jednej transakcji.
+"""
+import asyncio
+import queue
+import threading
+import time
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy.orm import Session
+
+from app.config import (
+    WRITE_BEHIND_FLUSH_MS,
+    WRITE_BEHIND_MAX_BATCH,
+    WRITE_BEHIND_DURABILITY,
+)
+from app.db import SessionLocal
+
+
+class _Op:
+    __slots__ = ("apply", "keys", "loop", "future")
+
+    def __init__(self, apply: Callable[[Session], None], keys: Iterable[int],
+                 loop: Optional[asyncio.AbstractEventLoop],
+                 future: Optional["asyncio.Future"]):
+        self.apply = apply
+        self.keys = tuple(keys)
+        self.loop = loop
+        self.future = future
+
+
+def _resolve(op: _Op, error: Optional[BaseException]) -> None:
+    if op.future is None:
+        return
+
+    def _set():
+        if op.future.done():
+            return
+        if error is None:
+            op.future.set_result(None)
+        else:
+            op.future.set_exception(error)
+
+    op.loop.call_soon_threadsafe(_set)
+
+
+class WriteBehind:
+    def __init__(self, session_factory=SessionLocal,
+                 flush_ms: int = WRITE_BEHIND_FLUSH_MS,
+                 max_batch: int = WRITE_BEHIND_MAX_BATCH,
+                 durability: str = WRITE_BEHIND_DURABILITY):
+        self.session_factory = session_factory
+        self.flush_interval = flush_ms / 1000.0
+        self.max_batch = max_batch
+        self.durability = durability
+
+        self._queue: "queue.Queue[Optional[_Op]]" = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+        self._start_lock = threading.Lock()
+        # wołane po każdym batchu z kluczami (student_id), które zostały zapisane
+        self._on_settled: List[Callable[[Iterable[int], bool], None]] = []
+
+        self.batches = 0
+        self.ops = 0
+        self.failed_ops = 0
+        self.last_flush_ms = 0.0
+
+    def on_settled(self, callback: Callable[[Iterable[int], bool], None]) -> None:
+        self._on_settled.append(callback)
+
+    # ---------------- API ----------------
+    def start(self) -> None:
+        with self._start_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(
+                    target=self._run, name="write-behind", daemon=True
+                )
+                self._thread.start()
+
+    async def submit(self, apply: Callable[[Session], None], keys: Iterable[int] = ()) -> None:
+        """
+        Kolejkuje mutację. W trybie "commit" czeka, aż batch z nią zostanie
+        zacommitowany (albo rzuca wyjątek z zapisu).
+        """
+        self.start()
+
+        if self.durability == "commit":
+            loop = asyncio.get_running_loop()
+            future = loop.create_future()
+            self._queue.put(_Op(apply, keys, loop, future))
+            await future
+        else:
+            self._queue.put(_Op(apply, keys, None, None))
+
+    def close(self, timeout: float = 10.0) -> None:
+        """Dopisuje wszystko, co zostało w kolejce, i zatrzymuje wątek."""
+        if self._thread is not None and self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join(timeout)
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            "queued": self._queue.qsize(),
+            "batches": self.batches,
+            "ops": self.ops,
+            "failed_ops": self.failed_ops,
+            "avg_batch": round(self.ops / self.batches, 2) if self.batches else 0.0,
+            "last_flush_ms": round(self.last_flush_ms, 2),
+            "durability": self.durability,
+        }
+
+    # ---------------- wątek-pisarz ----------------
+    def _collect(self) -> Tuple[List[_Op], bool]:
+        first = self._queue.get()
+        if first is None:
+            return [], True
+
+        batch = [first]
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                op = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if op is None:
+                return batch, True
+            batch.append(op)
+        return batch, False
+
+    def _run(self) -> None:
+        stopping = False
+        while not stopping:
+            batch, stopping = self._collect()
+            if stopping:
+                # dopisujemy resztę kolejki przed wyjściem
+                while True:
+                    try:
+                        op = self._queue.get_nowait()
+                    except queue.Empty:
+                        break
+                    if op is not None:
+                        batch.append(op)
+            if batch:
+                self._flush(batch)
+
+    def _flush(self, batch: List[_Op]) -> None:
+        started = time.perf_counter()
+        db = self.session_factory()
+        try:
+            for op in batch:
+                op.apply(db)
+            db.commit()
+            results = [(op, None) for op in batch]
+        except Exception:
+            # Jedna zła operacja nie może zabić całego batcha – powtarzamy pojedynczo
+            db.rollback()
+            results = []
+            for op in batch:
+                try:
+                    op.apply(db)
+                    db.commit()
+                    results.append((op, None))
+                except Exception as e:
+                    db.rollback()
+                    self.failed_ops += 1
+                    print("[WriteBehind] Błąd zapisu:", e)
+                    results.append((op, e))
+        finally:
+            db.close()
+
+        self.batches += 1
+        self.ops += len(batch)
+        self.last_flush_ms = (time.perf_counter() - started) * 1000
+
+        for op, error in results:
+            try:
+                for callback in self._on_settled:
+                    try:
+                        callback(op.keys, error is None)
+                    except Exception as e:
+                        # błąd callbacku nie może zawiesić wołającego ani zabić wątku
+                        print("[WriteBehind] Błąd callbacku on_settled:", e)
+            finally:
+                _resolve(op, error)
+
+
+writer = WriteBehind()
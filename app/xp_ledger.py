@@ -0,0 +1,222 @@
+"""
+Dziennik XP.
+
+Każde przyznanie XP to nowy wiersz `XpEvent` (nic nie jest nadpisywane)
+i w tej samej transakcji:
+
+- podbicie kubełków dzień / tydzień / miesiąc w `XpBucket` – z nich
+  `/leaderboard?window=week` czyta gotowe sumy zamiast skanować historię,
+- aktualizacja `Student.xp` (suma dziennika) i poziomu.
+
+`rebuild_totals` przelicza `Student.xp` i kubełki od zera z dziennika.
+"""
+import argparse
+from datetime import date, datetime, timedelta
+from enum import Enum
+from typing import Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+from sqlalchemy import case, delete, func, insert, select, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+
+from app.models import Student, XpBucket, XpEvent
+from app.progress import next_level
+from app.streak import local_date, local_today
+
+OPENING_BALANCE = "opening_balance"
+
+
+class Window(str, Enum):
+    all = "all"
+    day = "day"
+    week = "week"
+    month = "month"
+
+
+BUCKET_PERIODS = (Window.day, Window.week, Window.month)
+
+
+def bucket_start(period: Window, day: date) -> date:
+    if period == Window.day:
+        return day
+    if period == Window.week:
+        return day - timedelta(days=day.weekday())   # od poniedziałku
+    if period == Window.month:
+        return day.replace(day=1)
+    raise ValueError(f"Brak kubełków dla okna {period}")
+
+
+def _insert(db: Session):
+    dialect = db.get_bind().dialect.name
+    return (postgresql if dialect == "postgresql" else sqlite).insert
+
+
+def _bump_buckets_many(db: Session, amounts: Dict[int, int], day: date) -> None:
+    """Jedno wielowierszowe INSERT ... ON CONFLICT DO UPDATE dla wszystkich uczniów i okresów."""
+    if not amounts:
+        return
+    stmt = _insert(db)(XpBucket).values([
+        {
+            "period": period.value,
+            "bucket_start": bucket_start(period, day),
+            "student_id": student_id,
+            "xp": amount,
+        }
+        for student_id, amount in amounts.items()
+        for period in BUCKET_PERIODS
+    ])
+    db.execute(stmt.on_conflict_do_update(
+        index_elements=["period", "bucket_start", "student_id"],
+        set_={"xp": XpBucket.xp + stmt.excluded.xp},
+    ))
+
+
+def _bump_buckets(db: Session, student_id: int, amount: int, day: date) -> None:
+    _bump_buckets_many(db, {student_id: amount}, day)
+
+
+def award_xp(db: Session, student_id: int, amount: int, reason: str,
+             when: Optional[datetime] = None, day: Optional[date] = None) -> Tuple[int, int]:
+    """
+    Zapisuje zdarzenie XP (bez commitu) i zwraca nowe (xp, level) ucznia.
+    `day` = dzień, do którego kubełków liczy się XP (domyślnie dziś w STREAK_TIMEZONE).
+    """
+    when = when or datetime.utcnow()
+    day = day or local_today()
+
+    db.add(XpEvent(student_id=student_id, amount=amount, reason=reason, created_at=when))
+    _bump_buckets(db, student_id, amount, day)
+
+    student = db.get(Student, student_id)
+    student.xp = (student.xp or 0) + amount
+    student.level = next_level(student.xp, student.level or 1)
+    return student.xp, student.level
+
+
+# ---------------------------------------------------------
+# 🔹 Hurtowe przyznawanie XP (idempotentne)
+# ---------------------------------------------------------
+APPLIED = "applied"
+ALREADY_APPLIED = "already_applied"
+UNKNOWN_STUDENT = "unknown_student"
+
+
+class Award(NamedTuple):
+    student_id: int
+    amount: int
+    reason: str
+    idempotency_key: str
+
+
+class AwardResult(NamedTuple):
+    idempotency_key: str
+    student_id: int
+    status: str
+    xp: Optional[int]
+    level: Optional[int]
+
+
+def award_xp_bulk(db: Session, awards: Sequence[Award],
+                  day: Optional[date] = None) -> List[AwardResult]:
+    """
+    Wiele wpisów w jednej transakcji (commit robi wołający). Klucz
+    idempotencji, który już jest w dzienniku (albo wcześniej w tym samym
+    żądaniu), nie jest naliczany drugi raz. Stałą liczbą zapytań:
+    dziennik, kubełki, xp i poziomy – po jednym poleceniu na całość.
+    """
+    when = datetime.utcnow()
+    day = day or local_today()
+
+    keys = {a.idempotency_key for a in awards}
+    seen = set(db.execute(
+        select(XpEvent.idempotency_key).where(XpEvent.idempotency_key.in_(keys))
+    ).scalars())
+    known = set(db.execute(
+        select(Student.id).where(Student.id.in_({a.student_id for a in awards}))
+    ).scalars())
+
+    statuses: List[str] = []
+    new_events: List[dict] = []
+    totals: Dict[int, int] = {}
+    for a in awards:
+        if a.idempotency_key in seen:
+            statuses.append(ALREADY_APPLIED)
+            continue
+        if a.student_id not in known:
+            statuses.append(UNKNOWN_STUDENT)
+            continue
+        seen.add(a.idempotency_key)
+        statuses.append(APPLIED)
+        new_events.append({
+            "student_id": a.student_id, "amount": a.amount, "reason": a.reason,
+            "idempotency_key": a.idempotency_key, "created_at": when,
+        })
+        totals[a.student_id] = totals.get(a.student_id, 0) + a.amount
+
+    if new_events:
+        db.execute(insert(XpEvent), new_events)
+        _bump_buckets_many(db, totals, day)
+
+        ids = list(totals)
+        db.execute(
+            update(Student)
+            .where(Student.id.in_(ids))
+            .values(xp=func.coalesce(Student.xp, 0) + case(totals, value=Student.id, else_=0))
+            .execution_options(synchronize_session=False)
+        )
+        # poziom w formie zamkniętej: max(level, xp // 100 + 1)
+        closed_form = Student.xp // 100 + 1
+        db.execute(
+            update(Student)
+            .where(Student.id.in_(ids), Student.xp >= 0)
+            .values(level=case((closed_form > Student.level, closed_form), else_=Student.level))
+            .execution_options(synchronize_session=False)
+        )
+
+    state = {
+        sid: (xp, level)
+        for sid, xp, level in db.execute(
+            select(Student.id, Student.xp, Student.level).where(Student.id.in_(known))
+        )
+    }
+    return [
+        AwardResult(a.idempotency_key, a.student_id, status, *state.get(a.student_id, (None, None)))
+        for a, status in zip(awards, statuses)
+    ]
+
+
+def rebuild_totals(db: Session) -> int:
+    """Przelicza Student.xp i kubełki z dziennika (naprawa po ręcznych zmianach)."""
+    totals = (
+        select(func.coalesce(func.sum(XpEvent.amount), 0))
+        .where(XpEvent.student_id == Student.id)
+        .scalar_subquery()
+    )
+    changed = db.execute(
+        update(Student).where(Student.xp != totals).values(xp=totals)
+    ).rowcount
+
+    db.execute(delete(XpBucket))
+    events = db.execute(
+        select(XpEvent.student_id, XpEvent.amount, XpEvent.created_at)
+        .where(XpEvent.reason != OPENING_BALANCE)
+    )
+    for student_id, amount, created_at in events:
+        _bump_buckets(db, student_id, amount, local_date(created_at))
+
+    for student in db.execute(select(Student)).scalars():
+        student.level = next_level(student.xp or 0, student.level or 1)
+
+    db.commit()
+    return changed
+
+
+if __name__ == "__main__":
+    from app.db import SessionLocal
+
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rebuild", action="store_true", help="przelicz Student.xp i kubełki z dziennika")
+    args = parser.parse_args()
+    if args.rebuild:
+        with SessionLocal() as session:
+            print(f"[XP] Poprawiono sumy XP u {rebuild_totals(session)} uczniów")
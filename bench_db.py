@@ -0,0 +1,134 @@
+"""
+Benchmark warstwy danych: sync (Session w threadpoolu) vs async (AsyncSession).
+
+Oba warianty wykonują te same zapytania na tej samej bazie i tym samym
+sprzęcie; requesty idą przez ASGI w procesie (bez sieci), więc mierzymy
+sam koszt obsługi endpointu. Wariant async woła zapytania routerów
+bezpośrednio, z pominięciem cache odpowiedzi HTTP (app/http_cache.py) –
+inaczej powtarzane /state i /leaderboard nie dotykałyby bazy.
+
+    python bench_db.py --requests 5000 --concurrency 200
+"""
+import argparse
+import asyncio
+import os
+import random
+import tempfile
+import time
+from pathlib import Path
+
+_tmp = Path(tempfile.mkdtemp(prefix="korepetytor-bench-"))
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{_tmp / 'bench.db'}")
+
+import httpx  # noqa: E402
+from fastapi import APIRouter, Depends, FastAPI, HTTPException  # noqa: E402
+from sqlalchemy import select  # noqa: E402
+from sqlalchemy.ext.asyncio import AsyncSession  # noqa: E402
+
+from app.db import (  # noqa: E402
+    ReadSessionLocal, SessionLocal, engine, dispose_engines, get_async_read_db,
+)
+from app.models import Base, Student  # noqa: E402
+from app.routers import user  # noqa: E402
+
+
+# ---------------------------------------------------------
+# 🔹 Wariant "przed": te same zapytania na synchronicznej sesji
+# ---------------------------------------------------------
+sync_router = APIRouter(prefix="/sync")
+
+
+@sync_router.get("/leaderboard")
+def sync_leaderboard(limit: int = 10):
+    db = ReadSessionLocal()
+    students = db.query(Student).order_by(Student.xp.desc()).limit(limit).all()
+    db.close()
+    return [{"id": s.id, "name": s.name, "xp": s.xp, "level": s.level} for s in students]
+
+
+@sync_router.get("/state/{user_id}", response_model=user.UserOut)
+def sync_state(user_id: int):
+    db = ReadSessionLocal()
+    student = db.query(Student).filter(Student.id == user_id).first()
+    db.close()
+    if not student:
+        raise HTTPException(404, "Nie znaleziono użytkownika")
+    return user.UserOut(id=student.id, name=student.name, xp=student.xp, level=student.level)
+
+
+# ---------------------------------------------------------
+# 🔹 Wariant "po": AsyncSession, bez cache odpowiedzi (zawsze do bazy)
+# ---------------------------------------------------------
+async_router = APIRouter(prefix="/async")
+
+
+@async_router.get("/leaderboard")
+async def async_leaderboard(limit: int = 10, db: AsyncSession = Depends(get_async_read_db)):
+    result = await db.execute(select(Student).order_by(Student.xp.desc()).limit(limit))
+    return [{"id": s.id, "name": s.name, "xp": s.xp, "level": s.level} for s in result.scalars()]
+
+
+@async_router.get("/state/{user_id}", response_model=user.UserOut)
+async def async_state(user_id: int, db: AsyncSession = Depends(get_async_read_db)):
+    return await user._user_state(db, user_id)
+
+
+def build_app() -> FastAPI:
+    bench_app = FastAPI()
+    bench_app.include_router(sync_router)
+    bench_app.include_router(async_router)
+    return bench_app
+
+
+def seed(students: int) -> None:
+    Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    if db.query(Student).count() == 0:
+        db.bulk_save_objects([
+            Student(
+                name=f"Uczeń {i}",
+                email=f"uczen{i}@example.com",
+                hashed_password="-",
+                xp=random.randint(0, 5000),
+                level=1,
+            )
+            for i in range(students)
+        ])
+        db.commit()
+    db.close()
+
+
+async def run(client: httpx.AsyncClient, paths, total: int, concurrency: int) -> float:
+    sem = asyncio.Semaphore(concurrency)
+
+    async def one(i: int):
+        async with sem:
+            r = await client.get(paths[i % len(paths)])
+            r.raise_for_status()
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(total)))
+    return total / (time.perf_counter() - started)
+
+
+async def main(args) -> None:
+    seed(args.students)
+    ids = [random.randint(1, args.students) for _ in range(1000)]
+
+    transport = httpx.ASGITransport(app=build_app())
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        for variant in ("sync", "async"):
+            paths = [f"/{variant}/leaderboard?limit=20"] + [f"/{variant}/state/{i}" for i in ids]
+            await run(client, paths, min(200, args.requests), args.concurrency)  # rozgrzewka
+            rps = await run(client, paths, args.requests, args.concurrency)
+            print(f"{variant:>5}: {rps:8.1f} req/s  ({args.requests} req, concurrency {args.concurrency})")
+
+    await dispose_engines()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--concurrency", type=int, default=200)
+    parser.add_argument("--students", type=int, default=10000)
+    asyncio.run(main(parser.parse_args()))
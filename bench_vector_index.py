@@ -0,0 +1,222 @@
+"""
+Benchmark backendów wektorowych RAG: Chroma (HNSW) vs NumPy (mmap, dokładne top-k).
+
+Oba backendy dostają te same wektory i te same zapytania (zapisane wektory
+z lekkim szumem – bez wołania API embeddingów). Każdy backend działa
+w osobnym procesie, więc RSS nie miesza się między nimi. Raportujemy
+p50/p95/p99 czasu zapytania, RSS po otwarciu i po zapytaniach oraz
+recall@k Chromy względem dokładnego wyniku NumPy.
+
+    python bench_vector_index.py                         # kolekcja z vectorstore/
+    python bench_vector_index.py --synthetic 5000 --dims 3072
+    python bench_vector_index.py --dtype float16 --where kind=tasks
+    python bench_vector_index.py --check                 # poprawność NumPy (bez Chromy)
+"""
+import argparse
+import multiprocessing as mp
+import resource
+import statistics
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+from rag.vector_index import POINTER_CHECK_SECONDS, NumpyIndex
+
+BASE_DIR = Path(__file__).resolve().parent
+COLLECTION_NAME = "korepetytor_materials"
+KINDS = ("knowledge", "tasks", "criteria")
+
+
+def rss_mib() -> float:
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024   # Linux: KiB
+
+
+# ---------------------------------------------------------
+# 🔹 Dane
+# ---------------------------------------------------------
+def seed_synthetic(path: Path, chunks: int, dims: int) -> None:
+    import chromadb
+
+    rng = np.random.default_rng(0)
+    collection = chromadb.PersistentClient(path=str(path)).get_or_create_collection(
+        COLLECTION_NAME, embedding_function=None
+    )
+    for start in range(0, chunks, 1000):
+        n = min(1000, chunks - start)
+        vectors = rng.normal(size=(n, dims)).astype(np.float32)
+        vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+        collection.add(
+            ids=[f"chunk-{i}" for i in range(start, start + n)],
+            documents=[f"chunk {i}" for i in range(start, start + n)],
+            metadatas=[{"kind": KINDS[i % 3], "source": "synthetic"} for i in range(start, start + n)],
+            embeddings=vectors.tolist(),
+        )
+
+
+def export(chroma_path: Path, index_dir: Path, dtype: str):
+    import chromadb
+
+    collection = chromadb.PersistentClient(path=str(chroma_path)).get_collection(
+        COLLECTION_NAME, embedding_function=None
+    )
+    data = collection.get(include=["documents", "metadatas", "embeddings"])
+    NumpyIndex(index_dir, dtype=dtype).build(
+        data["ids"], data["documents"], data["metadatas"], data["embeddings"]
+    )
+    return np.asarray(data["embeddings"], dtype=np.float32)
+
+
+def make_queries(vectors: np.ndarray, count: int) -> np.ndarray:
+    rng = np.random.default_rng(1)
+    picked = vectors[rng.integers(0, len(vectors), size=count)]
+    noisy = picked + rng.normal(scale=0.02, size=picked.shape).astype(np.float32)
+    return noisy / np.linalg.norm(noisy, axis=1, keepdims=True)
+
+
+# ---------------------------------------------------------
+# 🔹 Pomiar (w osobnym procesie)
+# ---------------------------------------------------------
+def measure(backend: str, store: str, queries_path: str, k: int, where, dtype: str, out) -> None:
+    queries = np.load(queries_path)
+    baseline = rss_mib()
+
+    opened = time.perf_counter()
+    if backend == "chroma":
+        import chromadb
+
+        collection = chromadb.PersistentClient(path=store).get_collection(
+            COLLECTION_NAME, embedding_function=None
+        )
+
+        def search(q):
+            return collection.query(query_embeddings=[q.tolist()], n_results=k, where=where)["ids"][0]
+    else:
+        index = NumpyIndex(Path(store), dtype=dtype)
+
+        def search(q):
+            return [hit.id for hit in index.query(q, n_results=k, where=where)]
+
+    search(queries[0])   # rozgrzewka: otwarcie indeksu, zimne strony
+    open_seconds = time.perf_counter() - opened
+    rss_open = rss_mib()
+
+    latencies, results = [], []
+    for q in queries:
+        started = time.perf_counter()
+        results.append(search(q))
+        latencies.append((time.perf_counter() - started) * 1000)
+
+    out.put({
+        "backend": backend,
+        "open_s": round(open_seconds, 3),
+        "p50_ms": round(statistics.median(latencies), 3),
+        "p95_ms": round(float(np.percentile(latencies, 95)), 3),
+        "p99_ms": round(float(np.percentile(latencies, 99)), 3),
+        "rss_open_mib": round(rss_open - baseline, 1),
+        "rss_after_mib": round(rss_mib() - baseline, 1),
+        "results": results,
+    })
+
+
+def run(backend: str, *args) -> dict:
+    ctx = mp.get_context("spawn")
+    out = ctx.Queue()
+    process = ctx.Process(target=measure, args=(backend, *args, out))
+    process.start()
+    report = out.get()
+    process.join()
+    return report
+
+
+def check() -> None:
+    """Top-k i filtry NumPy vs brute force, w obu typach wektorów (bez Chromy)."""
+    rng = np.random.default_rng(2)
+    vectors = rng.normal(size=(500, 64)).astype(np.float32)
+    ids = [f"chunk-{i}" for i in range(len(vectors))]
+    metadatas = [{"kind": KINDS[i % 3]} for i in range(len(vectors))]
+    normalized = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+    kinds = np.array([m["kind"] for m in metadatas])
+
+    for dtype in ("float32", "float16"):
+        index = NumpyIndex(Path(tempfile.mkdtemp(prefix="korepetytor-check-")), dtype=dtype)
+        index.build(ids, ids, metadatas, vectors)
+        for q in make_queries(vectors, 20):
+            expected = np.argsort(-(normalized @ q))[:5]
+            assert [h.id for h in index.query(q, 5)] == [ids[i] for i in expected], dtype
+
+            scores = np.where(kinds == "tasks", normalized @ q, -np.inf)
+            expected = np.argsort(-scores)[:5]
+            got = index.query(q, 5, where={"kind": "tasks"})
+            assert [h.id for h in got] == [ids[i] for i in expected], dtype
+
+            # filtr bez dopasowań i nieznane pole → pusto, nie wyjątek
+            assert index.query(q, 5, where={"kind": "zz"}) == [], dtype
+            assert index.query(q, 5, where={"nope": 1}) == [], dtype
+
+        # przebudowa w innym procesie: czytelnik widzi nową wersję po sprawdzeniu CURRENT
+        reader = NumpyIndex(index.directory, dtype=dtype)
+        assert reader.count() == len(ids), dtype
+        index.build(ids[:10], ids[:10], metadatas[:10], vectors[:10])
+        assert index.count() == 10, dtype
+        time.sleep(POINTER_CHECK_SECONDS)
+        assert reader.count() == 10, dtype
+        print(f"check {dtype}: OK")
+
+
+def main(args) -> None:
+    if args.check:
+        check()
+        return
+
+    tmp = Path(tempfile.mkdtemp(prefix="korepetytor-vectors-"))
+    chroma_path = BASE_DIR / "vectorstore"
+    if args.synthetic:
+        chroma_path = tmp / "chroma"
+        print(f"Seeding {args.synthetic} synthetic chunks ({args.dims} dims)...")
+        seed_synthetic(chroma_path, args.synthetic, args.dims)
+
+    index_dir = tmp / "numpy"
+    vectors = export(chroma_path, index_dir, args.dtype)
+    if not len(vectors):
+        raise SystemExit("Kolekcja jest pusta – zbuduj RAG albo użyj --synthetic")
+    print(f"{len(vectors)} chunks × {vectors.shape[1]} dims")
+
+    queries_path = tmp / "queries.npy"
+    np.save(queries_path, make_queries(vectors, args.queries))
+
+    where = dict([args.where.split("=", 1)]) if args.where else None
+    reports = [
+        run(backend, store, str(queries_path), args.k, where, args.dtype)
+        for backend, store in (("chroma", str(chroma_path)), ("numpy", str(index_dir)))
+    ]
+
+    exact = reports[1]["results"]
+    recall = statistics.mean(
+        len(set(got) & set(want)) / max(1, len(want))
+        for got, want in zip(reports[0]["results"], exact)
+    )
+    for report in reports:
+        report.pop("results")
+        print(report)
+    print(f"chroma recall@{args.k} vs exact: {recall:.4f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--synthetic", type=int, default=0, help="liczba losowych chunków zamiast vectorstore/")
+    parser.add_argument("--dims", type=int, default=3072)
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--dtype", choices=("float32", "float16"), default="float32")
+    parser.add_argument("--where", help="filtr metadanych, np. kind=tasks")
+    parser.add_argument("--check", action="store_true", help="tylko sprawdź poprawność indeksu NumPy")
+    main(parser.parse_args())
@@ -5,6 +5,8 @@ from langchain_community.document_loaders import PyPDFLoader
 from langchain_community.vectorstores import Chroma
 from langchain_openai import OpenAIEmbeddings
 
+from rag.embedding_cache import CachedEmbeddings
+
 DATA_DIR = os.path.join(os.path.dirname(__file__), "data")
 DB_DIR = os.path.join(os.path.dirname(__file__), "db")
 
@@ -40,12 +42,14 @@ def build_embeddings():
         shutil.rmtree(DB_DIR)
 
     print("🧠 Building new vector DB...")
+    embeddings = CachedEmbeddings(OpenAIEmbeddings())
     Chroma.from_documents(
         chunks,
-        OpenAIEmbeddings(),
+        embeddings,
         persist_directory=DB_DIR
     )
 
+    print(f"💾 Embedding cache: {embeddings.stats()}")
     print("✅ DONE! Embedding database rebuilt.")
 
 if __name__ == "__main__":
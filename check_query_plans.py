@@ -0,0 +1,156 @@
+"""
+Regresja planów zapytań: EXPLAIN QUERY PLAN dla gorących zapytań na
+zasianej bazie (domyślnie 1M wiadomości). Kończy się kodem 1, jeśli
+któreś zapytanie robi pełny skan tabeli albo sortuje w tymczasowym
+B-drzewie zamiast iść po indeksie.
+
+    python check_query_plans.py --messages 1000000 --students 5000
+
+Baza jest tworzona z `Base.metadata`, więc sprawdzamy dokładnie indeksy
+zadeklarowane w app/models.py (migrations/004 tworzy te same).
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import date, datetime, timedelta
+from pathlib import Path
+
+_tmp = Path(tempfile.mkdtemp(prefix="korepetytor-plans-"))
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{_tmp / 'plans.db'}")
+
+from sqlalchemy import select, text, tuple_  # noqa: E402
+
+from app.db import engine  # noqa: E402
+from app.models import Base, ChatMessage, Conversation, Student, UserStreak, XpBucket  # noqa: E402
+
+SEED_BATCH = 50_000
+WEEK = date(2025, 1, 6)
+
+
+def seed(students: int, messages: int) -> None:
+    Base.metadata.create_all(bind=engine)
+    started = time.perf_counter()
+    base_time = datetime(2025, 1, 1)
+
+    with engine.begin() as conn:
+        conn.execute(Student.__table__.insert(), [
+            {
+                "id": i, "name": f"Uczeń {i}", "email": f"uczen{i}@example.com",
+                "hashed_password": "-", "xp": random.randint(0, 5000), "level": 1,
+                "is_active": True, "is_tester": False, "token_version": 0,
+            }
+            for i in range(1, students + 1)
+        ])
+        conn.execute(Conversation.__table__.insert(), [
+            {"id": i, "student_id": i} for i in range(1, students + 1)
+        ])
+        conn.execute(UserStreak.__table__.insert(), [
+            {"student_id": i, "current_streak": 1, "longest_streak": 1}
+            for i in range(1, students + 1)
+        ])
+        conn.execute(XpBucket.__table__.insert(), [
+            {"period": "week", "bucket_start": WEEK, "student_id": i, "xp": random.randint(0, 500)}
+            for i in range(1, students + 1)
+        ])
+
+        for start in range(0, messages, SEED_BATCH):
+            rows = []
+            for n in range(start, min(start + SEED_BATCH, messages)):
+                student_id = random.randint(1, students)
+                rows.append({
+                    "student_id": student_id,
+                    "conversation_id": student_id,
+                    "role": "user" if n % 2 == 0 else "assistant",
+                    "content": "Ile moli wody jest w 36 g H2O?",
+                    "created_at": base_time + timedelta(seconds=n),
+                })
+            conn.execute(ChatMessage.__table__.insert(), rows)
+
+        conn.execute(text("ANALYZE"))
+
+    print(f"seed: {students} uczniów, {messages} wiadomości "
+          f"({time.perf_counter() - started:.1f} s)")
+
+
+def hot_queries(student_id: int):
+    """Te same zapytania, które wykonują endpointy (app/context.py, routers/*)."""
+    return {
+        "chat: kontekst rozmowy": (
+            select(ChatMessage)
+            .where(ChatMessage.student_id == student_id, ChatMessage.id > 1000)
+            .order_by(ChatMessage.created_at.desc(), ChatMessage.id.desc())
+            .limit(200)
+        ),
+        "chat: rozmowa ucznia": (
+            select(Conversation).where(Conversation.student_id == student_id)
+        ),
+        "chat: streak ucznia": (
+            select(UserStreak).where(UserStreak.student_id == student_id)
+        ),
+        "user: historia (strona po kursorze)": (
+            select(ChatMessage.id, ChatMessage.role, ChatMessage.content, ChatMessage.created_at)
+            .where(
+                ChatMessage.student_id == student_id,
+                tuple_(ChatMessage.created_at, ChatMessage.id) < tuple_(datetime(2025, 1, 5), 10**9),
+            )
+            .order_by(ChatMessage.created_at.desc(), ChatMessage.id.desc())
+            .limit(51)
+        ),
+        "user: historia (NDJSON)": (
+            select(ChatMessage.id, ChatMessage.role, ChatMessage.content, ChatMessage.created_at)
+            .where(ChatMessage.student_id == student_id)
+            .order_by(ChatMessage.created_at.asc(), ChatMessage.id.asc())
+        ),
+        "leaderboard": (
+            select(Student).order_by(Student.xp.desc(), Student.id.desc()).limit(50)
+        ),
+        "leaderboard?window=week": (
+            select(XpBucket.student_id, Student.name, Student.level, XpBucket.xp)
+            .join(Student, Student.id == XpBucket.student_id)
+            .where(XpBucket.period == "week", XpBucket.bucket_start == WEEK)
+            .order_by(XpBucket.xp.desc(), XpBucket.student_id.desc())
+            .limit(50)
+        ),
+        "auth: logowanie": (
+            select(Student).where(Student.email == "uczen1@example.com")
+        ),
+    }
+
+
+def plan_problems(plan_rows) -> list:
+    problems = []
+    for row in plan_rows:
+        detail = row[-1]
+        if detail.startswith("SCAN") and "USING" not in detail:
+            problems.append(detail)
+        if "USE TEMP B-TREE" in detail:
+            problems.append(detail)
+    return problems
+
+
+def main(args) -> int:
+    seed(args.students, args.messages)
+
+    failed = 0
+    with engine.connect() as conn:
+        for name, query in hot_queries(student_id=args.students // 2).items():
+            sql = str(query.compile(engine, compile_kwargs={"literal_binds": True}))
+            plan = conn.execute(text(f"EXPLAIN QUERY PLAN {sql}")).fetchall()
+            problems = plan_problems(plan)
+
+            status = "FAIL" if problems else "ok"
+            print(f"[{status:>4}] {name}: " + " | ".join(row[-1] for row in plan))
+            failed += bool(problems)
+
+    print(f"{failed} zapytań bez indeksu" if failed else "wszystkie zapytania idą po indeksach")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--messages", type=int, default=1_000_000)
+    parser.add_argument("--students", type=int, default=5000)
+    sys.exit(main(parser.parse_args()))
@@ -0,0 +1,3 @@
+-- Kroczące streszczenia rozmów (kontekst czatu z budżetem tokenów)
+ALTER TABLE conversations ADD COLUMN summary TEXT;
+ALTER TABLE conversations ADD COLUMN summary_upto_id INTEGER;
@@ -0,0 +1,2 @@
+-- Wersja tokenów ucznia: podbicie unieważnia wszystkie wydane JWT
+ALTER TABLE students ADD COLUMN token_version INTEGER NOT NULL DEFAULT 0;
@@ -0,0 +1,49 @@
+-- Indeksy pod najgorętsze zapytania (można puścić na działającej bazie:
+-- CREATE INDEX w trybie WAL nie blokuje czytelników, tylko innych pisarzy).
+
+-- chat(): WHERE student_id = ? ORDER BY created_at DESC, id DESC LIMIT n
+CREATE INDEX IF NOT EXISTS ix_chat_messages_student_created
+    ON chat_messages (student_id, created_at, id);
+
+-- leaderboard: ORDER BY xp DESC LIMIT n
+CREATE INDEX IF NOT EXISTS ix_students_xp ON students (xp);
+
+-- kontekst czatu: jedna rozmowa na ucznia (unikalny indeks – równoległe
+-- pierwsze requesty nie tworzą duplikatów). Duplikaty scalamy do najstarszej
+-- rozmowy: tę zwracało dotąd zapytanie bez ORDER BY (najniższy id).
+UPDATE chat_messages
+SET conversation_id = (
+    SELECT MIN(c2.id) FROM conversations c1
+    JOIN conversations c2 ON c2.student_id = c1.student_id
+    WHERE c1.id = chat_messages.conversation_id
+)
+WHERE conversation_id IN (
+    SELECT id FROM conversations
+    WHERE id NOT IN (SELECT MIN(id) FROM conversations GROUP BY student_id)
+);
+
+DELETE FROM conversations
+WHERE id NOT IN (SELECT MIN(id) FROM conversations GROUP BY student_id);
+
+-- wcześniejsza wersja tej migracji tworzyła zwykły indeks o tej samej nazwie
+DROP INDEX IF EXISTS ix_conversations_student_id;
+CREATE UNIQUE INDEX IF NOT EXISTS ix_conversations_student_id ON conversations (student_id);
+
+-- user_streaks.student_id ma być unikalne – najpierw usuwamy duplikaty
+-- (zostaje wiersz z najnowszą datą streaka, przy remisie – najnowszy id)
+DELETE FROM user_streaks
+WHERE id NOT IN (
+    SELECT id FROM (
+        SELECT id,
+               ROW_NUMBER() OVER (
+                   PARTITION BY student_id
+                   ORDER BY last_streak_date DESC, id DESC
+               ) AS rn
+        FROM user_streaks
+    )
+    WHERE rn = 1
+);
+
+CREATE UNIQUE INDEX IF NOT EXISTS ix_user_streaks_student_id ON user_streaks (student_id);
+
+ANALYZE;
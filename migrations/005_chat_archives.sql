@@ -0,0 +1,18 @@
+-- Archiwum starych wiadomości czatu (app/archive.py)
+CREATE TABLE IF NOT EXISTS chat_archives (
+    id INTEGER PRIMARY KEY,
+    student_id INTEGER REFERENCES students (id),
+    conversation_id INTEGER REFERENCES conversations (id),
+    first_message_id INTEGER NOT NULL,
+    last_message_id INTEGER NOT NULL,
+    first_created_at DATETIME NOT NULL,
+    last_created_at DATETIME NOT NULL,
+    message_count INTEGER NOT NULL,
+    codec VARCHAR NOT NULL DEFAULT 'zlib',
+    raw_bytes INTEGER NOT NULL,
+    payload BLOB NOT NULL,
+    created_at DATETIME
+);
+
+CREATE INDEX IF NOT EXISTS ix_chat_archives_id ON chat_archives (id);
+CREATE INDEX IF NOT EXISTS ix_chat_archives_student_id ON chat_archives (student_id);
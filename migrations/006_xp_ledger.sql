@@ -0,0 +1,27 @@
+-- Dziennik XP + kubełki czasowe (app/xp_ledger.py)
+CREATE TABLE IF NOT EXISTS xp_events (
+    id INTEGER PRIMARY KEY,
+    student_id INTEGER NOT NULL REFERENCES students (id),
+    amount INTEGER NOT NULL,
+    reason VARCHAR NOT NULL,
+    created_at DATETIME NOT NULL
+);
+CREATE INDEX IF NOT EXISTS ix_xp_events_id ON xp_events (id);
+CREATE INDEX IF NOT EXISTS ix_xp_events_student_id ON xp_events (student_id);
+
+CREATE TABLE IF NOT EXISTS xp_buckets (
+    period VARCHAR NOT NULL,
+    bucket_start DATE NOT NULL,
+    student_id INTEGER NOT NULL REFERENCES students (id),
+    xp INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (period, bucket_start, student_id)
+);
+CREATE INDEX IF NOT EXISTS ix_xp_buckets_window_xp ON xp_buckets (period, bucket_start, xp, student_id);
+
+-- Dotychczasowe XP jako saldo otwarcia, żeby suma dziennika = students.xp.
+-- Nie trafia do kubełków – to nie jest XP zdobyte w bieżącym okresie.
+INSERT INTO xp_events (student_id, amount, reason, created_at)
+SELECT s.id, s.xp, 'opening_balance', CURRENT_TIMESTAMP
+FROM students s
+WHERE s.xp <> 0
+  AND NOT EXISTS (SELECT 1 FROM xp_events e WHERE e.student_id = s.id);
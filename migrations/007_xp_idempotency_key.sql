@@ -0,0 +1,3 @@
+-- Klucz idempotencji dla hurtowego przyznawania XP (POST /add_xp/bulk)
+ALTER TABLE xp_events ADD COLUMN idempotency_key VARCHAR;
+CREATE UNIQUE INDEX IF NOT EXISTS ix_xp_events_idempotency_key ON xp_events (idempotency_key);
@@ -0,0 +1,259 @@
+"""
+Równoległe, świadome limitów embedowanie chunków przy budowie indeksu RAG.
+
+- chunki idą w batchach ograniczonych liczbą tokenów i wejść,
+- najwyżej EMBED_CONCURRENCY batchy naraz; po 429 współbieżność spada
+  o połowę i odrasta po jednym przy kolejnych sukcesach,
+- wspólny budżet zapytań i tokenów na minutę (EMBED_RPM / EMBED_TPM),
+  a 429 wstrzymuje wszystkie wątki na Retry-After (albo backoff wykładniczy),
+- gotowy batch od razu trafia do `write` (collection.add) – pamięć nie rośnie
+  z rozmiarem materiałów, a przerwana budowa zostawia w Chroma wszystko,
+  co zdążyło się zapisać. Id chunków są hashami treści (rag/engine.py), więc
+  ponowne uruchomienie embeduje tylko to, czego w kolekcji jeszcze nie ma.
+"""
+import random
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Callable, Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple
+
+import openai
+
+from app.config import (
+    EMBED_BATCH_MAX_INPUTS,
+    EMBED_BATCH_MAX_TOKENS,
+    EMBED_CONCURRENCY,
+    EMBED_MAX_RETRIES,
+    EMBED_RPM,
+    EMBED_TPM,
+)
+
+try:
+    import tiktoken
+    _encoding = tiktoken.get_encoding("cl100k_base")   # kodowanie modeli text-embedding-3
+except Exception:  # tiktoken jest opcjonalny – wtedy liczymy z przybliżenia
+    _encoding = None
+
+MAX_BACKOFF_SECONDS = 60.0
+
+Item = Tuple[str, str, Dict[str, Any]]                  # (id, tekst, metadane)
+Writer = Callable[[List[str], List[str], List[List[float]], List[Dict[str, Any]]], None]
+
+
+def count_tokens(text: str) -> int:
+    if _encoding is not None:
+        return len(_encoding.encode(text))
+    return len(text) // 3 + 1   # polski tekst jest "gęstszy" niż angielski – liczymy ostrożnie
+
+
+class Batch(NamedTuple):
+    ids: List[str]
+    texts: List[str]
+    metadatas: List[Dict[str, Any]]
+    tokens: int
+
+
+def token_batches(items: Iterable[Item], max_tokens: int = EMBED_BATCH_MAX_TOKENS,
+                  max_inputs: int = EMBED_BATCH_MAX_INPUTS) -> Iterator[Batch]:
+    ids: List[str] = []
+    texts: List[str] = []
+    metas: List[Dict[str, Any]] = []
+    tokens = 0
+    for item_id, text, meta in items:
+        n = count_tokens(text)
+        if ids and (tokens + n > max_tokens or len(ids) >= max_inputs):
+            yield Batch(ids, texts, metas, tokens)
+            ids, texts, metas, tokens = [], [], [], 0
+        ids.append(item_id)
+        texts.append(text)
+        metas.append(meta)
+        tokens += n
+    if ids:
+        yield Batch(ids, texts, metas, tokens)
+
+
+# ---------------------------------------------------------
+# 🔹 Budżet RPM / TPM (kubełki tokenów współdzielone przez wątki)
+# ---------------------------------------------------------
+class RateBudget:
+    def __init__(self, rpm: int = EMBED_RPM, tpm: int = EMBED_TPM):
+        self.rpm = rpm
+        self.tpm = tpm
+        self._requests = float(rpm)
+        self._tokens = float(tpm)
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float) -> None:
+        elapsed = now - self._updated
+        self._updated = now
+        self._requests = min(self.rpm, self._requests + elapsed * self.rpm / 60)
+        self._tokens = min(self.tpm, self._tokens + elapsed * self.tpm / 60)
+
+    def acquire(self, tokens: int) -> None:
+        """Blokuje, aż budżet pozwoli wysłać jedno zapytanie z `tokens` tokenami."""
+        tokens = min(tokens, self.tpm)
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+                wait_for = self._paused_until - now
+                if wait_for <= 0:
+                    if self._requests >= 1 and self._tokens >= tokens:
+                        self._requests -= 1
+                        self._tokens -= tokens
+                        return
+                    wait_for = max(
+                        (1 - self._requests) * 60 / self.rpm,
+                        (tokens - self._tokens) * 60 / self.tpm,
+                    )
+            time.sleep(wait_for)
+
+    def pause(self, seconds: float) -> None:
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+
+class AdaptiveLimit:
+    """Semafor, którego limit spada o połowę po 429 i rośnie o 1 po sukcesie."""
+
+    def __init__(self, maximum: int = EMBED_CONCURRENCY):
+        self.maximum = maximum
+        self.limit = maximum
+        self._active = 0
+        self._cond = threading.Condition()
+
+    def __enter__(self) -> "AdaptiveLimit":
+        with self._cond:
+            while self._active >= self.limit:
+                self._cond.wait()
+            self._active += 1
+        return self
+
+    def __exit__(self, *exc) -> None:
+        with self._cond:
+            self._active -= 1
+            self._cond.notify_all()
+
+    def decrease(self) -> None:
+        with self._cond:
+            self.limit = max(1, self.limit // 2)
+
+    def increase(self) -> None:
+        with self._cond:
+            if self.limit < self.maximum:
+                self.limit += 1
+                self._cond.notify_all()
+
+
+def _retry_after(error: openai.RateLimitError) -> Optional[float]:
+    response = getattr(error, "response", None)
+    value = response.headers.get("retry-after") if response is not None else None
+    try:
+        return float(value) if value else None
+    except ValueError:
+        return None
+
+
+# ---------------------------------------------------------
+# 🔹 Pipeline
+# ---------------------------------------------------------
+class PipelineReport(NamedTuple):
+    batches: int
+    embedded: int        # wysłane do API
+    cached: int          # wzięte z cache embeddingów (bez API)
+    tokens: int
+    rate_limited: int    # odpowiedzi 429
+    seconds: float
+
+
+class EmbeddingPipeline:
+    def __init__(self, embedder, budget: Optional[RateBudget] = None,
+                 concurrency: int = EMBED_CONCURRENCY, max_retries: int = EMBED_MAX_RETRIES,
+                 max_tokens: int = EMBED_BATCH_MAX_TOKENS, max_inputs: int = EMBED_BATCH_MAX_INPUTS):
+        self.embedder = embedder
+        self.budget = budget or RateBudget()
+        self.concurrency = concurrency
+        self.max_tokens = max_tokens
+        self.max_inputs = max_inputs
+        self.max_retries = max_retries
+        self.rate_limited = 0
+
+    def _embed_batch(self, batch: Batch, limit: AdaptiveLimit) -> List[List[float]]:
+        attempt = 0
+        while True:
+            with limit:
+                self.budget.acquire(batch.tokens)
+                try:
+                    vectors = self.embedder.embed_documents(batch.texts)
+                except openai.RateLimitError as e:
+                    if attempt == self.max_retries:
+                        raise
+                    self.rate_limited += 1
+                    delay = _retry_after(e) or min(MAX_BACKOFF_SECONDS, 2 ** attempt)
+                    self.budget.pause(delay * (1 + random.random() / 4))
+                    limit.decrease()
+                    print(f"[RAG] 429 — pauza {delay:.1f}s, współbieżność {limit.limit}")
+                    attempt += 1
+                    continue
+            limit.increase()
+            return vectors
+
+    def run(self, items: List[Item], write: Writer) -> PipelineReport:
+        """
+        Embeduje `items` i oddaje każdy gotowy batch do `write` (w wątku
+        wołającego, więc zapis do Chroma jest sekwencyjny). Wyjątek z batcha
+        przerywa budowę; zapisane batche zostają.
+        """
+        started = time.perf_counter()
+        batches = embedded = cached = tokens = 0
+
+        # trafienia w cache embeddingów nie zużywają budżetu API
+        lookup = getattr(self.embedder, "lookup", None)
+        if lookup is not None and items:
+            vectors = lookup([text for _, text, _ in items])
+            hits = [(item, v) for item, v in zip(items, vectors) if v is not None]
+            items = [item for item, v in zip(items, vectors) if v is None]
+            for start in range(0, len(hits), self.max_inputs):
+                chunk = hits[start:start + self.max_inputs]
+                write([i[0] for i, _ in chunk], [i[1] for i, _ in chunk],
+                      [v for _, v in chunk], [i[2] for i, _ in chunk])
+            cached = len(hits)
+
+        limit = AdaptiveLimit(self.concurrency)
+        pending = {}
+        queue = token_batches(items, self.max_tokens, self.max_inputs)
+        with ThreadPoolExecutor(max_workers=self.concurrency,
+                                thread_name_prefix="rag-embed") as pool:
+            try:
+                while True:
+                    # najwyżej 2× współbieżność batchy w pamięci naraz
+                    while len(pending) < 2 * self.concurrency:
+                        batch = next(queue, None)
+                        if batch is None:
+                            break
+                        pending[pool.submit(self._embed_batch, batch, limit)] = batch
+                    if not pending:
+                        break
+
+                    done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        batch = pending.pop(future)
+                        write(batch.ids, batch.texts, future.result(), batch.metadatas)
+                        batches += 1
+                        embedded += len(batch.ids)
+                        tokens += batch.tokens
+            except BaseException:
+                for future in pending:
+                    future.cancel()
+                raise
+
+        return PipelineReport(
+            batches=batches,
+            embedded=embedded,
+            cached=cached,
+            tokens=tokens,
+            rate_limited=self.rate_limited,
+            seconds=round(time.perf_counter() - started, 3),
+        )
@@ -0,0 +1,197 @@
+"""
+Trwały cache embeddingów dla RAG.
+
+Owija dowolny embedder LangChain (`embed_documents` / `embed_query`).
+Klucz = hash (model, wymiar, znormalizowany tekst), więc przebudowa indeksu
+i powtarzające się pytania nie idą drugi raz do API. Wektory leżą w SQLite
+obok `vectorstore/` jako bloby float32 albo float16; rozmiar jest ograniczony
+(EMBED_CACHE_MAX_BYTES), a przy przekroczeniu wylatują najdawniej używane.
+"""
+import hashlib
+import sqlite3
+import threading
+import time
+import unicodedata
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+from app.config import EMBED_CACHE_DTYPE, EMBED_CACHE_MAX_BYTES, EMBED_CACHE_PATH
+
+DTYPES = {"float32": np.float32, "float16": np.float16}
+
+# po przekroczeniu limitu sprzątamy do 90%, żeby nie usuwać przy każdym zapisie
+EVICT_TO = 0.9
+
+
+def normalize_text(text: str) -> str:
+    return " ".join(unicodedata.normalize("NFC", text).split())
+
+
+class CachedEmbeddings(Embeddings):
+    def __init__(self, inner: Embeddings, path: Path = EMBED_CACHE_PATH,
+                 max_bytes: int = EMBED_CACHE_MAX_BYTES, dtype: str = EMBED_CACHE_DTYPE):
+        if dtype not in DTYPES:
+            raise ValueError(f"Nieobsługiwany typ wektora: {dtype} (float32 | float16)")
+        self.inner = inner
+        self.model = str(getattr(inner, "model", type(inner).__name__))
+        self.dimensions = int(getattr(inner, "dimensions", None) or 0)   # 0 = domyślny modelu
+        self.path = Path(path)
+        self.max_bytes = max_bytes
+        self.dtype = dtype
+
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+        self._bytes = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.evicted = 0
+
+    # ---------------- persystencja ----------------
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(str(self.path), check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings ("
+                " key TEXT PRIMARY KEY, model TEXT NOT NULL, dimensions INTEGER NOT NULL,"
+                " dtype TEXT NOT NULL, vector BLOB NOT NULL, last_used REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS ix_embeddings_last_used ON embeddings (last_used)")
+            conn.commit()
+            self._bytes = conn.execute(
+                "SELECT COALESCE(SUM(LENGTH(vector)), 0) FROM embeddings"
+            ).fetchone()[0]
+            self._conn = conn
+        return self._conn
+
+    def key(self, text: str) -> str:
+        raw = f"{self.model}\x1f{self.dimensions}\x1f{normalize_text(text)}"
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def _get_many(self, keys: Sequence[str], count_misses: bool = True) -> Dict[str, List[float]]:
+        """
+        Wektory znalezione w cache. Trafienia (i chybienia, jeśli `count_misses`)
+        liczone pod tym samym lockiem – embed_* wołają to z wielu wątków.
+        """
+        found: Dict[str, List[float]] = {}
+        unique = list(dict.fromkeys(keys))
+        with self._lock:
+            conn = self._connect()
+            for start in range(0, len(unique), 500):
+                chunk = unique[start:start + 500]
+                rows = conn.execute(
+                    f"SELECT key, dtype, vector FROM embeddings"
+                    f" WHERE key IN ({','.join('?' * len(chunk))})",
+                    chunk,
+                ).fetchall()
+                for key, dtype, blob in rows:
+                    found[key] = np.frombuffer(blob, dtype=DTYPES[dtype]).astype(np.float32).tolist()
+            if found:
+                now = time.time()
+                conn.executemany(
+                    "UPDATE embeddings SET last_used = ? WHERE key = ?", [(now, k) for k in found]
+                )
+                conn.commit()
+            hits = sum(1 for k in keys if k in found)
+            self.hits += hits
+            if count_misses:
+                self.misses += len(keys) - hits
+        return found
+
+    def _put_many(self, vectors: Dict[str, List[float]]) -> None:
+        now = time.time()
+        rows = [
+            (key, self.model, self.dimensions, self.dtype,
+             np.asarray(vector, dtype=DTYPES[self.dtype]).tobytes(), now)
+            for key, vector in vectors.items()
+        ]
+        with self._lock:
+            conn = self._connect()
+            # INSERT OR REPLACE nadpisuje istniejące klucze – ich stare bloby odejmujemy
+            replaced = 0
+            keys = [row[0] for row in rows]
+            for start in range(0, len(keys), 500):
+                chunk = keys[start:start + 500]
+                replaced += conn.execute(
+                    f"SELECT COALESCE(SUM(LENGTH(vector)), 0) FROM embeddings"
+                    f" WHERE key IN ({','.join('?' * len(chunk))})",
+                    chunk,
+                ).fetchone()[0]
+            conn.executemany(
+                "INSERT OR REPLACE INTO embeddings VALUES (?, ?, ?, ?, ?, ?)", rows
+            )
+            self._bytes += sum(len(row[4]) for row in rows) - replaced
+            if self._bytes > self.max_bytes:
+                self._evict(conn)
+            conn.commit()
+
+    def _evict(self, conn: sqlite3.Connection) -> None:
+        """Usuwa najdawniej używane wektory, aż cache zejdzie do EVICT_TO limitu."""
+        to_free = self._bytes - int(self.max_bytes * EVICT_TO)
+        victims: List[str] = []
+        freed = 0
+        for key, size in conn.execute(
+            "SELECT key, LENGTH(vector) FROM embeddings ORDER BY last_used ASC"
+        ):
+            if freed >= to_free:
+                break
+            victims.append(key)
+            freed += size
+        conn.executemany("DELETE FROM embeddings WHERE key = ?", [(k,) for k in victims])
+        self._bytes -= freed
+        self.evicted += len(victims)
+
+    def lookup(self, texts: List[str]) -> List[Optional[List[float]]]:
+        """
+        Wektory z cache (None = brak) bez wołania API. Liczy tylko trafienia –
+        chybienia policzy `embed_documents`, gdy wołający je doembeduje.
+        """
+        keys = [self.key(t) for t in texts]
+        found = self._get_many(keys, count_misses=False)
+        return [found.get(k) for k in keys]
+
+    # ---------------- interfejs Embeddings ----------------
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        keys = [self.key(t) for t in texts]
+        found = self._get_many(keys)
+
+        missing = {k: t for k, t in zip(keys, texts) if k not in found}
+        if missing:
+            fresh = dict(zip(missing, self.inner.embed_documents(list(missing.values()))))
+            self._put_many(fresh)
+            found.update(fresh)
+
+        return [found[k] for k in keys]
+
+    def embed_query(self, text: str) -> List[float]:
+        key = self.key(text)
+        found = self._get_many([key])
+        if key in found:
+            return found[key]
+
+        vector = self.inner.embed_query(text)
+        self._put_many({key: vector})
+        return vector
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            conn = self._connect()
+            entries = conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+            hits, misses, evicted = self.hits, self.misses, self.evicted
+        lookups = hits + misses
+        return {
+            "model": self.model,
+            "dtype": self.dtype,
+            "entries": entries,
+            "bytes": self._bytes,
+            "max_bytes": self.max_bytes,
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+            "evicted": evicted,
+        }
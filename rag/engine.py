@@ -1,14 +1,23 @@
-import os
-from dotenv import load_dotenv
-load_dotenv()  # ← KLUCZOWE! Ładuje OPENAI_API_KEY zanim powstaną embeddingi
-
+"""
+Silnik RAG: kolekcja Chroma z materiałami + embedder.
+
+Klient Chroma, kolekcja i embedder powstają leniwie przy pierwszym użyciu
+(`get_engine()`), więc import modułu nic nie kosztuje. `warm_up()` robi to
+zawczasu – w tle przy starcie aplikacji – i dodatkowo dotyka indeksu jednym
+wyszukiwaniem, żeby pierwsze prawdziwe pytanie nie płaciło za zimne strony
+HNSW. `/ready` (app/main.py) odpowiada 200 dopiero po rozgrzewce.
+"""
+import hashlib
 import json
+import threading
+import time
 from pathlib import Path
-from typing import List, Literal, Dict, Any
+from typing import List, Literal, Dict, Any, NamedTuple, Optional, Set, Tuple
 
-import chromadb
-from langchain_openai import OpenAIEmbeddings
-from langchain_text_splitters import RecursiveCharacterTextSplitter
+from app.config import RAG_NUMPY_DTYPE, RAG_NUMPY_INDEX_DIR, RAG_VECTOR_BACKEND
+from app.singleflight import SyncSingleFlight
+from rag.embed_pipeline import EmbeddingPipeline
+from rag.vector_index import NumpyIndex
 
 # ---------------------------------------------------------
 # 🔹 ŚCIEŻKI
@@ -16,29 +25,116 @@ from langchain_text_splitters import RecursiveCharacterTextSplitter
 BASE_DIR = Path(__file__).resolve().parents[1]
 PARSED_DIR = BASE_DIR / "rag" / "parsed"
 VECTOR_DB_DIR = BASE_DIR / "vectorstore"
-VECTOR_DB_DIR.mkdir(exist_ok=True)
+
+COLLECTION_NAME = "korepetytor_materials"
+EMBEDDING_MODEL = "text-embedding-3-large"
+
 
 # ---------------------------------------------------------
-# 🔹 CHROMADB (persistent)
+# 🔹 CHROMADB (persistent) + EMBEDDER – tworzone JEDEN RAZ, leniwie
 # ---------------------------------------------------------
-chroma_client = chromadb.PersistentClient(path=str(VECTOR_DB_DIR))
+class Engine(NamedTuple):
+    client: Any
+    collection: Any                 # źródło prawdy (przyrostowy rebuild)
+    embedder: Any
+    vectors: Optional[NumpyIndex]   # RAG_VECTOR_BACKEND=numpy: kopia do zapytań
+
+
+_engine: Optional[Engine] = None
+_engine_lock = threading.Lock()
+
+
+def _create_engine() -> Engine:
+    from dotenv import load_dotenv
+    load_dotenv()  # ← KLUCZOWE! Ładuje OPENAI_API_KEY zanim powstaną embeddingi
+
+    import chromadb
+    from langchain_openai import OpenAIEmbeddings
+    from rag.embedding_cache import CachedEmbeddings
+
+    VECTOR_DB_DIR.mkdir(exist_ok=True)
+    client = chromadb.PersistentClient(path=str(VECTOR_DB_DIR))
+    collection = client.get_or_create_collection(
+        name=COLLECTION_NAME,
+        metadata={"purpose": "rag-materials"},
+        embedding_function=None  # używamy embeddingów LangChain, nie Chroma
+    )
+    # trwały cache wektorów wokół embeddera OpenAI
+    embedder = CachedEmbeddings(OpenAIEmbeddings(model=EMBEDDING_MODEL))
+
+    vectors = None
+    if RAG_VECTOR_BACKEND == "numpy":
+        vectors = NumpyIndex(RAG_NUMPY_INDEX_DIR, dtype=RAG_NUMPY_DTYPE)
+    elif RAG_VECTOR_BACKEND != "chroma":
+        raise ValueError(f"Nieznany RAG_VECTOR_BACKEND: {RAG_VECTOR_BACKEND} (chroma | numpy)")
+    return Engine(client, collection, embedder, vectors)
+
+
+def get_engine() -> Engine:
+    global _engine
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                _engine = _create_engine()
+    return _engine
+
+
+# Identyczne pytania zadane równocześnie → jeden embedding
+_embed_flight = SyncSingleFlight("rag_embed_query")
 
-collection = chroma_client.get_or_create_collection(
-    name="korepetytor_materials",
-    metadata={"purpose": "rag-materials"},
-    embedding_function=None  # używamy embeddingów LangChain, nie Chroma
-)
 
 # ---------------------------------------------------------
-# 🔹 EMBEDDER (tworzony JEDEN RAZ!)
+# 🔹 Rozgrzewka i gotowość
 # ---------------------------------------------------------
-_embedder = OpenAIEmbeddings(model="text-embedding-3-large")
+_ready = threading.Event()
+_warmup: Dict[str, Any] = {
+    "ready": False, "backend": RAG_VECTOR_BACKEND, "seconds": None, "chunks": None, "error": None,
+}
+
+
+def warm_up() -> Dict[str, Any]:
+    """
+    Otwiera kolekcję, czyta jeden zapisany wektor i robi nim wyszukiwanie
+    (bez wołania API embeddingów). Przy backendzie numpy najpierw eksportuje
+    indeks z Chromy, jeśli go jeszcze nie ma. Bezpieczne do ponownego wywołania.
+    """
+    started = time.perf_counter()
+    try:
+        engine = get_engine()
+        if engine.vectors is not None and not engine.vectors.exists():
+            export_numpy_index()
+        chunks = engine.collection.count()
+        if chunks:
+            sample = list(engine.collection.get(limit=1, include=["embeddings"])["embeddings"][0])
+            if engine.vectors is not None:
+                engine.vectors.query(sample, n_results=1)
+            else:
+                engine.collection.query(query_embeddings=[sample], n_results=1)
+    except Exception as e:
+        _warmup["error"] = repr(e)
+        raise
+
+    _warmup.update(ready=True, seconds=round(time.perf_counter() - started, 3),
+                   chunks=chunks, error=None)
+    _ready.set()
+    print(f"[RAG] Rozgrzany — {_warmup}")
+    return _warmup
+
+
+def is_ready() -> bool:
+    return _ready.is_set()
+
+
+def warmup_status() -> Dict[str, Any]:
+    return dict(_warmup)
 
 
 # ---------------------------------------------------------
 # 🔹 Chunkowanie tekstu (uniwersalne, do JSON/tekstów)
 # ---------------------------------------------------------
 def chunk_text(text: str) -> List[str]:
+    from langchain_text_splitters import RecursiveCharacterTextSplitter
+
     splitter = RecursiveCharacterTextSplitter(
         chunk_size=1100,
         chunk_overlap=180,
@@ -48,108 +144,206 @@ def chunk_text(text: str) -> List[str]:
 
 
 # ---------------------------------------------------------
-# 🔹 Rebuild RAG z jednego JSON
+# 🔹 Indeksowanie przyrostowe
 # ---------------------------------------------------------
-def rebuild_rag_from_json(json_filename: str) -> int:
+# id chunka = hash treści + metadanych → ten sam chunk ma zawsze to samo id,
+# więc przebudowa embeduje tylko nowe/zmienione chunki (rag/embed_pipeline.py)
+# i usuwa tylko te, których źródła już nie ma.
+CHROMA_WRITE_BATCH = 1000
+
+# rodzaj materiału po nazwie pliku (arkusz CKE = zadania, zasady = kryteria)
+MATERIAL_KINDS = (("zasady", "criteria"), ("arkusz", "tasks"))
+KINDS = ("knowledge", "tasks", "criteria")
+
+
+def material_kind(filename: str) -> str:
+    name = filename.lower()
+    for marker, kind in MATERIAL_KINDS:
+        if marker in name:
+            return kind
+    return "knowledge"
+
+
+def chunk_id(source: str, element_id: str, element_type: str, chunk: str) -> str:
+    digest = hashlib.sha256(
+        "\x1f".join((source, element_id, element_type, chunk)).encode("utf-8")
+    ).hexdigest()
+    return f"{source}:{digest[:32]}"
+
+
+def load_chunks(json_filename: str) -> Dict[str, Tuple[str, Dict[str, Any]]]:
     """
-    Czyści kolekcję i buduje embeddingi z jednego JSON-a w rag/parsed/.
-    JSON musi mieć format:
-        {"id": "...", "type": "...", "content": "..."}
+    Chunki jednego JSON-a z rag/parsed/: {chunk_id: (tekst, metadane)}.
+    Element JSON: {"id": "...", "type": "...", "text" | "content": "..."}.
     """
     json_path = PARSED_DIR / json_filename
-
     if not json_path.exists():
         raise FileNotFoundError(f"Brak pliku JSON: {json_path}")
 
-    # Wczytaj JSON
-    print(f"[RAG] Ładuję JSON: {json_path}")
     with open(json_path, "r", encoding="utf-8") as f:
         elements = json.load(f)
 
-    # Czyścimy poprzednie rekordy
-    try:
-        collection.delete(where={"source": {"$exists": True}})
-    except Exception as e:
-        print("[WARN] Czyszczenie kolekcji:", e)
+    kind = material_kind(json_filename)
+    chunks: Dict[str, Tuple[str, Dict[str, Any]]] = {}
 
-    all_chunks = []
-    metadatas = []
-
-    # Przerabiamy każdy element JSON na chunk-i
     for el in elements:
-        content = el.get("content", "")
+        if el.get("chunk_for_rag") is False:
+            continue
+        content = el.get("text") or el.get("content") or ""
         if not content.strip():
             continue
 
-        chunks = chunk_text(content)
-
-        for c in chunks:
-            all_chunks.append(c)
-            metadatas.append({
+        element_id = str(el.get("id") or "")
+        element_type = str(el.get("type") or "")
+        for c in chunk_text(content):
+            chunks[chunk_id(json_filename, element_id, element_type, c)] = (c, {
                 "source": json_filename,
-                "id": el.get("id"),
-                "type": el.get("type")
+                "id": element_id,
+                "type": element_type,
+                "kind": kind,
             })
 
-    if not all_chunks:
-        print("[RAG] Brak chunków do zapisania.")
-        return 0
+    return chunks
+
+
+def _indexed_ids(where: Optional[Dict[str, Any]] = None) -> Set[str]:
+    ids: Set[str] = set()
+    offset = 0
+    while True:
+        page = get_engine().collection.get(where=where, limit=CHROMA_WRITE_BATCH, offset=offset, include=[])
+        ids.update(page["ids"])
+        if len(page["ids"]) < CHROMA_WRITE_BATCH:
+            return ids
+        offset += CHROMA_WRITE_BATCH
+
 
-    # Generujemy embeddingi
-    vectors = _embedder.embed_documents(all_chunks)
+def _sync_index(desired: Dict[str, Tuple[str, Dict[str, Any]]], indexed: Set[str]) -> Dict[str, int]:
+    engine = get_engine()
+    to_add = [cid for cid in desired if cid not in indexed]
+    to_remove = [cid for cid in indexed if cid not in desired]
 
-    # Zapisujemy do Chroma
-    ids = [f"{json_filename}-{i}" for i in range(len(all_chunks))]
+    for start in range(0, len(to_remove), CHROMA_WRITE_BATCH):
+        engine.collection.delete(ids=to_remove[start:start + CHROMA_WRITE_BATCH])
 
-    collection.add(
-        ids=ids,
-        documents=all_chunks,
-        embeddings=vectors,
-        metadatas=metadatas
+    # batche lecą do Chroma, gdy tylko mają embeddingi; po przerwaniu
+    # kolejny rebuild zobaczy je w `indexed` i doembeduje tylko resztę
+    report = EmbeddingPipeline(engine.embedder).run(
+        [(cid, *desired[cid]) for cid in to_add],
+        write=lambda ids, documents, embeddings, metadatas: engine.collection.add(
+            ids=ids, documents=documents, embeddings=embeddings, metadatas=metadatas,
+        ),
     )
+    if to_add:
+        print(f"[RAG] Embedding — {report._asdict()}")
+
+    stats = {kind: 0 for kind in KINDS}
+    for _, meta in desired.values():
+        stats[meta["kind"]] += 1
+    stats.update(
+        added=len(to_add),
+        removed=len(to_remove),
+        unchanged=len(desired) - len(to_add),
+    )
+    return stats
 
-    print(f"[RAG] OK — zapisano {len(all_chunks)} chunków z JSON.")
-    return len(all_chunks)
+
+# ---------------------------------------------------------
+# 🔹 Rebuild RAG z jednego JSON
+# ---------------------------------------------------------
+def rebuild_rag_from_json(json_filename: str) -> Dict[str, int]:
+    """
+    Synchronizuje z kolekcją chunki jednego JSON-a w rag/parsed/
+    (pozostałe pliki zostają nietknięte).
+    """
+    print(f"[RAG] Ładuję JSON: {PARSED_DIR / json_filename}")
+    desired = load_chunks(json_filename)
+    stats = _sync_index(desired, _indexed_ids(where={"source": json_filename}))
+    export_numpy_index()
+    print(f"[RAG] OK — {json_filename}: {stats}")
+    return stats
 
 
 # ---------------------------------------------------------
 # 🔹 Rebuild RAG ze WSZYSTKICH JSON-ów (multi-PDF mode)
 # ---------------------------------------------------------
-def rebuild_rag_all() -> int:
+def rebuild_rag_all() -> Dict[str, int]:
     """
     Buduje RAG z wszystkich JSON-ów znajdujących się w rag/parsed/.
+    Chunki plików, których już nie ma, są usuwane z kolekcji.
     """
-    files = list(PARSED_DIR.glob("*.json"))
+    files = sorted(PARSED_DIR.glob("*.json"))
     if not files:
         raise RuntimeError("Brak JSON-ów w rag/parsed/!")
 
-    try:
-        collection.delete(where={"source": {"$exists": True}})
-    except Exception:
-        pass
-
-    total_chunks = 0
-
+    desired: Dict[str, Tuple[str, Dict[str, Any]]] = {}
     for file in files:
         print(f"[RAG] → {file.name}")
-        total_chunks += rebuild_rag_from_json(file.name)
+        desired.update(load_chunks(file.name))
+
+    stats = _sync_index(desired, _indexed_ids())
+    export_numpy_index()
+    print(f"[RAG] Całość gotowa — {stats}")
+    print(f"[RAG] Cache embeddingów — {get_engine().embedder.stats()}")
+    return stats
+
 
-    print(f"[RAG] Całość gotowa — {total_chunks} chunków.")
-    return total_chunks
+def embedding_cache_stats() -> Dict[str, Any]:
+    return get_engine().embedder.stats()
+
+
+# ---------------------------------------------------------
+# 🔹 Backend numpy: eksport kolekcji do pliku mmap
+# ---------------------------------------------------------
+def export_numpy_index() -> Optional[str]:
+    """
+    Kopiuje całą kolekcję Chroma do nowej wersji indeksu NumPy (atomowa
+    podmiana). Nic nie robi przy backendzie chroma.
+    """
+    engine = get_engine()
+    if engine.vectors is None:
+        return None
+
+    ids: List[str] = []
+    documents: List[str] = []
+    metadatas: List[Dict[str, Any]] = []
+    embeddings: List[Any] = []
+    offset = 0
+    while True:
+        page = engine.collection.get(
+            limit=CHROMA_WRITE_BATCH, offset=offset,
+            include=["documents", "metadatas", "embeddings"],
+        )
+        ids.extend(page["ids"])
+        documents.extend(page["documents"])
+        metadatas.extend(page["metadatas"])
+        embeddings.extend(page["embeddings"])
+        if len(page["ids"]) < CHROMA_WRITE_BATCH:
+            break
+        offset += CHROMA_WRITE_BATCH
+
+    version = engine.vectors.build(ids, documents, metadatas, embeddings)
+    print(f"[RAG] Indeks numpy {version}: {len(ids)} chunków")
+    return version
 
 
 # ---------------------------------------------------------
 # 🔹 Zapytanie RAG
 # ---------------------------------------------------------
-def query_rag(question: str) -> List[str]:
+def query_rag(question: str, where: Optional[Dict[str, Any]] = None) -> List[str]:
     """
     Zwraca listę tekstowych chunków najbardziej dopasowanych do pytania.
+    `where` zawęża po metadanych, np. {"kind": "tasks"}.
     """
-    q = _embedder.embed_query(question)
+    engine = get_engine()
+    q = _embed_flight.do(question, lambda: engine.embedder.embed_query(question))
+
+    if engine.vectors is not None:
+        return [hit.document for hit in engine.vectors.query(q, n_results=5, where=where)]
 
-    results = collection.query(
+    results = engine.collection.query(
         query_embeddings=[q],
-        n_results=5
+        n_results=5,
+        where=where,
     )
 
     if not results or not results.get("documents"):
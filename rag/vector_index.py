@@ -0,0 +1,219 @@
+"""
+Wektorowy backend RAG w procesie: NumPy + pliki mapowane w pamięć.
+
+Korpus to kilka tysięcy chunków, więc dokładne top-k (jeden iloczyn
+macierz × wektor + `argpartition`) jest szybsze i lżejsze niż HNSW Chromy.
+
+Układ na dysku (RAG_NUMPY_INDEX_DIR):
+
+    CURRENT                 ← nazwa aktywnej wersji (podmieniana os.replace)
+    v<timestamp>/vectors.npy   znormalizowane wektory float32|float16 (N × D)
+    v<timestamp>/meta.json     ids, dokumenty i metadane w tej samej kolejności
+
+Przebudowa zapisuje nową wersję obok i dopiero potem atomowo przestawia
+CURRENT, więc czytelnik zawsze widzi kompletny indeks; otwarty mmap starej
+wersji działa do końca zapytania nawet po usunięciu jej plików.
+"""
+import json
+import os
+import shutil
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+import numpy as np
+
+DTYPES = {"float32": np.float32, "float16": np.float16}
+CURRENT = "CURRENT"
+KEEP_VERSIONS = 2        # poprzednia zostaje dla czytelników, którzy właśnie ją otwierają
+SCORE_BLOCK_ROWS = 4096  # float16 liczymy blokami w float32 (NumPy nie ma BLAS dla f16)
+# co ile sekund zapytanie sprawdza (stat), czy inny proces nie podmienił CURRENT
+POINTER_CHECK_SECONDS = 1.0
+
+
+class Hit(NamedTuple):
+    id: str
+    document: str
+    metadata: Dict[str, Any]
+    score: float   # cosinus
+
+
+class _Version(NamedTuple):
+    name: str
+    vectors: np.ndarray                 # mmap (N × D)
+    ids: List[str]
+    documents: List[str]
+    metadatas: List[Dict[str, Any]]
+    columns: Dict[str, np.ndarray]      # pole metadanych → wartości (do masek filtra)
+
+
+def _normalize(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+def _scores(vectors: np.ndarray, q: np.ndarray) -> np.ndarray:
+    if not len(vectors):
+        return np.empty(0, dtype=np.float32)
+    if vectors.dtype == np.float32:
+        return vectors @ q
+    return np.concatenate([
+        vectors[start:start + SCORE_BLOCK_ROWS].astype(np.float32) @ q
+        for start in range(0, len(vectors), SCORE_BLOCK_ROWS)
+    ])
+
+
+class NumpyIndex:
+    def __init__(self, directory: Path, dtype: str = "float32"):
+        if dtype not in DTYPES:
+            raise ValueError(f"Nieobsługiwany typ wektora: {dtype} (float32 | float16)")
+        self.directory = Path(directory)
+        self.dtype = dtype
+        self._version: Optional[_Version] = None
+        # (nazwa wersji, (st_ino, st_mtime_ns) pliku CURRENT, kiedy sprawdzono)
+        self._pointer: Optional[Tuple[str, Tuple[int, int], float]] = None
+        self._lock = threading.Lock()
+
+    # ---------------- zapis ----------------
+    def build(self, ids: Sequence[str], documents: Sequence[str],
+              metadatas: Sequence[Dict[str, Any]], embeddings: Sequence[Sequence[float]]) -> str:
+        """Zapisuje nową wersję indeksu i atomowo ją aktywuje. Zwraca nazwę wersji."""
+        self.directory.mkdir(parents=True, exist_ok=True)
+        name = f"v{time.time_ns()}"
+        tmp = self.directory / f".{name}.tmp"
+        tmp.mkdir()
+
+        matrix = np.asarray(embeddings, dtype=np.float32)
+        if not len(ids):
+            matrix = np.zeros((0, 0), dtype=np.float32)
+        np.save(tmp / "vectors.npy", _normalize(matrix).astype(DTYPES[self.dtype]))
+        with open(tmp / "meta.json", "w", encoding="utf-8") as f:
+            json.dump({"ids": list(ids), "documents": list(documents),
+                       "metadatas": [dict(m or {}) for m in metadatas]}, f, ensure_ascii=False)
+        os.replace(tmp, self.directory / name)
+
+        pointer = self.directory / f".{CURRENT}.tmp"
+        pointer.write_text(name)
+        os.replace(pointer, self.directory / CURRENT)
+        # ten proces przełącza się od razu, inne – przy najbliższym sprawdzeniu CURRENT
+        self._pointer = (name, self._stamp(), time.monotonic())
+
+        self._cleanup()
+        return name
+
+    def _cleanup(self) -> None:
+        versions = sorted(
+            p for p in self.directory.iterdir() if p.is_dir() and p.name.startswith("v")
+        )
+        for path in versions[:-KEEP_VERSIONS]:
+            shutil.rmtree(path, ignore_errors=True)
+
+    # ---------------- odczyt ----------------
+    def exists(self) -> bool:
+        return (self.directory / CURRENT).exists()
+
+    def _stamp(self) -> Tuple[int, int]:
+        st = (self.directory / CURRENT).stat()
+        return st.st_ino, st.st_mtime_ns
+
+    def _current_name(self) -> str:
+        """
+        Nazwa aktywnej wersji bez czytania CURRENT przy każdym zapytaniu:
+        najwyżej co POINTER_CHECK_SECONDS jeden stat, a plik jest czytany
+        tylko wtedy, gdy os.replace go podmienił (nowy inode / mtime).
+        """
+        pointer = self._pointer
+        now = time.monotonic()
+        if pointer is not None and now - pointer[2] < POINTER_CHECK_SECONDS:
+            return pointer[0]
+
+        stamp = self._stamp()
+        if pointer is not None and pointer[1] == stamp:
+            name = pointer[0]
+        else:
+            name = (self.directory / CURRENT).read_text().strip()
+        self._pointer = (name, stamp, now)
+        return name
+
+    def _current(self) -> _Version:
+        """Aktywna wersja; po podmianie CURRENT przez rebuild otwiera nową."""
+        name = self._current_name()
+        version = self._version
+        if version is not None and version.name == name:
+            return version
+
+        with self._lock:
+            if self._version is None or self._version.name != name:
+                path = self.directory / name
+                with open(path / "meta.json", encoding="utf-8") as f:
+                    meta = json.load(f)
+                fields = {key for m in meta["metadatas"] for key in m}
+                self._version = _Version(
+                    name=name,
+                    vectors=np.load(path / "vectors.npy", mmap_mode="r"),
+                    ids=meta["ids"],
+                    documents=meta["documents"],
+                    metadatas=meta["metadatas"],
+                    columns={
+                        key: np.array([m.get(key) for m in meta["metadatas"]], dtype=object)
+                        for key in fields
+                    },
+                )
+            return self._version
+
+    def count(self) -> int:
+        return len(self._current().ids)
+
+    def query(self, embedding: Sequence[float], n_results: int = 5,
+              where: Optional[Dict[str, Any]] = None) -> List[Hit]:
+        """
+        Dokładne top-k po cosinusie. `where` = równości na metadanych
+        ({"kind": "tasks"}) – liczone jako maska przed rankingiem.
+        """
+        version = self._current()
+        if not version.ids:
+            return []
+
+        q = np.asarray(embedding, dtype=np.float32)
+        q = q / (np.linalg.norm(q) or 1.0)
+
+        candidates: Optional[np.ndarray] = None
+        if where:
+            mask = np.ones(len(version.ids), dtype=bool)
+            for key, value in where.items():
+                column = version.columns.get(key)
+                if column is None:
+                    return []
+                mask &= column == value
+            candidates = np.flatnonzero(mask)
+            if not candidates.size:
+                return []
+            scores = _scores(version.vectors[candidates], q)
+        else:
+            scores = _scores(version.vectors, q)
+
+        k = min(n_results, len(scores))
+        if k == 0:
+            return []
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        rows = candidates[top] if candidates is not None else top
+
+        return [
+            Hit(version.ids[i], version.documents[i], version.metadatas[i], float(scores[t]))
+            for i, t in zip(rows.tolist(), top.tolist())
+        ]
+
+    def stats(self) -> Dict[str, Any]:
+        if not self.exists():
+            return {"version": None}
+        version = self._current()
+        return {
+            "version": version.name,
+            "chunks": len(version.ids),
+            "dimensions": int(version.vectors.shape[1]) if version.vectors.ndim == 2 else 0,
+            "dtype": str(version.vectors.dtype),
+            "bytes": int(version.vectors.nbytes),
+        }